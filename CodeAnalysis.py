@@ -0,0 +1,357 @@
+import os
+import ast
+import sys
+import difflib
+import hashlib
+import builtins
+
+# Calls that take `observed=` and default to the cartesian product of categories in pandas < 3
+OBSERVED_CALLS = {"groupby", "pivot_table"}
+
+
+def referenced_names(code: str) -> set:
+    """Names the code reads (e.g. `chp`, `inv_df`); empty when the code does not parse."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return set()
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+
+
+class ObservedGroupbyCalls(ast.NodeVisitor):
+    """Collect the `.groupby(...)` / `pivot_table(...)` calls that do not set `observed=`."""
+
+    def __init__(self):
+        self.calls = []
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = node.func
+        # Only method calls (`df.groupby(...)`, `pd.pivot_table(...)`): bare `groupby(...)` and
+        # `itertools.groupby(...)` are not pandas and reject the keyword
+        if not isinstance(func, ast.Attribute) or (isinstance(func.value, ast.Name) and func.value.id == "itertools"):
+            return
+        if func.attr in OBSERVED_CALLS and not any(kw.arg in ("observed", None) for kw in node.keywords):
+            self.calls.append(node)
+
+
+def add_observed_to_groupby(code: str) -> str:
+    """
+    Make groupbys in generated code behave the same on categorical and string columns.
+
+    Fact-table string columns are loaded as categoricals; without `observed=True` a groupby on them
+    emits a row for every category, including those removed by an earlier filter.
+    The keyword is inserted in place before each call's closing parenthesis, so every line keeps its number
+    and the tracebacks of the rewritten code match the code the generator wrote (see retry_with_error).
+    Code that does not parse is returned unchanged so `exec` reports the original error.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code
+
+    finder = ObservedGroupbyCalls()
+    finder.visit(tree)
+    if not finder.calls:
+        return code
+
+    # AST column offsets count UTF-8 bytes; edit the lines as bytes, rightmost call first so offsets stay valid
+    lines = [line.encode("utf-8") for line in code.splitlines(keepends=True)]
+    for node in sorted(finder.calls, key=lambda n: (n.end_lineno, n.end_col_offset), reverse=True):
+        row, col = node.end_lineno - 1, node.end_col_offset - 1  # the closing parenthesis
+        before = b"".join(lines[:row]) + lines[row][:col]
+        separator = b"" if not (node.args or node.keywords) or before.rstrip().endswith(b",") else b", "
+        lines[row] = lines[row][:col] + separator + b"observed=True" + lines[row][col:]
+    patched = b"".join(lines).decode("utf-8")
+    try:
+        ast.parse(patched)
+    except SyntaxError:
+        return code  # e.g. a comment before the closing parenthesis; run the code as written
+    return patched
+
+
+# Nodes whose body runs in its own function scope. Under `exec(code, {}, scope)` such a body cannot
+# see the script's variables: they live in the locals mapping, while the function only looks in globals.
+# List / set / dict comprehensions are inlined from Python 3.12 on (PEP 709); generator expressions are not.
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.GeneratorExp)
+if sys.version_info < (3, 12):
+    FUNCTION_NODES += (ast.ListComp, ast.SetComp, ast.DictComp)
+FUNCTION_LABELS = {
+    ast.Lambda: "lambda", ast.GeneratorExp: "generator expression",
+    ast.ListComp: "list comprehension", ast.SetComp: "set comprehension", ast.DictComp: "dict comprehension",
+}
+MERGE_CALLS = {"merge"}
+# Validate generated code before running it (CODE_VALIDATION=false skips straight to exec)
+CODE_VALIDATION = os.getenv("CODE_VALIDATION", "true").lower() != "false"
+
+
+class CodeIssue:
+    """One problem found in generated code before it runs."""
+
+    def __init__(self, kind: str, message: str, line: int = None, name: str = None, options=None):
+        self.kind = kind  # syntax / undefined_name / unknown_column / merge_key / closure
+        self.message = message
+        self.line = line
+        self.name = name
+        self.options = list(options or [])
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "message": self.message, "line": self.line, "name": self.name, "options": self.options}
+
+    def __str__(self):
+        text = f"line {self.line}: {self.message}" if self.line else self.message
+        if self.options:
+            text += f" Valid options: {', '.join(map(str, self.options))}"
+        return text
+
+
+class CodeValidationError(ValueError):
+    """Raised instead of executing code that failed validation; `issues` holds the CodeIssue list."""
+
+    def __init__(self, issues):
+        self.issues = list(issues)
+        super().__init__("The code was not executed because static validation found:\n" + "\n".join(f"- {issue}" for issue in self.issues))
+
+
+def node_bindings(node) -> set:
+    """Names a single node binds (assignment target, import, def, parameter, `except ... as`)."""
+    if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+        return {node.id}
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return {node.name}
+    if isinstance(node, ast.arg):
+        return {node.arg}
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return {(alias.asname or alias.name).split(".")[0] for alias in node.names}
+    if isinstance(node, ast.ExceptHandler) and node.name:
+        return {node.name}
+    if isinstance(node, (ast.Global, ast.Nonlocal)):
+        return set(node.names)
+    return set()
+
+
+def bound_names(nodes) -> set:
+    """Names bound anywhere in `nodes`, including inside nested functions."""
+    return {name for root in nodes for node in ast.walk(root) for name in node_bindings(node)}
+
+
+def script_bound_names(tree) -> set:
+    """Names bound at script level, i.e. outside any function / lambda / generator expression body."""
+    names = set()
+
+    def visit(node):
+        names.update(node_bindings(node))
+        if isinstance(node, FUNCTION_NODES):
+            if isinstance(node, ast.GeneratorExp) or isinstance(node, (ast.ListComp, ast.SetComp, ast.DictComp)):
+                visit(node.generators[0].iter)
+            return
+        for child in ast.iter_child_nodes(node):
+            visit(child)
+
+    visit(tree)
+    return names
+
+
+def function_body(node) -> list:
+    """The parts of a FUNCTION_NODES node that run inside its own scope."""
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+        # Parameters, but not their defaults: those are evaluated in the enclosing scope
+        args = node.args
+        params = args.posonlyargs + args.args + args.kwonlyargs + [a for a in (args.vararg, args.kwarg) if a]
+        return params + (node.body if isinstance(node.body, list) else [node.body])
+    # Comprehensions: the first iterable is evaluated in the enclosing scope
+    first, *rest = node.generators
+    elements = [node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt]
+    return elements + [first.target] + first.ifs + rest
+
+
+def string_list(node):
+    """['A', 'B'] for a string constant or a list / tuple of string constants, else None."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, (ast.List, ast.Tuple)) and node.elts and all(isinstance(e, ast.Constant) and isinstance(e.value, str) for e in node.elts):
+        return [e.value for e in node.elts]
+    return None
+
+
+class SchemaChecker:
+    """Checks column subscripts and merge keys on table variables the code does not reassign."""
+
+    def __init__(self, tree, columns):
+        self.columns = columns
+        self.reassigned = set()
+        self.added = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                self.reassigned.add(node.id)
+            elif isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Store) and isinstance(node.value, ast.Name):
+                self.reassigned.add(node.value.id)  # e.g. df.columns = [...]
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name) \
+                    and any(kw.arg == "inplace" for kw in node.keywords):
+                self.reassigned.add(node.func.value.id)  # e.g. df.rename(..., inplace=True)
+            elif isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Store) and isinstance(node.value, ast.Name):
+                self.add_columns(node.value.id, node.slice)  # df['NEW'] = ...
+            elif isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Store) and isinstance(node.value, ast.Attribute) \
+                    and node.value.attr in ("loc", "at") and isinstance(node.value.value, ast.Name) \
+                    and isinstance(node.slice, ast.Tuple) and len(node.slice.elts) == 2:
+                self.add_columns(node.value.value.id, node.slice.elts[1])  # df.loc[:, 'NEW'] = ... / df.at[row, 'NEW'] = ...
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name):
+                if node.func.attr == "insert":  # df.insert(0, 'NEW', values)
+                    column = node.args[1] if len(node.args) > 1 else next((kw.value for kw in node.keywords if kw.arg == "column"), None)
+                    if column is not None:
+                        self.add_columns(node.func.value.id, column)
+                elif node.func.attr == "assign":  # df.assign(NEW=...)
+                    self.added.setdefault(node.func.value.id, set()).update(kw.arg for kw in node.keywords if kw.arg)
+
+    def add_columns(self, name: str, node):
+        """Record the string column names in `node` as columns the code adds to table variable `name`."""
+        self.added.setdefault(name, set()).update(string_list(node) or [])
+
+    def table_columns(self, name: str):
+        if name in self.reassigned:
+            return None
+        columns = self.columns(name)
+        return None if columns is None else list(columns) + sorted(self.added.get(name, ()))
+
+    def known_columns(self, node):
+        """Columns of an expression when they are known statically: a table variable, or one with a column list."""
+        if isinstance(node, ast.Name):
+            return self.table_columns(node.id)
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and isinstance(node.slice, (ast.List, ast.Tuple)):
+            return string_list(node.slice)
+        return None
+
+    @staticmethod
+    def groupby_source(node):
+        """`df` for a `df.groupby(...)` call on a plain variable, else None."""
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "groupby" \
+                and isinstance(node.func.value, ast.Name):
+            return node.func.value
+        return None
+
+    def check(self, tree) -> list:
+        issues = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load):
+                # df['COL'] / df[['A', 'B']] / df.groupby(...)['COL']
+                frame = node.value if isinstance(node.value, ast.Name) else self.groupby_source(node.value)
+                issues.extend(self.check_columns(frame, string_list(node.slice), node.lineno))
+            elif isinstance(node, ast.Call):
+                source = self.groupby_source(node)
+                if source is not None:
+                    by = node.args[0] if node.args else next((kw.value for kw in node.keywords if kw.arg == "by"), None)
+                    issues.extend(self.check_columns(source, string_list(by) if by is not None else None, node.lineno))
+                issues.extend(self.check_merge(node))
+        return issues
+
+    def check_columns(self, frame, wanted, line) -> list:
+        columns = self.table_columns(frame.id) if isinstance(frame, ast.Name) else None
+        if columns is None or not wanted:
+            return []
+        return [unknown_column(col, frame.id, columns, line) for col in wanted if col not in columns]
+
+    def check_merge(self, node) -> list:
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else func.id if isinstance(func, ast.Name) else None
+        if name not in MERGE_CALLS:
+            return []
+        if isinstance(func, ast.Attribute) and not (isinstance(func.value, ast.Name) and func.value.id in ("pd", "pandas")):
+            left, right = func.value, node.args[0] if node.args else None
+        else:
+            left, right = (node.args + [None, None])[:2]
+        keywords = {kw.arg: kw.value for kw in node.keywords if kw.arg}
+        left, right = keywords.get("left", left), keywords.get("right", right)
+        sides = {"left": (left, self.known_columns(left) if left is not None else None),
+                 "right": (right, self.known_columns(right) if right is not None else None)}
+
+        issues = []
+        checks = [("on", ("left", "right")), ("left_on", ("left",)), ("right_on", ("right",))]
+        for keyword, side_names in checks:
+            keys = string_list(keywords[keyword]) if keyword in keywords else None
+            for side in side_names if keys else ():
+                frame, columns = sides[side]
+                if columns is None:
+                    continue
+                label = ast.unparse(frame)
+                for key in keys:
+                    if key not in columns:
+                        issues.append(CodeIssue(
+                            "merge_key", f"Merge key '{key}' ({keyword}=) is not a column of `{label}`.",
+                            node.lineno, key, ranked_options(key, columns),
+                        ))
+        return issues
+
+
+def ranked_options(name: str, options) -> list:
+    """`options` with the closest (case-insensitive) matches to `name` first."""
+    by_lower = {str(o).lower(): o for o in options}
+    close = [by_lower[o] for o in difflib.get_close_matches(name.lower(), list(by_lower), n=3, cutoff=0.5)]
+    return close + [o for o in options if o not in close]
+
+
+def unknown_column(col, table, columns, line) -> CodeIssue:
+    return CodeIssue("unknown_column", f"Column '{col}' does not exist in `{table}`.", line, col, ranked_options(col, columns))
+
+
+def validate_code(code: str, scope_names, columns=lambda name: None) -> list:
+    """
+    Check generated code against the exec scope before running it; returns a list of CodeIssue (empty when fine).
+
+    `scope_names` are the names the scope provides (`chp`, `pd`, ...) and `columns(name)` returns the
+    column names of a table variable (None when unknown). Checked, without running anything:
+    syntax, names that are neither provided nor assigned nor builtins, literal column subscripts
+    (`chp['BARCODE']`, `df[['A', 'B']]`) and `merge` keys on table variables the code does not reassign,
+    and functions / lambdas / generator expressions that read the script's variables, which fails
+    under `exec(code, {}, scope)`.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return [CodeIssue("syntax", f"SyntaxError: {e.msg}", e.lineno)]
+
+    scope_names = set(scope_names)
+    assigned = bound_names([tree])
+    available = scope_names | assigned | set(dir(builtins))
+    issues = []
+
+    reported = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in available and node.id not in reported:
+            reported.add(node.id)
+            issues.append(CodeIssue(
+                "undefined_name", f"Name `{node.id}` is not defined.", node.lineno, node.id,
+                ranked_options(node.id, sorted(name for name in scope_names if not name.startswith("_"))),
+            ))
+
+    # Script-level variables: assigned outside any function body, or provided by the scope
+    script_names = scope_names | script_bound_names(tree)
+    for node in ast.walk(tree):
+        if isinstance(node, FUNCTION_NODES):
+            body = function_body(node)
+            local = bound_names(body)
+            outer = sorted({
+                inner.id for part in body for inner in ast.walk(part)
+                if isinstance(inner, ast.Name) and isinstance(inner.ctx, ast.Load)
+                and inner.id in script_names and inner.id not in local
+            })
+            if outer:
+                label = node.name if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) else FUNCTION_LABELS[type(node)]
+                issues.append(CodeIssue(
+                    "closure",
+                    f"`{label}` uses {', '.join(f'`{n}`' for n in outer)} from the script; code runs as exec(code, {{}}, scope), "
+                    "where functions, lambdas and generator expressions cannot see script variables. "
+                    "Pass them as arguments (e.g. `lambda row, threshold=threshold: ...`) or use a loop / vectorized expression instead.",
+                    node.lineno, outer[0],
+                ))
+
+    issues.extend(SchemaChecker(tree, columns).check(tree))
+    return sorted(issues, key=lambda issue: issue.line or 0)
+
+
+def code_fingerprint(code: str) -> str:
+    """Hash of the code's AST, so formatting, comments and quoting style do not change it."""
+    try:
+        normalized = ast.dump(ast.parse(code), annotate_fields=False, include_attributes=False)
+    except SyntaxError:
+        normalized = code
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
@@ -0,0 +1,328 @@
+import os
+import io
+import sys
+import time
+import queue
+import pickle
+import warnings
+import threading
+import traceback
+import multiprocessing
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from CodeAnalysis import code_fingerprint, referenced_names
+
+# Worker processes that run generated code; 0 runs it inline in the Streamlit script thread
+CODE_EXEC_PROCESSES = int(os.getenv("CODE_EXEC_PROCESSES", "2"))
+CODE_EXEC_TIMEOUT = float(os.getenv("CODE_EXEC_TIMEOUT", "60"))
+# Address space a worker may add on top of what it has mapped when it starts (tables, snapshot mmaps)
+CODE_EXEC_MEMORY_MB = int(os.getenv("CODE_EXEC_MEMORY_MB", "4096"))
+# Memory for cached execution results (0 disables the cache)
+RESULT_CACHE_MB = int(os.getenv("RESULT_CACHE_MB", "256"))
+# Tables loaded before the first fork besides the first job's own (comma-separated table names); the rest
+# are loaded lazily, when a job references them
+CODE_EXEC_WARM_TABLES = [name.strip() for name in os.getenv("CODE_EXEC_WARM_TABLES", "").split(",") if name.strip()]
+# Pools kept per process: the current registry and the one before a data refresh, for in-flight questions
+KEEP_POOLS = 2
+
+
+# Chained assignment (`df['col'][mask] = value`) never writes under copy-on-write; pandas only warns about it
+CHAINED_ASSIGNMENT_ERROR = getattr(pd.errors, "ChainedAssignmentError", None)
+
+
+@contextmanager
+def strict_chained_assignment():
+    """Turn pandas' chained-assignment warning into an error, so generated code that relies on it fails and is retried."""
+    with warnings.catch_warnings():
+        if CHAINED_ASSIGNMENT_ERROR is not None:
+            warnings.simplefilter("error", CHAINED_ASSIGNMENT_ERROR)
+        yield
+
+
+class CodeExecutionError(RuntimeError):
+    """Generated code failed in a worker; the message carries the worker's traceback."""
+
+
+class CodeExecutionTimeout(CodeExecutionError):
+    pass
+
+
+def encode_result(result):
+    """Serialize `result` for the pipe: DataFrames as an Arrow IPC stream, anything else pickled."""
+    if isinstance(result, pd.DataFrame):
+        try:
+            table = pa.Table.from_pandas(result, preserve_index=True)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return "arrow", sink.getvalue().to_pybytes()
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            pass  # mixed object columns: fall back to pickle
+    return "pickle", pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_result(kind: str, payload: bytes):
+    if kind == "arrow":
+        return pa.ipc.open_stream(payload).read_all().to_pandas()
+    return pickle.loads(payload)
+
+
+def mapped_bytes() -> int:
+    """Current virtual size of this process (Linux), 0 when unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def worker_main(conn, registry, memory_mb: int):
+    """Worker loop: run (code, tables) jobs against `registry` (inherited from the parent by fork)."""
+    import resource
+    import base64
+    import matplotlib.pyplot as plt
+    from Dataloader import LazyScope
+    from CodeAnalysis import referenced_names
+
+    registry.after_fork()
+    if memory_mb > 0:
+        limit = mapped_bytes() + memory_mb * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        code, tables = job
+
+        t0, cpu0 = time.time(), time.process_time()
+        reply = {"pid": os.getpid()}
+        try:
+            scope = LazyScope(registry.shared_scope(tables), pd=pd, np=np, base64=base64, BytesIO=io.BytesIO, plt=plt)
+            scope.prefetch(referenced_names(code))
+            with strict_chained_assignment():
+                exec(code, {}, scope)
+            reply["ok"] = True
+            reply["result"] = encode_result(dict.get(scope, "result"))
+        except MemoryError:
+            reply["ok"] = False
+            reply["error"] = f"MemoryError: the code exceeded the {memory_mb} MB memory limit of the executor"
+        except BaseException:
+            reply["ok"] = False
+            reply["error"] = traceback.format_exc()
+        finally:
+            plt.close("all")
+
+        reply["stats"] = {
+            "wall_seconds": round(time.time() - t0, 3),
+            "cpu_seconds": round(time.process_time() - cpu0, 3),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "result_bytes": len(reply["result"][1]) if reply.get("ok") else 0,
+        }
+        try:
+            conn.send(reply)
+        except Exception as e:  # e.g. an unpicklable result
+            conn.send({"pid": os.getpid(), "ok": False, "error": f"Could not return the result: {e}", "stats": reply["stats"]})
+
+
+class ExecutorWorker:
+    def __init__(self, context, registry, memory_mb: int):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn, registry, memory_mb), daemon=True)
+        # Fork while no other thread is loading a table, and remember which tables the worker inherits
+        with registry.quiesced():
+            self.tables = registry.loaded_tables()
+            self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class ExecutorPool:
+    """
+    Pre-forked processes that run generated code against one TableRegistry.
+
+    Workers are forked after the data is loaded, so the tables are shared with the app process
+    copy-on-write (and the snapshot mappings are shared outright). The tables a job references are loaded
+    in the app process before it is dispatched, and a worker forked before they were loaded is replaced by
+    a fresh fork, so workers never load (or download) tables of their own. Each run has a wall-clock timeout,
+    after which its worker is killed and replaced, and each worker's address space is capped with
+    `setrlimit(RLIMIT_AS)` at `memory_mb` above its size at start. `result` comes back as an Arrow
+    stream (DataFrames) or a pickle, together with per-run stats.
+    """
+
+    def __init__(self, registry, processes: int = CODE_EXEC_PROCESSES, timeout: float = CODE_EXEC_TIMEOUT, memory_mb: int = CODE_EXEC_MEMORY_MB, warm_tables=()):
+        self.registry = registry
+        # Load these before forking so every worker shares them instead of loading its own copy
+        registry.prefetch(list(warm_tables))
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.context = multiprocessing.get_context("fork")
+        self.workers = queue.Queue()
+        self.processes = processes
+        self.closed = False
+        for _ in range(processes):
+            self.workers.put(self.spawn())
+        print(f"[INFO] Code executor pool: {processes} workers, timeout {timeout:.0f}s, memory cap {memory_mb:,} MB per worker")
+
+    def spawn(self) -> ExecutorWorker:
+        return ExecutorWorker(self.context, self.registry, self.memory_mb)
+
+    def run(self, code: str, tables: dict, timeout: float = None):
+        """
+        Execute `code` with the table variables `tables` ({variable: table name}) in a worker.
+
+        Returns:
+            (result, stats): the code's `result` variable (None when it sets none) and the run's stats.
+        Raises:
+            CodeExecutionError / CodeExecutionTimeout with the worker's error.
+        """
+        timeout = timeout or self.timeout
+        t0 = time.time()
+        # Load the job's tables here, outside the worker's timeout and memory cap, once for every worker
+        needed = {tables[name] for name in referenced_names(code) if name in tables}
+        self.registry.prefetch(list(needed))
+        needed &= self.registry.loaded_tables()
+        prefetch = time.time() - t0
+
+        t0 = time.time()
+        worker = self.workers.get()
+        queued = time.time() - t0
+        if not worker.process.is_alive() or not needed <= worker.tables:
+            worker.kill()
+            worker = self.spawn()
+        try:
+            try:
+                worker.conn.send((code, tables))
+                finished = worker.conn.poll(timeout)
+                reply = worker.conn.recv() if finished else None
+            except (EOFError, OSError):
+                worker.kill()
+                worker = self.spawn()
+                raise CodeExecutionError("The executor process died while running the code (out of memory?)")
+            if not finished:
+                worker.kill()
+                worker = self.spawn()
+                raise CodeExecutionTimeout(f"The code did not finish within {timeout:.0f} seconds and was stopped")
+        finally:
+            if self.closed:
+                worker.kill()
+            else:
+                self.workers.put(worker)
+
+        stats = dict(reply["stats"], prefetch_seconds=round(prefetch, 3), queued_seconds=round(queued, 3), pid=reply["pid"])
+        print(f"[INFO] Code executed in worker {reply['pid']}: {stats}")
+        if not reply["ok"]:
+            raise CodeExecutionError(reply["error"])
+        return decode_result(*reply["result"]), stats
+
+    def close(self):
+        """Stop the idle workers; busy ones are stopped when their run returns."""
+        self.closed = True
+        while True:
+            try:
+                self.workers.get_nowait().kill()
+            except queue.Empty:
+                return
+
+
+class ResultCache:
+    """
+    Size-bounded LRU of execution results, keyed by (data identity, scope tables, code fingerprint).
+
+    Results are stored serialized (DataFrames as Arrow IPC, anything else pickled), which gives the byte
+    accounting and hands every hit its own copy. Entries of other data identities are dropped as soon as
+    a lookup arrives for a new one, i.e. when the data is reloaded or refreshed.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MB * 2**20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (kind, payload, exec_seconds)
+        self.bytes = 0
+        self.identity = None
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(identity: str, tables: dict, code: str):
+        return identity, tuple(sorted(tables.items())), code_fingerprint(code)
+
+    def _switch(self, identity: str):
+        if identity != self.identity:
+            self.entries.clear()
+            self.bytes = 0
+            self.identity = identity
+
+    def get(self, key):
+        """(result, exec_seconds saved) on a hit, None on a miss."""
+        with self._lock:
+            self._switch(key[0])
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[2]
+        return decode_result(entry[0], entry[1]), entry[2]
+
+    def put(self, key, result, exec_seconds: float):
+        try:
+            kind, payload = encode_result(result)
+        except Exception:
+            return  # unpicklable results (e.g. open figures) are not cached
+        if len(payload) > self.max_bytes // 4:
+            return
+        with self._lock:
+            self._switch(key[0])
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[1])
+            self.entries[key] = (kind, payload, exec_seconds)
+            self.bytes += len(payload)
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted[1])
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries), "mb": round(self.bytes / 2**20, 2), "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0, "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+
+result_cache = ResultCache()
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_code_executor(registry, warm_tables=()):
+    """
+    The executor pool of `registry` (created, i.e. forked, on first use after loading `warm_tables`, usually the
+    first job's tables, and CODE_EXEC_WARM_TABLES), or None when execution runs inline: CODE_EXEC_PROCESSES=0,
+    or no fork on this platform (Windows local runs).
+    """
+    if CODE_EXEC_PROCESSES <= 0 or "fork" not in multiprocessing.get_all_start_methods() or sys.platform == "win32":
+        return None
+    with _pools_lock:
+        pool = _pools.get(id(registry))
+        if pool is None or pool.registry is not registry:
+            warm = dict.fromkeys([*CODE_EXEC_WARM_TABLES, *warm_tables])
+            pool = _pools[id(registry)] = ExecutorPool(registry, warm_tables=[name for name in warm if name in registry])
+            for key in list(_pools)[:-KEEP_POOLS]:
+                _pools.pop(key).close()
+        return pool
@@ -0,0 +1,199 @@
+import os
+import json
+import hashlib
+import tempfile
+
+import pyarrow.parquet as pq
+
+CATALOG_FILE = "catalog.json"
+# Aggregation levels whose fact tables are downloaded and registered at startup (comma separated)
+DATA_AGGREGATIONS = [a.strip() for a in os.getenv("DATA_AGGREGATIONS", "monthly").lower().split(",") if a.strip()]
+
+# The tables and files the app knows about. Stats (rows / schema_hash / bytes) are filled in by
+# `python DataCatalog.py --write` next to the data and uploaded with it as catalog.json.
+#   kind:        table (a parquet loaded into the registry), derived (computed from other tables),
+#                view (a fact table pre-joined with its dimensions, see Dataloader.JOINED_VIEWS),
+#                entities / index / snapshot (search and preparation artifacts)
+#   aggregation: monthly / weekly for the AGGR_ fact tables and their views, None for everything else
+#   required:    startup reports missing or mismatching required files as errors, optional ones as warnings
+DEFAULT_ENTRIES = [
+    {"table": "AGGR_MONTHLY_DW_CHP", "file": "AGGR_MONTHLY_DW_CHP.parquet", "alias": "chp", "kind": "table", "aggregation": "monthly", "required": True},
+    {"table": "AGGR_MONTHLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES", "file": "AGGR_MONTHLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES.parquet", "alias": "stnx_sales", "kind": "table", "aggregation": "monthly", "required": True},
+    {"table": "AGGR_MONTHLY_DW_INVOICES", "file": "AGGR_MONTHLY_DW_INVOICES.parquet", "alias": "inv_df", "kind": "table", "aggregation": "monthly", "required": True},
+    {"table": "AGGR_WEEKLY_DW_CHP", "file": "AGGR_WEEKLY_DW_CHP.parquet", "alias": "chp", "kind": "table", "aggregation": "weekly", "required": False},
+    {"table": "AGGR_WEEKLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES", "file": "AGGR_WEEKLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES.parquet", "alias": "stnx_sales", "kind": "table", "aggregation": "weekly", "required": False},
+    {"table": "AGGR_WEEKLY_DW_INVOICES", "file": "AGGR_WEEKLY_DW_INVOICES.parquet", "alias": "inv_df", "kind": "table", "aggregation": "weekly", "required": False},
+    {"table": "DW_DIM_STORENEXT_BY_INDUSTRIES_ITEMS", "file": "DW_DIM_STORENEXT_BY_INDUSTRIES_ITEMS.parquet", "alias": "stnx_items", "kind": "table", "required": True},
+    {"table": "DW_DIM_CUSTOMERS", "file": "DW_DIM_CUSTOMERS.parquet", "alias": "customer_df", "kind": "table", "required": True},
+    {"table": "DW_DIM_INDUSTRIES", "file": "DW_DIM_INDUSTRIES.parquet", "alias": "industry_df", "kind": "table", "required": True},
+    {"table": "DW_DIM_MATERIAL", "file": "DW_DIM_MATERIAL.parquet", "alias": "material_df", "kind": "table", "required": True},
+    {"table": "DATE_HOLIAY_DATA", "file": None, "alias": "dt_df", "kind": "derived", "required": True},
+    {"table": "VIEW_MONTHLY_STNX_SALES_ITEMS", "file": None, "alias": "stnx_sales_items", "kind": "view", "aggregation": "monthly", "required": False},
+    {"table": "VIEW_MONTHLY_INVOICES_ENRICHED", "file": None, "alias": "inv_enriched", "kind": "view", "aggregation": "monthly", "required": False},
+    {"table": "VIEW_WEEKLY_STNX_SALES_ITEMS", "file": None, "alias": "stnx_sales_items", "kind": "view", "aggregation": "weekly", "required": False},
+    {"table": "VIEW_WEEKLY_INVOICES_ENRICHED", "file": None, "alias": "inv_enriched", "kind": "view", "aggregation": "weekly", "required": False},
+
+    {"file": "stnx_entities_meta.parquet", "kind": "entities", "required": True},
+    {"file": "stnx_entities_embedding.npy", "kind": "entities", "required": True},
+    {"file": "chp_entities_meta.parquet", "kind": "entities", "required": True},
+    {"file": "chp_entities_embedding.npy", "kind": "entities", "required": True},
+    {"file": "customer_entities_meta.parquet", "kind": "entities", "required": True},
+    {"file": "customer_entities_embedding.npy", "kind": "entities", "required": True},
+    {"file": "entities_ivf.npz", "kind": "index", "required": False},
+    {"file": "entities_q8.npy", "kind": "index", "required": False},
+    {"file": "entities_q8_scale.npy", "kind": "index", "required": False},
+    {"file": "entities_quantized.json", "kind": "index", "required": False},
+    {"file": "entities_reduced.npy", "kind": "index", "required": False},
+    {"file": "entities_reduced_projection.npz", "kind": "index", "required": False},
+    {"file": "prepared_snapshot.arrow", "kind": "snapshot", "required": False},
+    {"file": "prepared_entities.npy", "kind": "snapshot", "required": False},
+]
+
+
+def schema_hash(path: str) -> str:
+    """Hash of the parquet schema (column names and Arrow types), read from the file footer."""
+    schema = pq.read_schema(path)
+    payload = json.dumps([[field.name, str(field.type)] for field in schema])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def file_stats(path: str) -> dict:
+    """{bytes, rows, schema_hash} of a file; rows and schema only for parquet files (footer reads)."""
+    stats = {"bytes": os.path.getsize(path)}
+    if path.endswith(".parquet"):
+        stats["rows"] = pq.ParquetFile(path).metadata.num_rows
+        stats["schema_hash"] = schema_hash(path)
+    return stats
+
+
+class DataCatalog:
+    """
+    One manifest of the data files: which tables exist, which file and exec variable (`chp`, `inv_df`, ...)
+    each maps to, its aggregation level, whether it is required, and the expected row count,
+    schema hash and size. The downloader, the table loaders and the exec scope all read it.
+    """
+
+    def __init__(self, entries):
+        self.entries = [dict(entry) for entry in entries]
+
+    @classmethod
+    def default(cls):
+        return cls(DEFAULT_ENTRIES)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["entries"])
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": self.entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def select(self, kinds=None, aggregations=None):
+        """
+        Entries of the given kinds; fact tables only for the given aggregation levels
+        (entries without an aggregation level always match).
+        """
+        return [
+            entry for entry in self.entries
+            if (kinds is None or entry["kind"] in kinds)
+            and (aggregations is None or entry.get("aggregation") is None or entry["aggregation"] in aggregations)
+        ]
+
+    def files(self, aggregations=None) -> list:
+        """File names to download for the given aggregation levels (default: DATA_AGGREGATIONS)."""
+        aggregations = DATA_AGGREGATIONS if aggregations is None else aggregations
+        return [entry["file"] for entry in self.select(aggregations=aggregations) if entry.get("file")]
+
+    def table_files(self, aggregations=None) -> dict:
+        """{table name: file name} of the parquet tables for the given aggregation levels."""
+        aggregations = DATA_AGGREGATIONS if aggregations is None else aggregations
+        return {entry["table"]: entry["file"] for entry in self.select(("table",), aggregations)}
+
+    def scope_tables(self, aggregation: str = "monthly") -> dict:
+        """{exec variable: table name} at one aggregation level."""
+        return {entry["alias"]: entry["table"] for entry in self.select(("table", "derived", "view"), [aggregation]) if entry.get("alias")}
+
+    def entry(self, table: str) -> dict:
+        return next((entry for entry in self.entries if entry.get("table") == table), None)
+
+    def with_stats(self, parquet_dir: str):
+        """A copy of the catalog with the stats of the files present in `parquet_dir`."""
+        entries = []
+        for entry in self.entries:
+            entry = dict(entry)
+            path = os.path.join(parquet_dir, entry["file"]) if entry.get("file") else None
+            if path and os.path.exists(path):
+                entry.update(file_stats(path))
+            entries.append(entry)
+        return DataCatalog(entries)
+
+    def validate(self, parquet_dir: str, aggregations=None):
+        """
+        Compare the files in `parquet_dir` with the catalog.
+
+        Returns:
+            (errors, warnings): messages for required and optional files that are missing or whose size,
+            row count or schema hash differ from the recorded stats.
+        """
+        aggregations = DATA_AGGREGATIONS if aggregations is None else aggregations
+        errors, warnings = [], []
+        for entry in self.select(aggregations=aggregations):
+            if not entry.get("file"):
+                continue
+            problems = errors if entry["required"] else warnings
+            path = os.path.join(parquet_dir, entry["file"])
+            if not os.path.exists(path):
+                problems.append(f"{entry['file']} is missing")
+                continue
+
+            expected = {key: entry[key] for key in ("bytes", "rows", "schema_hash") if key in entry}
+            if not expected:
+                continue
+            actual = file_stats(path)
+            for key, value in expected.items():
+                if actual.get(key) != value:
+                    problems.append(f"{entry['file']}: {key} is {actual.get(key)}, catalog says {value}")
+        return errors, warnings
+
+
+def load_catalog(parquet_dir: str = None) -> DataCatalog:
+    """The catalog.json shipped with the data in `parquet_dir`, or the built-in catalog when there is none."""
+    path = os.path.join(parquet_dir, CATALOG_FILE) if parquet_dir else None
+    if path and os.path.exists(path):
+        try:
+            return DataCatalog.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARNING] Unreadable data catalog {path}, using the built-in catalog: {e}")
+    return DataCatalog.default()
+
+
+def validate_data_dir(parquet_dir: str, catalog: DataCatalog = None) -> list:
+    """Validate `parquet_dir` against its catalog at startup, printing the findings; returns the errors."""
+    catalog = catalog or load_catalog(parquet_dir)
+    errors, warnings = catalog.validate(parquet_dir)
+    for message in warnings:
+        print(f"[WARNING] Data catalog: {message}")
+    for message in errors:
+        print(f"[ERROR] Data catalog: {message}")
+    if not errors and not warnings:
+        print(f"[INFO] Data files match the catalog ({', '.join(DATA_AGGREGATIONS)})")
+    return errors
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write or check the data catalog (catalog.json) of a data directory.")
+    parser.add_argument("--parquet-dir", default=tempfile.gettempdir())
+    parser.add_argument("--write", action="store_true", help="Record the stats of the current files in catalog.json")
+    args = parser.parse_args()
+
+    if args.write:
+        catalog = load_catalog(args.parquet_dir).with_stats(args.parquet_dir)
+        catalog.save(os.path.join(args.parquet_dir, CATALOG_FILE))
+        print(f"[SUCCESS] Wrote {CATALOG_FILE} ({len(catalog.entries)} entries) to {args.parquet_dir}")
+    else:
+        validate_data_dir(args.parquet_dir)
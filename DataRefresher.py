@@ -0,0 +1,207 @@
+import gc
+import os
+import json
+import time
+import shutil
+import hashlib
+import weakref
+import threading
+from datetime import datetime
+
+from SharedDataPlane import file_lock
+
+# Seconds between blob polls; 0 disables the refresher
+DATA_REFRESH_INTERVAL = int(os.getenv("DATA_REFRESH_INTERVAL", "0"))
+VERSIONS_DIR = "versions"
+VERSION_STATE_FILE = "version.json"
+KEEP_VERSIONS = 2
+
+
+class LocalStorage:
+    """Filesystem stand-in for the blob container (tests / local runs): `root` holds the files by name."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def properties(self, names) -> dict:
+        """{name: etag} for every name that exists; the etag is derived from size and mtime."""
+        props = {}
+        for name in names:
+            path = os.path.join(self.root, name)
+            if os.path.exists(path):
+                stat = os.stat(path)
+                props[name] = f"{stat.st_size}-{stat.st_mtime_ns}"
+        return props
+
+    def download(self, name: str, dest_path: str):
+        shutil.copyfile(os.path.join(self.root, name), dest_path)
+
+
+class BlobContainerStorage:
+    """Azure blob container client wrapper exposing the same interface as LocalStorage."""
+
+    def __init__(self, container_client):
+        self.container_client = container_client
+
+    def properties(self, names) -> dict:
+        props = {}
+        for name in names:
+            try:
+                blob = self.container_client.get_blob_client(name).get_blob_properties()
+            except Exception as e:
+                print(f"[WARNING] No properties for blob {name}: {e}")
+                continue
+            props[name] = blob.etag or f"{blob.size}-{blob.last_modified}"
+        return props
+
+    def download(self, name: str, dest_path: str):
+        from startup_load_data import download_to_path
+        download_to_path(self.container_client.get_blob_client(name), dest_path)
+
+
+class DataVersion:
+    """One immutable, fully prepared set of tables plus the entity index built from the same files."""
+
+    def __init__(self, version_id: str, parquet_dir: str, dataframes, vector_database):
+        self.id = version_id
+        self.parquet_dir = parquet_dir
+        self.dataframes = dataframes
+        self.vector_database = vector_database
+        self.created = datetime.now()
+
+
+def load_data_version(version_id: str, parquet_dir: str, prepare: bool = True) -> DataVersion:
+    """Prepare (snapshot), register and index the files of `parquet_dir` as a new DataVersion."""
+    from Dataloader import build_vector_database, open_prepared_snapshot, open_table_registry
+    from prepare_data import prepare_data
+
+    snapshot = open_prepared_snapshot(parquet_dir)
+    if prepare and snapshot[0] is None:
+        prepare_data(parquet_dir)
+        snapshot = open_prepared_snapshot(parquet_dir)
+    dataframes = open_table_registry(parquet_dir, snapshot=snapshot)
+    vector_database = build_vector_database(parquet_dir, snapshot=snapshot)
+    return DataVersion(version_id, parquet_dir, dataframes, vector_database)
+
+
+class DataRefresher(threading.Thread):
+    """
+    Background thread that picks up new data without restarting the app.
+
+    Every `interval` seconds it reads the etags of `file_names` through `storage` (BlobContainerStorage,
+    or LocalStorage as a stand-in). When any changed, it builds a new version directory under
+    `{parquet_dir}/versions/`: changed files are downloaded into a staging directory, unchanged ones are
+    hard-linked from the current version, and the staging directory is renamed into place. The version
+    is then prepared and indexed off the request path and swapped in as `current`.
+
+    Sessions read `current` at the start of a question, so in-flight executions finish on the version
+    they started with. Versions are named after their etags, so worker processes on one instance that
+    see the same change share one download (under a file lock).
+
+    Old version directories are deleted only once nothing in this process still references their
+    registry or entity index (sessions that have not asked since the swap, executor pools kept in
+    CodeExecutor._pools); until then their deletion is retried on every poll.
+    """
+
+    def __init__(self, storage, parquet_dir: str, file_names, interval: int = DATA_REFRESH_INTERVAL, prepare: bool = True):
+        super().__init__(name="DataRefresher", daemon=True)
+        self.storage = storage
+        self.parquet_dir = parquet_dir
+        self.file_names = list(file_names)
+        self.interval = interval
+        self.prepare = prepare
+        self.versions_root = os.path.join(parquet_dir, VERSIONS_DIR)
+        self.current = None
+        self.current_dir = parquet_dir
+        self.etags = None
+        self.live = {}  # version dir -> weak references to the registry and entity index loaded from it
+        self.deferred = set()  # old version dirs still referenced at the last collection
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                if not self.check_once() and self.deferred:
+                    self.collect_garbage()
+            except Exception as e:
+                print(f"[WARNING] Data refresh failed, keeping version {self.current.id if self.current else 'initial'}: {e}")
+
+    def check_once(self) -> bool:
+        """Poll once; returns True when a new version was swapped in."""
+        props = self.storage.properties(self.file_names)
+        if self.etags is None:
+            # The first poll is the baseline: the files on disk at startup are assumed to match it
+            self.etags = props
+            return False
+
+        changed = sorted(name for name, etag in props.items() if self.etags.get(name) != etag)
+        if not changed:
+            return False
+
+        t0 = time.time()
+        version_id = hashlib.sha1(json.dumps(sorted(props.items())).encode("utf-8")).hexdigest()[:12]
+        version_dir = self.stage_version(version_id, props, changed)
+        version = load_data_version(version_id, version_dir, prepare=self.prepare)
+
+        self.current, self.current_dir, self.etags = version, version_dir, props
+        self.live[version_dir] = [weakref.ref(obj) for obj in (version.dataframes, version.vector_database) if obj is not None]
+        print(f"[SUCCESS] Data version {version_id} is live ({len(changed)} changed files: {changed}) after {time.time() - t0:.1f}s")
+        self.collect_garbage()
+        return True
+
+    def stage_version(self, version_id: str, props: dict, changed) -> str:
+        os.makedirs(self.versions_root, exist_ok=True)
+        version_dir = os.path.join(self.versions_root, version_id)
+        with file_lock(os.path.join(self.versions_root, ".lock")):
+            if os.path.exists(os.path.join(version_dir, VERSION_STATE_FILE)):
+                return version_dir  # already staged by another worker process
+
+            staging_dir = f"{version_dir}.staging"
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            os.makedirs(staging_dir)
+            for name in props:
+                dest = os.path.join(staging_dir, name)
+                if name in changed or not os.path.exists(os.path.join(self.current_dir, name)):
+                    self.storage.download(name, dest)
+                    print(f"[INFO] Downloaded {name} for data version {version_id}")
+                else:
+                    self.link_or_copy(os.path.join(self.current_dir, name), dest)
+
+            with open(os.path.join(staging_dir, VERSION_STATE_FILE), "w", encoding="utf-8") as f:
+                json.dump({"id": version_id, "etags": props, "created": datetime.now().isoformat()}, f)
+            shutil.rmtree(version_dir, ignore_errors=True)
+            os.replace(staging_dir, version_dir)
+        return version_dir
+
+    @staticmethod
+    def link_or_copy(src: str, dest: str):
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copy2(src, dest)
+
+    def in_use(self, path: str) -> bool:
+        """True while a registry or entity index loaded from `path` is still referenced."""
+        return any(ref() is not None for ref in self.live.get(path, ()))
+
+    def collect_garbage(self):
+        versions = [
+            os.path.join(self.versions_root, name) for name in os.listdir(self.versions_root)
+            if os.path.exists(os.path.join(self.versions_root, name, VERSION_STATE_FILE))
+        ]
+        versions.sort(key=os.path.getmtime)
+        gc.collect()  # registries hold their loaders in reference cycles; free the unreachable ones first
+        previous, self.deferred = self.deferred, set()
+        for path in versions[:-KEEP_VERSIONS]:
+            if path == self.current_dir:
+                continue
+            if self.in_use(path):
+                self.deferred.add(path)
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            self.live.pop(path, None)
+        if self.deferred and self.deferred != previous:
+            print(f"[INFO] Keeping {len(self.deferred)} old data versions still in use: {sorted(self.deferred)}")
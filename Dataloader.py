@@ -1,11 +1,29 @@
 import os
+import sys
+import json
+import hashlib
 import pandas as pd
 import tempfile
 from pyluach import dates
 import streamlit as st
 import time
+import threading
 import concurrent.futures
+from collections.abc import Mapping
+from contextlib import contextmanager
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from agents.lexical import LexicalIndex
+from HebrewCalendar import get_hebrew_calendar
+from DataCatalog import CATALOG_FILE, load_catalog, validate_data_dir
+from PreparedSnapshot import open_snapshot
+from SharedDataPlane import SHARED_DATA_PLANE, DataPlane
+from DataRefresher import DATA_REFRESH_INTERVAL, BlobContainerStorage, DataRefresher, LocalStorage
+from VectorIndex import (
+    EntityIndex, ShardedRows, collapse_brands, entity_content_hash, IVF_INDEX_FILE, QUANTIZED_MANIFEST_FILE,
+    QUANTIZED_MATRIX_FILES, QUANTIZED_SCALE_FILE, REDUCED_MATRIX_FILE, REDUCED_PROJECTION_FILE,
+)
 
 class DataLoader:
     def __init__(self):
@@ -35,46 +53,29 @@ class DataLoader:
         return dates.GregorianDate(year, month, day).festival(hebrew=True)
 
     def create_date_dataframe(self, start_date, end_date):
-        """Create a DataFrame with date range, Hebrew dates, and holidays."""
-        dt_df = pd.DataFrame({'DATE': pd.date_range(start=start_date, end=end_date)})
-        dt_df['HEBREW_DATE'] = dt_df['DATE'].apply(lambda x: self.gregorian_to_hebrew(x.year, x.month, x.day))
-        dt_df['HOLIDAY'] = dt_df['DATE'].apply(lambda x: self.get_jewish_holidays(x.year, x.month, x.day))
-        return dt_df
+        """Create a DataFrame with date range, Hebrew dates, and holidays (sliced from the precomputed calendar)."""
+        return get_hebrew_calendar(self.parquet_dir).date_range(start_date, end_date)
 
 def load_selected_parquets(parquet_dir="parquet_files"):
     """
-    Load specific Parquet files from a given directory.
+    Register the catalog's monthly and dimension tables from a given directory; each is read on first access.
 
     Returns:
-        dict[str, pd.DataFrame]: Dictionary of DataFrames keyed by filename (without .parquet).
-    """
-    selected_files = [
-    "AGGR_MONTHLY_DW_CHP.parquet",
-    "AGGR_MONTHLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES.parquet",
-    "AGGR_MONTHLY_DW_INVOICES.parquet",
-    "DW_DIM_STORENEXT_BY_INDUSTRIES_ITEMS.parquet",
-    "DW_DIM_CUSTOMERS.parquet",
-    "DW_DIM_INDUSTRIES.parquet",
-    "DW_DIM_MATERIAL.parquet"
-    ]
-
-    dataframes = {}
+        TableRegistry: Lazily loaded DataFrames keyed by filename (without .parquet).
+    """
+    dataframes = TableRegistry()
+    for file_name in load_catalog(parquet_dir).table_files(["monthly"]).values():
+        dataframes.register_parquet(os.path.join(parquet_dir, file_name))
+    register_aggregation_tables(dataframes, parquet_dir)
+    register_joined_views(dataframes)
 
-    # Use ThreadPoolExecutor to parallelize reading
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        futures = {}
-        for file_name in selected_files:
-            file_path = os.path.join(parquet_dir, file_name)
-            futures[file_name] = executor.submit(read_parquet_file, file_path)
+    # Entity table with embeddings
+    dataframes.register('vector_database', load_local_vector_database)
+    return dataframes
 
-        for i, (file_name, future) in enumerate(futures.items()):
-            df = future.result()
-            print(f"✅ Loaded {file_name:<60} → {df.shape[0]:,} rows")
-            if df is not None:
-                key = file_name.replace(".parquet", "")
-                dataframes[key] = df
 
-    # Load entity table with embeddings
+def load_local_vector_database():
+    """Load the local entity table with embeddings (local mode)."""
     stnx_entities = pd.read_parquet("embeddings/stnx_entities.parquet")
     chp_entities = pd.read_parquet("embeddings/chp_entities.parquet")
     customer_entities = pd.read_parquet("embeddings/customer_entities.parquet")
@@ -90,92 +91,933 @@ def load_selected_parquets(parquet_dir="parquet_files"):
         return {}
 
     combined_entities["metadata"] = combined_entities.apply(clean_and_tag_metadata, axis=1)
-    dataframes['vector_database'] = combined_entities
-    
-    return dataframes
+    return combined_entities
+
+
+# Protected scope: shared tables are read-only and each question works on copy-on-write views of them
+PROTECTED_SCOPE = os.getenv("PROTECTED_SCOPE", "true").lower() != "false"
+if PROTECTED_SCOPE and int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)  # the default from pandas 3 on
+
+
+# protect_frame reaches into pandas' block manager, whose layout is only known for these major versions
+PROTECTED_BUFFERS = int(pd.__version__.split(".")[0]) in (2, 3)
+
+
+def protect_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mark the NumPy buffers behind `df` read-only (in place), so a write that reaches the shared table
+    itself raises instead of changing it for every session. Arrow-backed columns are immutable already.
+    On other pandas versions, or when the internals differ, the table is left as is (copy-on-write still
+    keeps the per-question copies apart from it).
+    """
+    blocks = getattr(getattr(df, "_mgr", None), "blocks", None) if PROTECTED_BUFFERS else None
+    if blocks is None:
+        return df
+    for block in blocks:
+        values = getattr(block, "values", None)
+        for attr in (None, "_ndarray", "_codes", "_data", "_mask"):
+            array = values if attr is None else getattr(values, attr, None)
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+    return df
+
+
+class TableRegistry(Mapping):
+    """
+    Read-only mapping of table name -> DataFrame whose tables are loaded on first access.
+
+    Every table is registered with a zero-argument loader (a parquet read, or a table derived from other
+    tables such as `DATE_HOLIAY_DATA`). A table is loaded at most once, even when several sessions ask
+    for it at the same time, and `prefetch` loads a group of tables concurrently.
+    Registries are shared between sessions through `st.cache_resource`.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._loaders = {}
+        self._tables = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._scopes = {}
+        self._schema_loaders = {}
+        self._schemas = {}
+        # Table loads in progress (see quiesced); nested loads of a derived table's inputs count once per thread
+        self._loading = 0
+        self._forking = False
+        self._load_cond = threading.Condition()
+        self._load_depth = threading.local()
+        self.snapshot = None  # SnapshotBundle the tables are decoded from, if any
+        # Identity of the data behind the tables (the snapshot fingerprint when there is one), used by result caches
+        self.identity = f"registry-{os.getpid()}-{time.time_ns()}"
+
+    def register(self, name: str, loader, columns=None):
+        """`columns` optionally returns the table's column names without loading it (e.g. from a file footer)."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks[name] = threading.Lock()
+            self._tables.pop(name, None)
+            self._schemas.pop(name, None)
+            if columns is not None:
+                self._schema_loaders[name] = columns
+            self._scopes.clear()
+
+    def register_parquet(self, file_path: str):
+        self.register(
+            os.path.basename(file_path).replace(".parquet", ""),
+            lambda: read_parquet_file(file_path),
+            columns=lambda: pq.read_schema(file_path).names,
+        )
+
+    def __getitem__(self, name):
+        if name in self._tables:
+            return self._tables[name]
+        lock = self._locks[name]  # KeyError for unknown tables, like a dict
+        self._begin_load()
+        try:
+            with lock:
+                if name not in self._tables:
+                    t0 = time.time()
+                    df = self._loaders[name]()
+                    if PROTECTED_SCOPE and df is not None:
+                        protect_frame(df)
+                    self._tables[name] = df
+                    if df is not None:
+                        print(f"✅ Loaded {name:<60} → {df.shape[0]:,} rows ({time.time() - t0:.2f}s)")
+        finally:
+            self._end_load()
+        return self._tables[name]
+
+    def _begin_load(self):
+        depth = getattr(self._load_depth, "value", 0)
+        with self._load_cond:
+            while self._forking and depth == 0:
+                self._load_cond.wait()
+            self._loading += 1
+        self._load_depth.value = depth + 1
+
+    def _end_load(self):
+        self._load_depth.value -= 1
+        with self._load_cond:
+            self._loading -= 1
+            self._load_cond.notify_all()
+
+    @contextmanager
+    def quiesced(self):
+        """
+        Hold off table loads for the duration, after waiting for the ones in progress to finish. Forking inside
+        this block never clones a table lock held by another thread's load; the forked process then calls
+        `after_fork` to replace the registry lock held here.
+        """
+        with self._load_cond:
+            while self._forking:
+                self._load_cond.wait()
+            self._forking = True
+            while self._loading:
+                self._load_cond.wait()
+        try:
+            with self._lock:
+                yield
+        finally:
+            with self._load_cond:
+                self._forking = False
+                self._load_cond.notify_all()
+
+    def after_fork(self):
+        """In a process forked inside `quiesced`: replace the locks, which the fork copied in their held state."""
+        self._lock = threading.Lock()
+        self._locks = {name: threading.Lock() for name in self._locks}
+        self._scopes = {}
+        self._loading = 0
+        self._forking = False
+        self._load_cond = threading.Condition()
+        self._load_depth = threading.local()
+
+    def loaded_tables(self) -> set:
+        return set(self._tables)
+
+    def __contains__(self, name):
+        return name in self._loaders
+
+    def __iter__(self):
+        return iter(list(self._loaders))
+
+    def __len__(self):
+        return len(self._loaders)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._tables
+
+    def columns(self, name: str):
+        """Column names of a table, without loading it when its schema is known; None when unknown."""
+        df = self._tables.get(name)
+        if df is not None:
+            return list(df.columns)
+        if name not in self._schemas and name in self._schema_loaders:
+            try:
+                self._schemas[name] = list(self._schema_loaders[name]())
+            except Exception:
+                self._schemas[name] = None
+        return self._schemas.get(name)
+
+    def shared_scope(self, tables: dict) -> "SharedScope":
+        """The SharedScope binding `tables` ({variable: table name}) to this registry, built once per mapping."""
+        key = tuple(sorted(tables.items()))
+        with self._lock:
+            if key not in self._scopes:
+                self._scopes[key] = SharedScope(self, tables)
+            return self._scopes[key]
+
+    def prefetch(self, names):
+        """Load the not-yet-loaded tables among `names` concurrently."""
+        pending = [name for name in dict.fromkeys(names) if name in self._loaders and name not in self._tables]
+        if len(pending) == 1:
+            self[pending[0]]
+        elif pending:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                list(executor.map(self.__getitem__, pending))
+        return pending
+
+
+class SharedScope(Mapping):
+    """
+    Read-only exec bindings (`chp`, `inv_df`, ...) of one registry, shared by every session.
+
+    `tables` maps a variable name to its registry table name. A variable is bound once, on first use:
+    dimension tables (already deduplicated at load time) get their primary key as an unnamed index,
+    so `.loc[code]` lookups are hashed; the key also stays a column, so merges on it work unchanged.
+    Built through `TableRegistry.shared_scope`, i.e. once per data snapshot and aggregation level.
+    """
+
+    def __init__(self, registry, tables: dict):
+        self.registry = registry
+        self.tables = dict(tables)
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        if name in self._frames:
+            return self._frames[name]
+        table_name = self.tables[name]  # KeyError for unknown variables, like a dict
+        df = self.registry.get(table_name)
+        key = PRIMARY_KEYS.get(table_name)
+        if df is not None and key in df.columns:
+            df = df.copy(deep=False)
+            df.index = pd.Index(df[key].to_numpy())
+        with self._lock:
+            return self._frames.setdefault(name, df)
+
+    def __contains__(self, name):
+        return name in self.tables
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def columns(self, name: str):
+        """Column names behind variable `name` (None when unknown), without loading the table."""
+        return self.registry.columns(self.tables[name]) if name in self.tables else None
+
+    def prefetch(self, names):
+        """Concurrently load the registry tables behind the variables among `names`."""
+        wanted = [self.tables[name] for name in names if name in self.tables and name not in self._frames]
+        loaded = self.registry.prefetch(wanted)
+        for name in names:
+            if name in self.tables:
+                self[name]
+        return loaded
+
+
+class LazyScope(dict):
+    """
+    Per-question `exec` namespace layered over a SharedScope, like a ChainMap.
+
+    The dict itself only holds what the question adds (`pd`, `np`, the variables the generated code
+    assigns, `result`); table variables are looked up in `shared` and never deep-copied into it.
+
+    With `protected` (PROTECTED_SCOPE) a table variable is bound to a shallow copy of the shared table.
+    Under pandas copy-on-write that costs no data: the copy shares every column buffer, and pandas copies
+    a column only when the generated code writes to it (`df['Day'] = ...`, `.loc[...] = ...`,
+    `inplace=True`), so the shared table is never modified and only written columns are duplicated.
+    Unknown names raise KeyError so `exec` falls back to builtins.
+    """
+
+    def __init__(self, shared: SharedScope, protected: bool = PROTECTED_SCOPE, **values):
+        super().__init__(**values)
+        self.shared = shared
+        self.protected = protected
+
+    def __missing__(self, key):
+        if key not in self.shared:
+            raise KeyError(key)
+        df = self.shared[key]
+        if not self.protected or df is None:
+            return df
+        view = df.copy(deep=False)
+        self[key] = view  # later lookups in the same question see its own writes
+        return view
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.shared
+
+    def names(self) -> set:
+        """Every name the generated code can read from this scope."""
+        return set(dict.keys(self)) | set(self.shared)
+
+    def columns(self, name: str):
+        return self.shared.columns(name)
+
+    def prefetch(self, names):
+        """Concurrently load the registry tables behind the table variables among `names`."""
+        return self.shared.prefetch([name for name in names if not dict.__contains__(self, name)])
+
+
+# Declarative dtype plan for the fact tables, keyed by table name without the AGGR_{MONTHLY|WEEKLY}_ prefix.
+#   category: low-cardinality strings, read straight into pandas categoricals (Arrow dictionary encoding)
+#   code:     identifiers - smallest integer type when numeric, categorical when stored as strings
+#   count:    int32 when every value is integral (left as float otherwise); int32 keeps products of counts safe
+#   price:    float32. Totals such as Sales_NIS / Gross stay float64 so sums over millions of rows keep their precision
+DTYPE_PLAN = {
+    "DW_CHP": {
+        "BARCODE": "code",
+        "CHAIN": "category",
+        "SELLOUT_DESCRIPTION": "category",
+        "AVG_PRICE": "price",
+        "AVG_SELLOUT_PRICE": "price",
+        "NUMBER_OF_STORES": "count",
+    },
+    "DW_FACT_STORENEXT_BY_INDUSTRIES_SALES": {
+        "Barcode": "code",
+        "Format_Name": "category",
+        "Sales_Units": "count",
+        "Price_Per_Unit": "price",
+    },
+    "DW_INVOICES": {
+        "SALES_ORGANIZATION_CODE": "category",
+        "MATERIAL_CODE": "code",
+        "INDUSTRY_CODE": "code",
+        "CUSTOMER_CODE": "code",
+        "Units": "count",
+    },
+}
+DTYPE_PLAN_ENABLED = os.getenv("DATAFRAME_DTYPE_PLAN", "true").lower() != "false"
+# Dimension tables are deduplicated on their primary key once at load time
+PRIMARY_KEYS = {
+    "DW_DIM_CUSTOMERS": "CUSTOMER_CODE",
+    "DW_DIM_MATERIAL": "MATERIAL_NUMBER",
+}
+
+
+def dtype_plan_for(table_name: str) -> dict:
+    """Return the dtype plan of a table (monthly and weekly aggregates share one plan)."""
+    for prefix in ("AGGR_MONTHLY_", "AGGR_WEEKLY_"):
+        if table_name.startswith(prefix):
+            table_name = table_name[len(prefix):]
+    return DTYPE_PLAN.get(table_name, {})
+
+
+def dictionary_columns(file_path: str, plan: dict) -> list:
+    """Planned columns to decode as Arrow dictionaries (categoricals) instead of object strings."""
+    schema = pq.read_schema(file_path)
+    columns = []
+    for col, kind in plan.items():
+        if col not in schema.names:
+            continue
+        if kind == "category" or (kind == "code" and (pa.types.is_string(schema.field(col).type) or pa.types.is_large_string(schema.field(col).type))):
+            columns.append(col)
+    return columns
+
+
+def object_column_bytes(column: pd.Series) -> int:
+    """What `memory_usage(deep=True)` reports for `column` held as object strings."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        counts = np.bincount(column.cat.codes[column.cat.codes >= 0], minlength=len(column.cat.categories))
+        sizes = np.array([sys.getsizeof(v) for v in column.cat.categories], dtype=np.int64)
+        return int(column.size * 8 + counts @ sizes)
+    return int(column.memory_usage(deep=True, index=False))
+
+
+def apply_dtype_plan(df: pd.DataFrame, plan: dict) -> dict:
+    """Downcast the planned numeric columns of `df` in place; returns {column: (bytes_before, bytes_after)}."""
+    sizes = {}
+    for col, kind in plan.items():
+        if col not in df.columns:
+            continue
+        before = object_column_bytes(df[col])
+        if kind == "price":
+            df[col] = df[col].astype(np.float32)
+        elif kind == "count":
+            values = df[col]
+            if values.notna().all() and (values % 1 == 0).all() and values.abs().max() < np.iinfo(np.int32).max:
+                df[col] = values.astype(np.int32)
+        elif kind == "code" and pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif kind in ("category", "code") and df[col].dtype == object:
+            df[col] = df[col].astype("category")
+        sizes[col] = (before, int(df[col].memory_usage(deep=True, index=False)))
+    return sizes
 
 
 def read_parquet_file(file_path):
-    """Helper function to read a parquet file."""
+    """Helper function to read a parquet file (applying the table's dtype plan)."""
     try:
-        df = pd.read_parquet(file_path, engine="pyarrow")
+        table_name = os.path.basename(file_path).replace(".parquet", "")
+        plan = dtype_plan_for(table_name) if DTYPE_PLAN_ENABLED else {}
+        read_dictionary = dictionary_columns(file_path, plan) if plan else None
+
+        df = pd.read_parquet(file_path, engine="pyarrow", read_dictionary=read_dictionary)
         for col in ['Day', 'DATE']:
             if col in df.columns:
                 df[col] = pd.to_datetime(df[col], errors='coerce')
+
+        if table_name in PRIMARY_KEYS and PRIMARY_KEYS[table_name] in df.columns:
+            df = df.drop_duplicates(subset=[PRIMARY_KEYS[table_name]]).reset_index(drop=True)
+
+        if plan:
+            sizes = apply_dtype_plan(df, plan)
+            before = sum(b for b, _ in sizes.values())
+            after = sum(a for _, a in sizes.values())
+            print(f"[INFO] dtype plan {table_name}: {before / 2**20:,.1f} MB -> {after / 2**20:,.1f} MB "
+                  f"(saved {(before - after) / 2**20:,.1f} MB over {len(sizes)} columns)")
         return df
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
         return None
 
+# Monthly rollup of the weekly fact tables, keyed like DTYPE_PLAN. Every column must be the date, a group key,
+# a measure or a ratio; a column the plan does not know fails the rollup instead of silently becoming a key.
+# Each row of the weekly table is assigned to the month of its date (weeks that span two months count
+# towards the month they start in). Ratios are recomputed from the summed columns.
+# SELLOUT_DESCRIPTION is a key so each promotion keeps its own averaged sellout price.
+ROLLUP_PLAN = {
+    "DW_CHP": {
+        "date": "DATE",
+        "keys": ["BARCODE", "CHAIN", "SELLOUT_DESCRIPTION"],
+        "measures": {"AVG_PRICE": "mean", "AVG_SELLOUT_PRICE": "mean", "NUMBER_OF_STORES": "max"},
+    },
+    "DW_FACT_STORENEXT_BY_INDUSTRIES_SALES": {
+        "date": "Day",
+        "keys": ["Barcode", "Format_Name"],
+        "measures": {"Sales_NIS": "sum", "Sales_Units": "sum"},
+        "ratios": {"Price_Per_Unit": ("Sales_NIS", "Sales_Units")},
+    },
+    "DW_INVOICES": {
+        "date": "DATE",
+        "keys": ["SALES_ORGANIZATION_CODE", "MATERIAL_CODE", "INDUSTRY_CODE", "CUSTOMER_CODE"],
+        "measures": {"Gross": "sum", "Net": "sum", "Net VAT": "sum", "Gross VAT": "sum", "Units": "sum"},
+    },
+}
+
+
+def rollup_to_monthly(weekly: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    """Aggregate a weekly fact table to monthly rows with one vectorized groupby (see ROLLUP_PLAN)."""
+    for prefix in ("AGGR_MONTHLY_", "AGGR_WEEKLY_"):
+        if table_name.startswith(prefix):
+            table_name = table_name[len(prefix):]
+    plan = ROLLUP_PLAN[table_name]
+    date = plan["date"]
+    measures = {col: how for col, how in plan["measures"].items() if col in weekly.columns}
+    ratios = {col: parts for col, parts in plan.get("ratios", {}).items() if col in weekly.columns}
+    keys = [col for col in plan["keys"] if col in weekly.columns]
+    unknown = [col for col in weekly.columns if col != date and col not in keys and col not in measures and col not in ratios]
+    if unknown:
+        raise ValueError(f"Columns {unknown} of {table_name} are not in ROLLUP_PLAN; add them as keys or measures")
+
+    month = pd.Series(weekly[date].to_numpy(dtype="datetime64[M]").astype("datetime64[ns]"), index=weekly.index, name=date)
+    grouped = weekly[list(measures)].groupby([month] + [weekly[col] for col in keys], observed=True, dropna=False, sort=False)
+    monthly = grouped.agg(measures).reset_index()
+
+    for col, how in measures.items():
+        if how != "sum" and pd.api.types.is_numeric_dtype(weekly[col]):
+            monthly[col] = monthly[col].astype(weekly[col].dtype)
+    for col, (numerator, denominator) in ratios.items():
+        monthly[col] = (monthly[numerator] / monthly[denominator].where(monthly[denominator] != 0)).astype(weekly[col].dtype)
+    return monthly[list(weekly.columns)]
+
+
+# Pre-joined analytical views, keyed by view name without the VIEW_{MONTHLY|WEEKLY}_ prefix: the fact table
+# (keyed like DTYPE_PLAN) and its (dimension table, fact key, dimension key) lookups. Each view is the fact
+# table left-joined with its dimensions; dimension columns already in the view are not added again.
+JOINED_VIEWS = {
+    "STNX_SALES_ITEMS": {
+        "fact": "DW_FACT_STORENEXT_BY_INDUSTRIES_SALES",
+        "joins": [("DW_DIM_STORENEXT_BY_INDUSTRIES_ITEMS", "Barcode", "Barcode")],
+    },
+    "INVOICES_ENRICHED": {
+        "fact": "DW_INVOICES",
+        "joins": [
+            ("DW_DIM_MATERIAL", "MATERIAL_CODE", "MATERIAL_NUMBER"),
+            ("DW_DIM_CUSTOMERS", "CUSTOMER_CODE", "CUSTOMER_CODE"),
+            ("DW_DIM_INDUSTRIES", "INDUSTRY_CODE", "INDUSTRY_CODE"),
+        ],
+    },
+}
+# {view table: (fact table, joins)} for both aggregation levels
+JOINED_VIEW_TABLES = {
+    f"VIEW_{level}_{name}": (f"AGGR_{level}_{spec['fact']}", spec["joins"])
+    for level in ("MONTHLY", "WEEKLY") for name, spec in JOINED_VIEWS.items()
+}
+
+
+def key_index(values):
+    """
+    Join keys in a comparable form. Returns (keys, valid): `valid` marks the non-missing input values and
+    `keys` holds those values - integral codes as int64 (also when stored as strings or as floats next to
+    missing values), other numbers as float64, anything else as stripped strings.
+    """
+    index = pd.Index(values)
+    valid = ~np.asarray(index.isna())
+    index = index[valid]
+    if not pd.api.types.is_numeric_dtype(index.dtype):
+        index = pd.Index(index.astype(str).str.strip())
+        numbers = pd.to_numeric(index, errors="coerce")
+        if not numbers.isna().any():
+            index = pd.Index(numbers)
+    if pd.api.types.is_numeric_dtype(index.dtype):
+        return index.astype(np.int64 if (index % 1 == 0).all() else np.float64), valid
+    return pd.Index(index.astype(str)), valid
+
+
+def lookup_positions(fact_keys: pd.Series, dim_keys: pd.Series) -> np.ndarray:
+    """
+    Row of `dim_keys` matching each fact key (-1 when there is none, or the key is missing), i.e. a left join
+    on a unique key. Categorical fact keys are matched once per category; duplicate dimension keys resolve to
+    their first row.
+    """
+    categorical = isinstance(fact_keys.dtype, pd.CategoricalDtype)
+    left, left_valid = key_index(fact_keys.cat.categories if categorical else fact_keys)
+    right, right_valid = key_index(dim_keys)
+    if left.dtype != right.dtype:
+        numeric = pd.api.types.is_numeric_dtype(left.dtype) and pd.api.types.is_numeric_dtype(right.dtype)
+        left, right = (left.astype(np.float64), right.astype(np.float64)) if numeric else (left.astype(str), right.astype(str))
+
+    first = ~right.duplicated()
+    rows = np.flatnonzero(right_valid)[first]
+    found = right[first].get_indexer(left)
+    positions = np.full(left_valid.size, -1, dtype=np.int64)
+    if rows.size:
+        positions[left_valid] = np.where(found >= 0, rows[np.maximum(found, 0)], -1)
+    if categorical:
+        codes = fact_keys.cat.codes.to_numpy()
+        positions = np.where(codes >= 0, positions[codes], -1)
+    return positions
+
+
+def take_column(column: pd.Series, positions: np.ndarray):
+    """
+    The values of a dimension column at `positions` (-1 gives a missing value). Text columns come back as
+    categoricals sharing the dimension's categories, so each view row costs only a small integer code.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(column.dtype):
+        column = column.astype("category")
+        codes = column.cat.codes.to_numpy()
+        codes = np.where(positions >= 0, codes[np.maximum(positions, 0)], -1).astype(codes.dtype)
+        return pd.Categorical.from_codes(codes, dtype=column.dtype)
+    return pd.api.extensions.take(column.array, positions, allow_fill=True)
+
+
+def build_joined_view(fact: pd.DataFrame, dims) -> pd.DataFrame:
+    """
+    Left-join `fact` with `dims` ([(dimension DataFrame, fact key, dimension key)]) without copying the fact
+    columns: the view is a shallow copy of `fact` plus the looked-up dimension columns (see take_column).
+    """
+    if fact is None or any(dim is None for dim, _, _ in dims):
+        return None
+    t0 = time.time()
+    view = fact.copy(deep=False)
+    added = 0
+    for dim, fact_key, dim_key in dims:
+        positions = lookup_positions(view[fact_key], dim[dim_key])
+        for col in dim.columns:
+            if col != dim_key and col not in view.columns:
+                view[col] = take_column(dim[col], positions)
+                added += view[col].memory_usage(index=False)
+        print(f"[INFO] Joined view: {(positions >= 0).mean():.1%} of {fact_key} values matched {dim_key}")
+    print(f"[INFO] Joined view built in {time.time() - t0:.2f}s ({added / 2**20:,.1f} MB on top of the fact table)")
+    return view
+
+
+def view_columns(dataframes: TableRegistry, fact_table: str, joins):
+    """Column names of a joined view from the schemas of its tables, None when one is unknown."""
+    columns = dataframes.columns(fact_table)
+    if columns is None:
+        return None
+    columns = list(columns)
+    for dim_table, _, dim_key in joins:
+        dim_columns = dataframes.columns(dim_table)
+        if dim_columns is None:
+            return None
+        columns += [col for col in dim_columns if col != dim_key and col not in columns]
+    return columns
+
+
+def register_joined_views(dataframes: TableRegistry):
+    """
+    Register the JOINED_VIEWS whose fact and dimension tables the registry has. Like every registry table
+    a view is built once, on first use, and shared by every session of the data snapshot.
+    """
+    for name, (fact_table, joins) in JOINED_VIEW_TABLES.items():
+        if name in dataframes or fact_table not in dataframes or any(dim not in dataframes for dim, _, _ in joins):
+            continue
+        dataframes.register(
+            name,
+            lambda fact_table=fact_table, joins=joins: build_joined_view(
+                dataframes[fact_table], [(dataframes[dim], fact_key, dim_key) for dim, fact_key, dim_key in joins]
+            ),
+            columns=lambda fact_table=fact_table, joins=joins: view_columns(dataframes, fact_table, joins),
+        )
+    return dataframes
+
+
+def fetch_data_file(parquet_dir: str, file_name: str) -> str:
+    """Path of a data file, downloading it from the blob container first in production when it is missing."""
+    path = os.path.join(parquet_dir, file_name)
+    if not os.path.exists(path) and os.getenv("RUNNING_IN_PRODUCTION") == "true":
+        from startup_load_data import container_client, download_to_path
+        t0 = time.time()
+        download_to_path(container_client.get_blob_client(file_name), path)
+        print(f"[INFO] Downloaded {file_name} on demand in {time.time() - t0:.1f}s")
+    return path
+
+
+def register_aggregation_tables(dataframes: TableRegistry, parquet_dir: str, fetch: bool = True):
+    """
+    Register the catalog fact tables the registry does not have yet, to be loaded once per process on
+    first use: weekly tables are read from their file (downloaded on demand in production when `fetch`
+    is set), and a monthly table without a file of its own is rolled up from its weekly table.
+    """
+    fetch = fetch and os.getenv("RUNNING_IN_PRODUCTION") == "true"
+    entries = load_catalog(parquet_dir).select(("table",))
+    for entry in entries:
+        path = os.path.join(parquet_dir, entry["file"])
+        if entry.get("aggregation") == "weekly" and entry["table"] not in dataframes and (fetch or os.path.exists(path)):
+            dataframes.register(
+                entry["table"],
+                lambda file_name=entry["file"]: read_parquet_file(fetch_data_file(parquet_dir, file_name)),
+                columns=(lambda path=path: pq.read_schema(path).names) if os.path.exists(path) else None,
+            )
+
+    for entry in entries:
+        weekly = entry["table"].replace("AGGR_MONTHLY_", "AGGR_WEEKLY_")
+        if entry.get("aggregation") == "monthly" and entry["table"] not in dataframes and weekly in dataframes:
+            dataframes.register(
+                entry["table"],
+                lambda table=entry["table"], weekly=weekly: rollup_to_monthly(dataframes[weekly], table),
+                columns=lambda weekly=weekly: dataframes.columns(weekly),
+            )
+    return dataframes
+
+def build_table_registry(parquet_dir: str, fetch: bool = True) -> TableRegistry:
+    """
+    Register the catalog tables present in `parquet_dir` (active aggregation levels), the other
+    aggregation level on demand (see register_aggregation_tables), the derived date table and the joined views.
+    """
+    dataframes = TableRegistry()
+    for file_name in load_catalog(parquet_dir).table_files().values():
+        path = os.path.join(parquet_dir, file_name)
+        if os.path.exists(path):
+            dataframes.register_parquet(path)
+    register_aggregation_tables(dataframes, parquet_dir, fetch=fetch)
+
+    # Date table, derived from the sales date range when it is first needed
+    sales_table = next((t for t in ('AGGR_MONTHLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES', 'AGGR_WEEKLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES') if t in dataframes), None)
+    if sales_table is not None:
+        def load_date_table():
+            days = dataframes[sales_table]['Day']
+            return DataLoader().create_date_dataframe(days.min(), days.max())
+        dataframes.register('DATE_HOLIAY_DATA', load_date_table)
+    register_joined_views(dataframes)
+    return dataframes
+
+def open_table_registry(parquet_dir: str, snapshot=None) -> TableRegistry:
+    """
+    Register the tables of `parquet_dir`, from the prepared snapshot when one matches; tables load on first access.
+    `snapshot` is an already opened (bundle, matrix) pair; by default the process-wide one is used.
+    """
+    bundle, _ = snapshot if snapshot is not None else load_prepared_snapshot(parquet_dir)
+    if bundle is None:
+        return build_table_registry(parquet_dir)
+
+    dataframes = TableRegistry()
+    for name in bundle.tables:
+        if name != SNAPSHOT_ENTITY_TABLE:
+            dataframes.register(name, lambda name=name: bundle.read_table(name), columns=lambda name=name: bundle.read_schema(name).names)
+    register_aggregation_tables(dataframes, parquet_dir)
+    register_joined_views(dataframes)
+    dataframes.snapshot = bundle
+    dataframes.identity = bundle.manifest["fingerprint"]
+    return dataframes
+
 @st.cache_resource
 def load_data_with_progress(parquet_dir: str):
-    """Load parquet files with Streamlit progress bar (excluding vector_database.parquet)."""
-    EXCLUDED_PARQUETS = {
-    "vector_database.parquet",
-    "stnx_entities_meta.parquet",
-    "chp_entities_meta.parquet",
-    "customer_entities_meta.parquet",
-    "AGGR_WEEKLY_DW_CHP.parquet",
-    "AGGR_WEEKLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES.parquet",
-    "AGGR_WEEKLY_DW_INVOICES.parquet"
-    }
-
-    dataframes = {}
-    files = [f for f in os.listdir(parquet_dir) if f.endswith(".parquet") and f not in EXCLUDED_PARQUETS]
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        futures = {}
-        for file_name in files:
-            file_path = os.path.join(parquet_dir, file_name)
-            futures[file_name] = executor.submit(read_parquet_file, file_path)
-
-        for i, (file_name, future) in enumerate(futures.items()):
-            df = future.result()
-            if df is not None:
-                key = file_name.replace(".parquet", "")
-                dataframes[key] = df
-
-    # Load date table if needed
-    if 'AGGR_WEEKLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES' in dataframes:
-        loader = DataLoader()
-        start_date = dataframes['AGGR_WEEKLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES']['Day'].min()
-        end_date = dataframes['AGGR_WEEKLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES']['Day'].max()
-        dataframes['DATE_HOLIAY_DATA'] = loader.create_date_dataframe(start_date, end_date)
-
-    st.success("✅ Main data loaded successfully")
-    print(dataframes.keys())
+    """Register the tables of `parquet_dir` once per process (see open_table_registry)."""
+    errors = validate_data_dir(parquet_dir)
+    if errors:
+        st.warning("⚠️ Some data files do not match the catalog: " + "; ".join(errors))
+    dataframes = open_table_registry(parquet_dir)
+    if dataframes.snapshot is not None:
+        st.success("✅ Main data registered from the prepared snapshot")
+    else:
+        st.success("✅ Main data registered, tables load on first use")
+
+    print(list(dataframes.keys()))
     return dataframes
 
-@st.cache_resource
-def load_vector_database(parquet_dir: str):
-    def load_entity_pair(name):
-        meta_path = os.path.join(parquet_dir, f"{name}_meta.parquet")
-        embedding_path = os.path.join(parquet_dir, f"{name}_embedding.npy")
+ENTITY_SOURCES = ("stnx_entities", "chp_entities", "customer_entities")
+SNAPSHOT_ENTITY_TABLE = "entities"
 
-        df = pd.read_parquet(meta_path)
-        embeddings = np.load(embedding_path)
+# Metadata keys tagged onto every entity at load time; they are not part of an entity's content
+ENTITY_TAG_KEYS = ("source_table", "column")
 
-        # ודא שכל embedding הוא np.ndarray
-        df["embedding"] = [np.array(vec, dtype=np.float32) for vec in embeddings]
-        return df
+def entity_row_hash(name, entity_type, metadata) -> str:
+    """Stable hash of an entity row (name, type and non-null metadata without the load-time tags), used to diff entity builds."""
+    meta = {k: v for k, v in metadata.items() if v is not None and k not in ENTITY_TAG_KEYS} if isinstance(metadata, dict) else {}
+    payload = json.dumps([str(name), str(entity_type), meta], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
 
-    stnx_entities = load_entity_pair("stnx_entities")
-    chp_entities = load_entity_pair("chp_entities")
-    customer_entities = load_entity_pair("customer_entities")
+def load_entity_source(parquet_dir: str, name: str, manifest: dict = None, with_hashes: bool = False):
+    """
+    Load one entity source (e.g. "stnx_entities").
 
-    combined_entities = pd.concat([stnx_entities, chp_entities, customer_entities], ignore_index=True)
+    Sources built by build_embeddings.py have a `{name}_manifest.json` listing append-only meta/embedding
+    shards and the content hashes superseded by later shards; otherwise the single
+    `{name}_meta.parquet` / `{name}_embedding.npy` pair is read. A `manifest` dict can be passed instead
+    of reading it from disk, and `with_hashes` guarantees a `content_hash` column.
 
-    def clean_and_tag_metadata(row):
-        meta = row.get("metadata", {})
+    Returns:
+        (meta, embedding_arrays, active_rows): the active meta rows, the memory-mapped embedding shards,
+        and for each meta row its row in the shards stacked end to end.
+    """
+    manifest_path = os.path.join(parquet_dir, f"{name}_manifest.json")
+    if manifest is None and os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    if manifest is None:
+        manifest = {"shards": [{"meta": f"{name}_meta.parquet", "embedding": f"{name}_embedding.npy"}], "superseded": []}
+
+    metas = [pd.read_parquet(os.path.join(parquet_dir, shard["meta"])) for shard in manifest["shards"]]
+    arrays = [np.load(os.path.join(parquet_dir, shard["embedding"]), mmap_mode="r") for shard in manifest["shards"]]
+    meta = pd.concat(metas, ignore_index=True)
+
+    superseded = set(manifest.get("superseded", []))
+    if not superseded and not with_hashes:
+        return meta, arrays, np.arange(len(meta), dtype=np.int64)
+
+    if "content_hash" not in meta:
+        meta["content_hash"] = None
+    missing = meta["content_hash"].isna()
+    if missing.any():
+        # Shards written before content hashes existed (the original meta/embedding pair)
+        meta.loc[missing, "content_hash"] = [
+            entity_row_hash(n, t, m) for n, t, m in zip(meta.loc[missing, "name"], meta.loc[missing, "type"], meta.loc[missing, "metadata"])
+        ]
+
+    active_rows = np.flatnonzero(~meta["content_hash"].isin(superseded).to_numpy())
+    return meta.iloc[active_rows].reset_index(drop=True), arrays, active_rows
+
+def load_quantized_matrix(parquet_dir: str, storage: str, content_hash: str = None):
+    """
+    Open the quantized entity matrix read-only with mmap, so its pages are shared by every worker process.
+    When `content_hash` is given, a matrix recorded (in QUANTIZED_MANIFEST_FILE) for other entities is skipped.
+
+    Returns:
+        (matrix, scales) or (None, None) when no quantized file matches `storage` ("auto", "int8", "float16").
+    """
+    manifest_path = os.path.join(parquet_dir, QUANTIZED_MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    kinds = ["int8", "float16"] if storage == "auto" else [storage]
+    for kind in kinds:
+        path = os.path.join(parquet_dir, QUANTIZED_MATRIX_FILES.get(kind, ""))
+        if kind in QUANTIZED_MATRIX_FILES and os.path.exists(path):
+            recorded = manifest.get(kind, {}).get("content_hash")
+            if content_hash is not None and recorded != content_hash:
+                print(f"[WARNING] Ignoring stale {kind} matrix {path} (built for entities {recorded}, expected {content_hash})")
+                continue
+            scales = np.load(os.path.join(parquet_dir, QUANTIZED_SCALE_FILE), mmap_mode="r") if kind == "int8" else None
+            return np.load(path, mmap_mode="r"), scales
+    return None, None
+
+def prepare_entities(parquet_dir: str):
+    """
+    Combine the entity sources into one cleaned, brand-collapsed table.
+
+    Returns:
+        (entities, full_rows, source_rows): the entity table, the memory-mapped embedding shards and,
+        for each entity row, its row in those shards.
+    """
+    meta_frames, embedding_arrays, active_rows = [], [], []
+    offset = 0
+    for name in ENTITY_SOURCES:
+        meta, arrays, rows = load_entity_source(parquet_dir, name)
+        meta_frames.append(meta)
+        embedding_arrays.extend(arrays)
+        active_rows.append(rows + offset)
+        offset += sum(a.shape[0] for a in arrays)
+
+    full_rows = ShardedRows(embedding_arrays)
+    active_rows = np.concatenate(active_rows)
+    combined_entities = pd.concat(meta_frames, ignore_index=True)
+
+    def clean_and_tag_metadata(meta, source_table, entity_type):
         if isinstance(meta, dict):
             cleaned_meta = {k: v for k, v in meta.items() if v is not None}
-            cleaned_meta["source_table"] = row.get("source_table")
-            cleaned_meta["column"] = row.get("type")
+            cleaned_meta["source_table"] = source_table
+            cleaned_meta["column"] = entity_type
             return cleaned_meta
         return {}
 
-    combined_entities["metadata"] = combined_entities.apply(clean_and_tag_metadata, axis=1)
+    combined_entities["metadata"] = [
+        clean_and_tag_metadata(meta, source_table, entity_type)
+        for meta, source_table, entity_type in zip(
+            combined_entities["metadata"],
+            combined_entities.get("source_table", pd.Series(None, index=combined_entities.index)),
+            combined_entities["type"],
+        )
+    ]
+
+    # Collapse per-category Brand_Name repeats once here, instead of on every query
+    combined_entities, collapsed_rows = collapse_brands(combined_entities, vectors=lambda rows: full_rows.take(active_rows[rows]))
+    return combined_entities, full_rows, active_rows[collapsed_rows]
+
+def load_entity_index(parquet_dir: str, storage: str = None, snapshot=None) -> EntityIndex:
+    """
+    Load the entity meta/embedding pairs from `parquet_dir` and build the search index.
+
+    `storage` (default: VECTOR_STORAGE env, "auto") selects the scoring matrix: "float32" stacks the
+    `*_embedding.npy` files in memory; "int8" / "float16" / "auto" memory-map the quantized matrix
+    written by build_vector_index.py and fall back to float32 when it is missing or stale (other row count,
+    or another entity content hash).
+    A matching prepared snapshot (prepare_data.py) replaces the preparation with a memory-mapped load;
+    `snapshot` is an already opened (bundle, matrix) pair, by default the process-wide one.
+    """
+    storage = storage or os.getenv("VECTOR_STORAGE", "auto")
+
+    bundle, snapshot_matrix = snapshot if snapshot is not None else load_prepared_snapshot(parquet_dir)
+    if bundle is not None and snapshot_matrix is not None and SNAPSHOT_ENTITY_TABLE in bundle.tables:
+        combined_entities = bundle.read_table(SNAPSHOT_ENTITY_TABLE)
+        combined_entities["metadata"] = [json.loads(meta) for meta in combined_entities["metadata"]]
+        # The snapshot matrix is already collapsed and normalized, so it doubles as the rescoring source
+        full_rows, source_rows, embeddings = ShardedRows([snapshot_matrix]), None, snapshot_matrix
+    else:
+        combined_entities, full_rows, source_rows = prepare_entities(parquet_dir)
+        embeddings = None
+
+    content_hash = entity_content_hash(combined_entities["name"], combined_entities["type"], combined_entities["metadata"])
+    if storage != "float32":
+        matrix, scales = load_quantized_matrix(parquet_dir, storage, content_hash=content_hash)
+        if matrix is not None and matrix.shape[0] == len(combined_entities):
+            print(f"[INFO] Using memory-mapped {matrix.dtype} entity matrix ({matrix.nbytes / 2**20:,.0f} MB on disk)")
+            return EntityIndex.from_frame(
+                combined_entities, matrix, scales=scales, full_rows=full_rows, source_rows=source_rows, normalized=True,
+                content_hash=content_hash,
+            )
+        if matrix is not None:
+            print(f"[WARNING] Ignoring stale quantized matrix ({matrix.shape[0]} rows, {len(combined_entities)} entities)")
+
+    if embeddings is not None:
+        return EntityIndex.from_frame(combined_entities, embeddings, normalized=True, content_hash=content_hash)
+    embeddings = full_rows.take(source_rows)
+    return EntityIndex.from_frame(combined_entities, embeddings, content_hash=content_hash)
+
+def open_prepared_snapshot(parquet_dir: str):
+    """
+    Open the prepared snapshot of `parquet_dir`; (None, None) when it is missing or stale.
+    With SHARED_DATA_PLANE=true the snapshot comes from the instance-wide data plane instead, which
+    publishes it on first use, so every worker process maps the same files.
+    """
+    t0 = time.time()
+    bundle, matrix = None, None
+    if SHARED_DATA_PLANE:
+        try:
+            bundle, matrix, generation = DataPlane(parquet_dir).attach()
+            bundle.generation = generation
+        except Exception as e:
+            print(f"[WARNING] Shared data plane unavailable, loading in-process: {e}")
+    if bundle is None:
+        bundle, matrix = open_snapshot(parquet_dir)
+    if bundle is not None:
+        print(f"[INFO] Prepared snapshot {bundle.manifest['fingerprint'][:12]} mapped in {time.time() - t0:.2f}s "
+              f"({len(bundle.tables)} tables, created {bundle.manifest.get('created')})")
+    return bundle, matrix
+
+@st.cache_resource
+def load_prepared_snapshot(parquet_dir: str):
+    """Open the prepared snapshot once per process (see open_prepared_snapshot)."""
+    return open_prepared_snapshot(parquet_dir)
+
+def data_plane_changed(dataframes, parquet_dir: str) -> bool:
+    """True when the shared data plane has published a generation other than the one `dataframes` maps."""
+    generation = getattr(getattr(dataframes, "snapshot", None), "generation", None)
+    if not SHARED_DATA_PLANE or generation is None:
+        return False
+    return not DataPlane(parquet_dir).is_current(generation)
+
+_reopen_lock = threading.Lock()
+
+def reopen_data_plane(parquet_dir: str):
+    """
+    Drop the cached snapshot, registry and entity index once the data plane has moved on, and load them again
+    from the current generation. Sessions that notice the same change reuse the first session's reload.
+    Returns (dataframes, vector_database).
+    """
+    with _reopen_lock:
+        dataframes = load_data_with_progress(parquet_dir)
+        if data_plane_changed(dataframes, parquet_dir):
+            print(f"[INFO] Data plane generation {dataframes.snapshot.generation} was replaced, reopening")
+            load_prepared_snapshot.clear()
+            load_data_with_progress.clear()
+            load_vector_database.clear()
+            dataframes = load_data_with_progress(parquet_dir)
+        return dataframes, load_vector_database(parquet_dir)
+
+def attach_offline_indexes(vector_database: EntityIndex, parquet_dir: str) -> EntityIndex:
+    """Attach the offline-built IVF / reduced indexes of `parquet_dir` when present (see EntityIndex.first_pass)."""
+    if vector_database.attach_ivf(os.path.join(parquet_dir, IVF_INDEX_FILE)):
+        print(f"[INFO] IVF index attached ({vector_database.ivf.nlist} lists, nprobe={vector_database.ivf.nprobe})")
+    if vector_database.attach_reduced(os.path.join(parquet_dir, REDUCED_MATRIX_FILE), os.path.join(parquet_dir, REDUCED_PROJECTION_FILE)):
+        projection, _ = vector_database.reduced
+        print(f"[INFO] Reduced first pass attached ({projection.kind}, {projection.dim} of {vector_database.dim} dims)")
+    print(f"[INFO] Vector search first pass: {vector_database.first_pass()}")
+    return vector_database
+
+def build_vector_database(parquet_dir: str, snapshot=None):
+    """Build the entity search index, attaching the offline-built IVF / reduced indexes when present."""
+    vector_database = attach_offline_indexes(load_entity_index(parquet_dir, snapshot=snapshot), parquet_dir)
+    vector_database.lexical = LexicalIndex(vector_database.names)
+    print(f"[INFO] Vector database partitions: {vector_database.partition_sizes()}")
+    return vector_database
+
+@st.cache_resource
+def load_vector_database(parquet_dir: str):
+    """Build the entity search index once per process (see build_vector_database)."""
+    vector_database = build_vector_database(parquet_dir)
+    st.success(f"✅ Vector database loaded ({len(vector_database):,} entities)")
+    return vector_database
+
+@st.cache_resource
+def start_data_refresher(parquet_dir: str):
+    """
+    Start the background data refresher once per process, or return None when DATA_REFRESH_INTERVAL is 0.
+    It polls the blob container, or DATA_REFRESH_SOURCE_DIR (a local stand-in) when that is set.
+    """
+    if DATA_REFRESH_INTERVAL <= 0:
+        return None
+
+    source_dir = os.getenv("DATA_REFRESH_SOURCE_DIR")
+    if source_dir:
+        storage = LocalStorage(source_dir)
+    else:
+        from startup_load_data import container_client
+        storage = BlobContainerStorage(container_client)
 
-    if combined_entities is not None:
-        st.success("✅ Vector database loaded")
-    return combined_entities
\ No newline at end of file
+    refresher = DataRefresher(storage, parquet_dir, [CATALOG_FILE] + load_catalog(parquet_dir).files())
+    refresher.check_once()  # baseline etags of the files loaded at startup
+    refresher.start()
+    print(f"[INFO] Data refresher polling every {DATA_REFRESH_INTERVAL}s")
+    return refresher
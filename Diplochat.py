@@ -19,6 +19,7 @@ import os
 import numpy as np
 import tiktoken
 from pyluach import dates  
+from HebrewCalendar import get_hebrew_calendar
 import bcrypt  
 import subprocess
 
@@ -597,15 +598,8 @@ if st.session_state['authentication_status']:
         return dates.GregorianDate(year, month, day).festival(hebrew=True)  
     
     def create_date_dataframe(start_date, end_date):  
-        # Create a DataFrame with the date range  
-        dt_df = pd.DataFrame({'DATE': pd.date_range(start=start_date, end=end_date)})  
-        
-        # Extract Hebrew dates and Jewish holidays  
-        dt_df['HEBREW_DATE'] = dt_df['DATE'].apply(lambda x: gregorian_to_hebrew(x.year, x.month, x.day))  
-        dt_df['HOLIDAY'] = dt_df['DATE'].apply(lambda x: get_jewish_holidays(x.year, x.month, x.day))
-
-        
-        return dt_df  
+        # Slice the precomputed Hebrew calendar instead of converting every day
+        return get_hebrew_calendar().date_range(start_date, end_date)
 
     @st.cache_data(show_spinner="Loading data.. this can take a few minutes, feel free to grab a coffee ☕") 
     def load_data(resolution_type,chp_or_invoices,sales_org):  
@@ -0,0 +1,166 @@
+import os
+import time
+import tempfile
+import threading
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from pyluach import dates
+
+# Bump CALENDAR_VERSION when the derived columns change, so calendars cached by older code are rebuilt
+CALENDAR_VERSION = 2
+CALENDAR_FILE = f"hebrew_calendar_v{CALENDAR_VERSION}.arrow"
+CALENDAR_START_YEAR = int(os.getenv("HEBREW_CALENDAR_START_YEAR", "2000"))
+CALENDAR_END_YEAR = int(os.getenv("HEBREW_CALENDAR_END_YEAR", "2045"))
+# >1 computes the years in a process pool; the default builds in-process
+CALENDAR_PROCESSES = int(os.getenv("HEBREW_CALENDAR_PROCESSES", "0"))
+
+
+def compute_calendar_year(year: int) -> pd.DataFrame:
+    """DATE / HEBREW_DATE / HOLIDAY for every day of a Gregorian year."""
+    days = pd.date_range(f"{year}-01-01", f"{year}-12-31")
+    # One Gregorian -> Hebrew conversion per year, then plain day arithmetic on the Hebrew date
+    first = dates.GregorianDate(year, 1, 1).to_heb()
+    hebrew = [first + offset for offset in range(len(days))]
+    return pd.DataFrame({
+        "DATE": days,
+        "HEBREW_DATE": [d.hebrew_date_string() for d in hebrew],
+        "HOLIDAY": [d.festival(hebrew=True) for d in hebrew],
+    })
+
+
+def add_holiday_features(calendar: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add holiday helper columns to a contiguous calendar:
+    IS_HOLIDAY, IS_HOLIDAY_EVE (the day before a holiday starts), NEXT_HOLIDAY and
+    DAYS_TO_HOLIDAY (0 on a holiday, null after the last holiday in the table).
+    """
+    holiday = calendar["HOLIDAY"]
+    is_holiday = holiday.notna().to_numpy()
+    next_holiday = holiday.shift(-1)
+
+    calendar["IS_HOLIDAY"] = is_holiday
+    # A holiday followed by another festival (Purim -> Shushan Purim, multi-named Sukkot / Pesach days) is not an eve
+    calendar["IS_HOLIDAY_EVE"] = (next_holiday.notna().to_numpy() & ~is_holiday)
+
+    rows = np.arange(len(calendar))
+    holiday_rows = np.flatnonzero(is_holiday)
+    upcoming = np.searchsorted(holiday_rows, rows, side="left")
+    has_next = upcoming < len(holiday_rows)
+    next_rows = holiday_rows[upcoming[has_next]]
+
+    days_to = pd.Series(pd.NA, index=calendar.index, dtype="Int16")
+    days_to[has_next] = next_rows - rows[has_next]
+    next_name = pd.Series(None, index=calendar.index, dtype=object)
+    next_name[has_next] = holiday.to_numpy(dtype=object)[next_rows]
+
+    calendar["DAYS_TO_HOLIDAY"] = days_to
+    calendar["NEXT_HOLIDAY"] = next_name
+    return calendar
+
+
+def build_calendar(start_year: int, end_year: int, processes: int = CALENDAR_PROCESSES) -> pd.DataFrame:
+    """Compute the calendar for [start_year, end_year], optionally one year per worker process."""
+    years = list(range(start_year, end_year + 1))
+    if processes and processes > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            frames = list(executor.map(compute_calendar_year, years))
+    else:
+        frames = [compute_calendar_year(year) for year in years]
+    return add_holiday_features(pd.concat(frames, ignore_index=True))
+
+
+class HebrewCalendar:
+    """
+    Precomputed Hebrew calendar (one row per day) that serves `DATE_HOLIAY_DATA` slices.
+
+    The table is built once for a multi-decade span and stored as an uncompressed Arrow file,
+    which is memory-mapped on later starts. `date_range` slices it with `searchsorted`,
+    so the cost of a request no longer depends on the length of the date span.
+    """
+
+    def __init__(self, table: pd.DataFrame):
+        self.table = table
+        self._dates = table["DATE"].to_numpy(dtype="datetime64[ns]")
+
+    @property
+    def start(self):
+        return pd.Timestamp(self._dates[0])
+
+    @property
+    def end(self):
+        return pd.Timestamp(self._dates[-1])
+
+    def covers(self, start_date, end_date) -> bool:
+        return self.start <= pd.Timestamp(start_date) and pd.Timestamp(end_date) <= self.end
+
+    @classmethod
+    def load(cls, path: str, start_year: int = CALENDAR_START_YEAR, end_year: int = CALENDAR_END_YEAR, processes: int = CALENDAR_PROCESSES):
+        """Open the calendar file at `path`, (re)building it when missing or shorter than the requested span."""
+        if os.path.exists(path):
+            try:
+                calendar = cls(feather.read_table(path, memory_map=True).to_pandas())
+                if calendar.covers(f"{start_year}-01-01", f"{end_year}-12-31"):
+                    return calendar
+                start_year, end_year = min(start_year, calendar.start.year), max(end_year, calendar.end.year)
+            except (OSError, pa.ArrowInvalid, KeyError) as e:
+                print(f"[WARNING] Unreadable Hebrew calendar at {path}, rebuilding: {e}")
+
+        t0 = time.time()
+        calendar = cls(build_calendar(start_year, end_year, processes))
+        try:
+            calendar.save(path)
+        except OSError as e:
+            print(f"[WARNING] Could not save the Hebrew calendar to {path}, keeping it in memory only: {e}")
+        print(f"[INFO] Built Hebrew calendar {start_year}-{end_year} ({len(calendar.table):,} days) in {time.time() - t0:.2f}s")
+        return calendar
+
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        feather.write_feather(self.table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+
+    def date_range(self, start_date, end_date) -> pd.DataFrame:
+        """Return the rows for [start_date, end_date] (inclusive) as a fresh DataFrame."""
+        start_date, end_date = pd.Timestamp(start_date).normalize(), pd.Timestamp(end_date).normalize()
+        if not self.covers(start_date, end_date):
+            # Out-of-span requests are rare; compute the missing years on the fly rather than fail
+            print(f"[WARNING] {start_date.date()}..{end_date.date()} is outside the precomputed calendar, computing it directly")
+            extra = HebrewCalendar(build_calendar(start_date.year, end_date.year, processes=0))
+            return extra.date_range(start_date, end_date)
+
+        lo = np.searchsorted(self._dates, start_date.to_datetime64(), side="left")
+        hi = np.searchsorted(self._dates, end_date.to_datetime64(), side="right")
+        return self.table.iloc[lo:hi].reset_index(drop=True).copy()
+
+
+_default_calendar = None
+_default_calendar_lock = threading.Lock()
+
+
+def get_hebrew_calendar(cache_dir: str = None) -> HebrewCalendar:
+    """Return the process-wide calendar, loading (or building) `CALENDAR_FILE` in `cache_dir` on first use."""
+    global _default_calendar
+    with _default_calendar_lock:
+        if _default_calendar is None:
+            path = os.path.join(cache_dir or tempfile.gettempdir(), CALENDAR_FILE)
+            _default_calendar = HebrewCalendar.load(path)
+        return _default_calendar
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompute the Hebrew calendar file used for DATE_HOLIAY_DATA.")
+    parser.add_argument("--output", default=os.path.join(tempfile.gettempdir(), CALENDAR_FILE))
+    parser.add_argument("--start-year", type=int, default=CALENDAR_START_YEAR)
+    parser.add_argument("--end-year", type=int, default=CALENDAR_END_YEAR)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        os.remove(args.output)
+    HebrewCalendar.load(args.output, args.start_year, args.end_year, args.processes)
@@ -6,12 +6,17 @@ from io import BytesIO
 import matplotlib.pyplot as plt
 from streamlit_elements import elements, mui
 import os
+import time
 from streamlit_navigation_bar import st_navbar
 import json
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 import streamlit as st
 from openai import AzureOpenAI
 from st_bridge import bridge, html
+from Dataloader import LazyScope
+from DataCatalog import DataCatalog
+from CodeAnalysis import CODE_VALIDATION, CodeValidationError, add_observed_to_groupby, referenced_names, validate_code
+from CodeExecutor import RESULT_CACHE_MB, ResultCache, get_code_executor, result_cache, strict_chained_assignment
 
 def load_css():
     st.markdown(
@@ -85,22 +90,84 @@ def load_lottie_file(filepath: str):
 
     return cleaned_code
 
+# aggregation_mode (the Monthly / Weekly buttons) -> catalog aggregation level
+AGGREGATION_LEVELS = {'Monthly': 'monthly', 'Weekly': 'weekly'}
+# aggregation level -> exec variable -> table name; the variables and tables come from the data catalog
+SCOPE_TABLES = {level: DataCatalog.default().scope_tables(level) for level in AGGREGATION_LEVELS.values()}
+# aggregation level -> its fact tables; a level is usable when all of them are registered
+FACT_TABLES = {
+    level: [entry['table'] for entry in DataCatalog.default().select(('table',), [level]) if entry.get('aggregation') == level]
+    for level in AGGREGATION_LEVELS.values()
+}
+
+def get_aggregation_level():
+    """Catalog aggregation level of the session's aggregation_mode (monthly until the user picks one)."""
+    return AGGREGATION_LEVELS.get(st.session_state.get("aggregation_mode"), 'monthly')
+
 def get_local_scope():
+    """
+    Return the exec namespace: a fresh overlay for the question's own variables over the shared, read-only
+    table bindings of the data snapshot (built once per snapshot and aggregation level, see SharedScope).
+    Tables are loaded when the generated code first references them. The fact variables (`chp`, `inv_df`,
+    `stnx_sales`) and the pre-joined views (`stnx_sales_items`, `inv_enriched`) are bound to the tables of the
+    session's aggregation level, so switching levels copies nothing.
+    """
     dataframes = st.session_state['Dataframes']
-    scope = {
-            'chp': dataframes.get('AGGR_MONTHLY_DW_CHP'),
-            'inv_df': dataframes.get('AGGR_MONTHLY_DW_INVOICES'),
-            'stnx_sales': dataframes.get('AGGR_MONTHLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES'),
-            'stnx_items': dataframes.get('DW_DIM_STORENEXT_BY_INDUSTRIES_ITEMS'),
-            'customer_df': dataframes.get('DW_DIM_CUSTOMERS', pd.DataFrame()).drop_duplicates(subset=['CUSTOMER_CODE']),
-            'industry_df': dataframes.get('DW_DIM_INDUSTRIES'),
-            'material_df': dataframes.get('DW_DIM_MATERIAL', pd.DataFrame()).drop_duplicates(subset=['MATERIAL_NUMBER']),
-            'dt_df': dataframes.get('DATE_HOLIAY_DATA')
-        }
+    level = get_aggregation_level()
+    if any(table not in dataframes for table in FACT_TABLES[level]):
+        st.warning(f"⚠️ {level.capitalize()} data is not available, using monthly data")
+        level = 'monthly'
+    tables = {name: table for name, table in SCOPE_TABLES[level].items() if table in dataframes}
+    scope = LazyScope(dataframes.shared_scope(tables))
     st.session_state['local_scope'] = scope
+    st.session_state['last_scope_mode'] = level
     st.session_state['local_scope'].update({'pd':pd,'np':np,'base64':base64,'BytesIO':BytesIO,'plt':plt})
     return st.session_state['local_scope']
 
+def run_generated_code(code, local_scope):
+    """
+    Run generated code and return its `result`: in a worker of the executor pool (timeout and memory cap,
+    see CodeExecutor), or inline in `local_scope` when the pool is disabled.
+    Code is validated against the scope and the table schemas first; problems raise CodeValidationError
+    without running anything, listing the valid names / columns for the retry.
+    Results are cached per data snapshot and normalized code (see ResultCache); the run's stats, including
+    `cache_hit`, `exec_saved_seconds` and the running `cache_hit_rate`, are kept in st.session_state['LastExecStats'].
+    """
+    if CODE_VALIDATION:
+        issues = validate_code(code, local_scope.names(), local_scope.columns)
+        if issues:
+            raise CodeValidationError(issues)
+    code = add_observed_to_groupby(code)
+    dataframes = st.session_state['Dataframes']
+    tables = local_scope.shared.tables
+
+    cache_key = ResultCache.key(dataframes.identity, tables, code) if RESULT_CACHE_MB > 0 else None
+    cached = result_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        result, saved_seconds = cached
+        stats = {'cache_hit': True, 'exec_saved_seconds': round(saved_seconds, 3)}
+        print(f"[INFO] Result cache hit, saved {saved_seconds:.2f}s ({result_cache.stats()})")
+    else:
+        t0 = time.time()
+        # Only this job's tables are loaded before the first fork; later jobs load theirs on demand (see ExecutorPool.run)
+        pool = get_code_executor(dataframes, warm_tables=[tables[name] for name in referenced_names(code) if name in tables])
+        if pool is None:
+            local_scope.prefetch(referenced_names(code))
+            with strict_chained_assignment():
+                exec(code, {}, local_scope)
+            result, stats = dict.get(local_scope, "result"), {}
+        else:
+            result, stats = pool.run(code, tables)
+        exec_seconds = time.time() - t0
+        if cache_key and result is not None:
+            result_cache.put(cache_key, result, exec_seconds)
+        stats = dict(stats, cache_hit=False, exec_saved_seconds=0.0)
+
+    local_scope['result'] = result
+    stats['cache_hit_rate'] = result_cache.stats()['hit_rate']
+    st.session_state['LastExecStats'] = stats
+    return "⚠️ לא נמצאה תשובה." if result is None else result
+
 def create_aggregation_option():
     
     def set_aggregation_mode(value):
@@ -195,7 +262,26 @@ def get_sql_engine():
         f"{db_password}@diplomat-analytics-server.database.windows.net/"
         "Diplochat-DB?driver=ODBC+Driver+17+for+SQL+Server&charset=utf8"
     )
-    return create_engine(conn_str, fast_executemany=True)
+    engine = create_engine(conn_str, fast_executemany=True)
+    migrate_logs_table(engine)
+    return engine
+
+# Columns added to the logs table after it was created: (name, SQL Server type)
+LOGS_MIGRATIONS = [("cache_hit", "BIT"), ("exec_saved_seconds", "FLOAT"), ("cache_hit_rate", "FLOAT")]
+
+def migrate_logs_table(engine):
+    """Add the missing LOGS_MIGRATIONS columns to the logs table (idempotent: existing columns are skipped)."""
+    try:
+        with engine.begin() as conn:
+            for column, sql_type in LOGS_MIGRATIONS:
+                conn.execute(text(f"IF COL_LENGTH('logs', '{column}') IS NULL ALTER TABLE logs ADD {column} {sql_type} NULL"))
+    except Exception as e:
+        print(f"[WARNING] Could not migrate the logs table, new log columns are not written: {e}")
+
+@st.cache_resource
+def get_logs_columns():
+    """Columns of the SQL logs table (read once per process, after the migration)."""
+    return {column["name"] for column in inspect(get_sql_engine()).get_columns("logs")}
 
 def write_logs_to_sql(log_df: pd.DataFrame):
 
@@ -205,7 +291,9 @@ def write_logs_to_sql(log_df: pd.DataFrame):
     engine = get_sql_engine()
 
     try:
-        log_df.to_sql("logs", con=engine, if_exists="append", index=False)
+        # Only the columns the table has: rows are never lost to a column the table was not migrated for
+        columns = get_logs_columns()
+        log_df[[col for col in log_df.columns if col in columns]].to_sql("logs", con=engine, if_exists="append", index=False)
         st.session_state["Logs"] = pd.DataFrame(columns=log_df.columns)
         st.session_state["Rating"] = 0
 
@@ -0,0 +1,195 @@
+import os
+import json
+import struct
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+SNAPSHOT_VERSION = 2  # 2: IS_HOLIDAY_EVE no longer set on holidays followed by another festival
+SNAPSHOT_FILE = "prepared_snapshot.arrow"
+SNAPSHOT_MATRIX_FILE = "prepared_entities.npy"
+SNAPSHOT_MAGIC = b"DIPLOSNAPSHOT"
+SNAPSHOT_ALIGNMENT = 64
+# Input files are hashed whole. Their digests are cached next to them per (size, mtime, ctime), so a file is
+# read once when it changes (in practice at prepare time), not at every start
+FILE_DIGEST_CACHE = ".input_digests.json"
+FINGERPRINT_BLOCK_BYTES = 8 << 20
+
+
+def shared_string_dtype():
+    """
+    Arrow-backed string dtype with NaN semantics (comparisons return plain bool, like object columns).
+    String columns then keep pointing into the mapped file instead of becoming per-process Python objects.
+    """
+    try:
+        return pd.StringDtype("pyarrow_numpy")  # pandas 2.1 / 2.2
+    except (ValueError, TypeError):
+        return pd.StringDtype("pyarrow", na_value=np.nan)  # pandas >= 3
+
+
+ARROW_STRING_TYPES = {pa.string(): shared_string_dtype(), pa.large_string(): shared_string_dtype()}
+
+
+def snapshot_inputs(parquet_dir: str) -> list:
+    """
+    Files a snapshot prepared now is derived from (tables, entity shards and manifests). The list is recorded
+    in the snapshot manifest, and only those files are checked later (see inputs_match).
+    """
+    outputs = {SNAPSHOT_FILE, SNAPSHOT_MATRIX_FILE}
+    names = []
+    for name in sorted(os.listdir(parquet_dir)):
+        if name in outputs or name.startswith("entities_"):
+            continue  # snapshot outputs and the offline-built ANN files
+        if name.endswith((".parquet", ".npy")) or name.endswith("_manifest.json"):
+            names.append(name)
+    return names
+
+
+def inputs_match(parquet_dir: str, inputs, fingerprint: str) -> bool:
+    """
+    True when every recorded input of a snapshot still exists in `parquet_dir` and they still hash to
+    `fingerprint`. Files added since (e.g. weekly tables downloaded on demand) are not inputs of that snapshot.
+    """
+    if not inputs or not all(os.path.exists(os.path.join(parquet_dir, name)) for name in inputs):
+        return False
+    return input_fingerprint(parquet_dir, inputs) == fingerprint
+
+
+def file_digest(path: str, cache: dict) -> str:
+    """SHA-1 of the whole file, reused from `cache` ({name: {"stat", "sha1"}}) while the file's stat is unchanged."""
+    stat = os.stat(path)
+    key = [stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns]
+    name = os.path.basename(path)
+    entry = cache.get(name)
+    if entry and entry.get("stat") == key:
+        return entry["sha1"]
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(FINGERPRINT_BLOCK_BYTES), b""):
+            digest.update(block)
+    cache[name] = {"stat": key, "sha1": digest.hexdigest()}
+    return cache[name]["sha1"]
+
+
+def input_fingerprint(parquet_dir: str, names=None) -> str:
+    """Hash of (name, whole-file SHA-1) of every snapshot input (see FILE_DIGEST_CACHE)."""
+    cache_path = os.path.join(parquet_dir, FILE_DIGEST_CACHE)
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    before = json.dumps(cache, sort_keys=True)
+
+    digest = hashlib.sha1(f"v{SNAPSHOT_VERSION}".encode())
+    for name in names if names is not None else snapshot_inputs(parquet_dir):
+        digest.update(f"{name}:{file_digest(os.path.join(parquet_dir, name), cache)}".encode("utf-8"))
+
+    if json.dumps(cache, sort_keys=True) != before:
+        try:
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"[WARNING] Could not cache input file digests in {cache_path}: {e}")
+    return digest.hexdigest()
+
+
+def write_bundle(path: str, tables: dict, manifest: dict):
+    """
+    Write several DataFrames into one file as back-to-back Arrow IPC files.
+
+    Layout: [IPC file per table, 64-byte aligned] [manifest JSON] [u64 manifest length] [magic].
+    The manifest records each table's (offset, length); the file is written to a temp path and renamed.
+    """
+    manifest = dict(manifest, version=SNAPSHOT_VERSION, tables={})
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        for name, df in tables.items():
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            payload = sink.getvalue()
+
+            offset = f.tell()
+            f.write(payload)
+            f.write(b"\0" * (-f.tell() % SNAPSHOT_ALIGNMENT))
+            manifest["tables"][name] = {"offset": offset, "length": payload.size, "rows": table.num_rows}
+
+        encoded = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+        f.write(encoded)
+        f.write(struct.pack("<Q", len(encoded)))
+        f.write(SNAPSHOT_MAGIC)
+    os.replace(tmp_path, path)
+
+
+class SnapshotBundle:
+    """
+    Read side of `write_bundle`: the file is memory-mapped once and each table is decoded on request.
+
+    Arrow buffers point straight into the mapping: numeric / datetime columns without nulls become pandas
+    columns without a copy, and string columns stay Arrow-backed (read-only views of the file pages,
+    shared by every process that maps it).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.generation = None  # shared data plane generation the bundle was mapped from, if any
+        self.source = pa.memory_map(path, "r")
+        # One zero-copy buffer over the whole mapping; slicing it is thread-safe, unlike seek + read
+        self.buffer = self.source.read_buffer()
+        tail = len(SNAPSHOT_MAGIC) + 8
+        footer = self.buffer.slice(self.buffer.size - tail).to_pybytes()
+        if footer[8:] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a prepared snapshot")
+        (manifest_length,) = struct.unpack("<Q", footer[:8])
+        manifest = self.buffer.slice(self.buffer.size - tail - manifest_length, manifest_length)
+        self.manifest = json.loads(manifest.to_pybytes().decode("utf-8"))
+
+    @property
+    def tables(self):
+        return list(self.manifest["tables"])
+
+    def read_arrow(self, name: str) -> pa.Table:
+        entry = self.manifest["tables"][name]
+        return pa.ipc.open_file(self.buffer.slice(entry["offset"], entry["length"])).read_all()
+
+    def read_schema(self, name: str) -> pa.Schema:
+        """The table's schema, read from its IPC footer without decoding any data."""
+        entry = self.manifest["tables"][name]
+        return pa.ipc.open_file(self.buffer.slice(entry["offset"], entry["length"])).schema
+
+    def read_table(self, name: str) -> pd.DataFrame:
+        return self.read_arrow(name).to_pandas(split_blocks=True, zero_copy_only=False, types_mapper=ARROW_STRING_TYPES.get)
+
+
+def open_snapshot(parquet_dir: str, snapshot_dir: str = None):
+    """
+    Return (SnapshotBundle, entity matrix) when a prepared snapshot matching the current input files
+    of `parquet_dir` exists in `snapshot_dir` (default: `parquet_dir`), otherwise (None, None).
+    """
+    snapshot_dir = snapshot_dir or parquet_dir
+    path = os.path.join(snapshot_dir, SNAPSHOT_FILE)
+    if not os.path.exists(path):
+        return None, None
+    try:
+        bundle = SnapshotBundle(path)
+    except (OSError, ValueError, pa.ArrowInvalid) as e:
+        print(f"[WARNING] Ignoring unreadable prepared snapshot {path}: {e}")
+        return None, None
+
+    if bundle.manifest.get("version") != SNAPSHOT_VERSION:
+        print(f"[WARNING] Ignoring prepared snapshot version {bundle.manifest.get('version')} (expected {SNAPSHOT_VERSION})")
+        return None, None
+    if not inputs_match(parquet_dir, bundle.manifest.get("inputs"), bundle.manifest.get("fingerprint")):
+        print("[INFO] Prepared snapshot is stale (input files changed), preparing from the parquet files")
+        return None, None
+
+    matrix_path = os.path.join(snapshot_dir, SNAPSHOT_MATRIX_FILE)
+    matrix = np.load(matrix_path, mmap_mode="r") if os.path.exists(matrix_path) else None
+    return bundle, matrix
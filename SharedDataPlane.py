@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows (local runs)
+    fcntl = None
+    import msvcrt
+
+from PreparedSnapshot import input_fingerprint, inputs_match, open_snapshot, snapshot_inputs
+
+SHARED_DATA_PLANE = os.getenv("SHARED_DATA_PLANE", "false").lower() == "true"
+DATA_PLANE_DIR = os.getenv("SHARED_DATA_DIR", os.path.join(tempfile.gettempdir(), "diplochat_data_plane"))
+POINTER_FILE = "current.json"
+LOCK_FILE = "publish.lock"
+# Generations kept on disk; older ones are removed once unpublished (processes that still map them keep
+# their pages until they let go, since unlinking a mapped file does not invalidate the mapping on Linux)
+KEEP_GENERATIONS = 2
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive inter-process lock on `path` (flock on Linux, msvcrt on Windows for local runs)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class DataPlane:
+    """
+    Instance-wide data plane shared by every worker process.
+
+    One process (whichever takes the publish lock first) prepares the snapshot of `parquet_dir` into a new
+    `gen-NNNNNN` directory under `root` and atomically points `current.json` at it. Every worker then
+    memory-maps that generation's Arrow bundle and entity matrix read-only, so table buffers and the
+    matrix exist once in the page cache however many workers attach. A new generation is published when
+    the input files change; workers compare `generation` with `current()` to notice the swap.
+    """
+
+    def __init__(self, parquet_dir: str, root: str = DATA_PLANE_DIR, keep: int = KEEP_GENERATIONS):
+        self.parquet_dir = parquet_dir
+        self.root = root
+        self.keep = keep
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def pointer_path(self):
+        return os.path.join(self.root, POINTER_FILE)
+
+    def current(self):
+        """The published pointer ({generation, fingerprint, path}), or None."""
+        try:
+            with open(self.pointer_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def publish(self, fingerprint: str, inputs) -> dict:
+        """Prepare a new generation from the input files and make it current. Call with the publish lock held."""
+        from prepare_data import prepare_data
+
+        previous = self.current()
+        generation = (previous["generation"] if previous else 0) + 1
+        path = os.path.join(self.root, f"gen-{generation:06d}")
+        os.makedirs(path, exist_ok=True)
+
+        t0 = time.time()
+        prepare_data(self.parquet_dir, output_dir=path, extra_manifest={"generation": generation})
+        pointer = {"generation": generation, "fingerprint": fingerprint, "inputs": inputs, "path": path, "published": time.time()}
+
+        tmp_path = f"{self.pointer_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(pointer, f)
+        os.replace(tmp_path, self.pointer_path)
+        print(f"[SUCCESS] Published data plane generation {generation} in {time.time() - t0:.1f}s ({path})")
+
+        self.collect_garbage(generation)
+        return pointer
+
+    def collect_garbage(self, current_generation: int):
+        for name in sorted(os.listdir(self.root)):
+            if name.startswith("gen-") and int(name[4:]) <= current_generation - self.keep:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def attach(self):
+        """
+        Map the current generation, publishing one first when none matches the input files.
+
+        Returns:
+            (SnapshotBundle, entity matrix, generation)
+        """
+        pointer = self.current()
+        if not self.matches(pointer):
+            with file_lock(os.path.join(self.root, LOCK_FILE)):
+                # Another worker may have published while this one waited for the lock
+                pointer = self.current()
+                if not self.matches(pointer):
+                    inputs = snapshot_inputs(self.parquet_dir)
+                    pointer = self.publish(input_fingerprint(self.parquet_dir, inputs), inputs)
+
+        bundle, matrix = open_snapshot(self.parquet_dir, snapshot_dir=pointer["path"])
+        if bundle is None:
+            raise RuntimeError(f"Data plane generation {pointer['generation']} at {pointer['path']} is unreadable")
+        print(f"[INFO] Attached to data plane generation {pointer['generation']} (pid {os.getpid()})")
+        return bundle, matrix, pointer["generation"]
+
+    def matches(self, pointer) -> bool:
+        """True when `pointer` was published from the current content of the input files it records."""
+        return pointer is not None and inputs_match(self.parquet_dir, pointer.get("inputs"), pointer["fingerprint"])
+
+    def is_current(self, generation: int) -> bool:
+        pointer = self.current()
+        return pointer is not None and pointer["generation"] == generation
@@ -0,0 +1,613 @@
+import os
+import json
+import hashlib
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+IVF_INDEX_FILE = "entities_ivf.npz"
+QUANTIZED_MATRIX_FILES = {
+    "int8": "entities_q8.npy",
+    "float16": "entities_f16.npy",
+}
+QUANTIZED_SCALE_FILE = "entities_q8_scale.npy"
+# {kind: {"content_hash", "rows", "created"}} of the quantized matrices (see entity_content_hash)
+QUANTIZED_MANIFEST_FILE = "entities_quantized.json"
+REDUCED_MATRIX_FILE = "entities_reduced.npy"
+REDUCED_PROJECTION_FILE = "entities_reduced_projection.npz"
+SCORE_CHUNK_ROWS = 4096
+# First pass of non-exact searches: "auto" (the reduced scan when attached, else IVF, else exact), "reduced", "ivf" or "exact".
+# A configured pass whose index is not attached falls back to "auto".
+VECTOR_FIRST_PASS = os.getenv("VECTOR_FIRST_PASS", "auto").lower()
+
+
+def entity_content_hash(names, types, metadata) -> str:
+    """
+    Content hash of the indexed entities, row by row (name, type, metadata). Entity vectors are embeddings of this
+    content, so offline index files record it and are ignored at load time when it differs (rows replaced or
+    reordered without changing their count). Metadata is dumped like the prepared snapshot stores it.
+    """
+    payload = json.dumps(
+        [[str(n) for n in names], [str(t) for t in types], [meta if isinstance(meta, dict) else {} for meta in metadata]],
+        ensure_ascii=False, sort_keys=True, default=str,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def normalize_rows(matrix):
+    """Return a contiguous float32 copy of `matrix` with every row scaled to unit L2 norm."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_rows(sims, top_k):
+    """Row-wise top-k of a 2D score matrix. Returns (indices, scores), each row sorted by score descending."""
+    top_k = min(top_k, sims.shape[1])
+    if top_k <= 0:
+        empty = (sims.shape[0], 0)
+        return np.empty(empty, dtype=np.int64), np.empty(empty, dtype=np.float32)
+    candidates = np.argpartition(-sims, top_k - 1, axis=1)[:, :top_k]
+    candidate_scores = np.take_along_axis(sims, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1)
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def partition_size(rows):
+    return rows.stop - rows.start if isinstance(rows, slice) else len(rows)
+
+
+def collapse_brands(entities: pd.DataFrame, vectors=None, chunk_rows: int = SCORE_CHUNK_ROWS):
+    """
+    Merge Brand_Name rows, which repeat once per category, into one row per brand name.
+
+    The first occurrence of each brand is kept as its representative vector (brand rows embed the brand
+    name, so the repeats share it). Its metadata becomes the merged brand metadata:
+    {"categories": [...], "source_table": ..., "column": ...}, with the source fields taken from the
+    last repeat. Non-brand rows are kept unchanged.
+
+    `vectors(rows)` (the embeddings of `entities` rows) checks that assumption: a repeat whose vector differs
+    from its representative's is kept as a row of its own (with the merged metadata), so the brand is still
+    scored as the max over its distinct vectors (see EntityIndex.brand_repeats).
+
+    Returns:
+        (collapsed_entities, source_rows): the collapsed table and, for each of its rows, the row of `entities`
+        (and therefore of the `*_embedding.npy` files) it was taken from.
+    """
+    is_brand = (entities["type"] == "Brand_Name").to_numpy()
+    brands = entities.loc[is_brand]
+    if brands.empty:
+        return entities.reset_index(drop=True), np.arange(len(entities), dtype=np.int64)
+
+    merged_metadata = {}
+    for name, meta in zip(brands["name"], brands["metadata"]):
+        meta = meta if isinstance(meta, dict) else {}
+        merged = merged_metadata.setdefault(name, {"categories": [], "source_table": None, "column": None})
+        category = meta.get("Category_Name")
+        if category and category not in merged["categories"]:
+            merged["categories"].append(category)
+        merged["source_table"] = meta.get("source_table")
+        merged["column"] = meta.get("column")
+
+    brand_names = entities["name"].where(is_brand)
+    repeats = brand_names.duplicated().to_numpy() & is_brand
+    keep = ~repeats
+    if vectors is not None and repeats.any():
+        repeat_rows = np.flatnonzero(repeats)
+        first_rows = pd.Series(np.arange(len(entities)), index=entities.index).groupby(brand_names).transform("first").to_numpy()
+        differs = np.zeros(repeat_rows.size, dtype=bool)
+        for start in range(0, repeat_rows.size, chunk_rows):
+            chunk = repeat_rows[start:start + chunk_rows]
+            differs[start:start + chunk_rows] = ~np.isclose(vectors(chunk), vectors(first_rows[chunk].astype(np.int64)), atol=1e-6).all(axis=1)
+        if differs.any():
+            keep[repeat_rows[differs]] = True
+            diverging = entities["name"].to_numpy()[repeat_rows[differs]]
+            print(f"[WARNING] {differs.sum()} Brand_Name repeats of {len(set(diverging))} brands have their own vectors; "
+                  f"kept uncollapsed (e.g. {list(dict.fromkeys(diverging))[:5]})")
+    source_rows = np.flatnonzero(keep)
+
+    collapsed = entities.iloc[source_rows].reset_index(drop=True)
+    kept_brand = is_brand[source_rows]
+    collapsed.loc[kept_brand, "metadata"] = pd.Series(
+        [merged_metadata[name] for name in collapsed.loc[kept_brand, "name"]], index=collapsed.index[kept_brand], dtype=object
+    )
+    return collapsed, source_rows
+
+
+def quantize_int8(matrix):
+    """Symmetric per-row int8 quantization of L2-normalized rows. Returns (codes, scales) with row ≈ codes * scale."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class ShardedRows:
+    """Read-only row access across several (usually memory-mapped) matrices stacked end to end, without copying them."""
+
+    def __init__(self, arrays):
+        self.arrays = list(arrays)
+        self.offsets = np.cumsum([0] + [a.shape[0] for a in self.arrays])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def dim(self):
+        return self.arrays[0].shape[1]
+
+    def take(self, rows):
+        """Gather global `rows` into a new float32 matrix."""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((rows.shape[0], self.dim), dtype=np.float32)
+        shard_of_row = np.searchsorted(self.offsets, rows, side="right") - 1
+        for shard in np.unique(shard_of_row):
+            mask = shard_of_row == shard
+            out[mask] = self.arrays[shard][rows[mask] - self.offsets[shard]]
+        return out
+
+
+class ReducedProjection:
+    """
+    Projection of full embeddings to a low-dimensional space used for a cheap first-pass shortlist.
+
+    - "prefix": Matryoshka truncation, keep the first `dim` coordinates (text-embedding-3 models are trained for this).
+    - "pca":    project onto the top `dim` principal components of a sample of the entity matrix.
+    Projected vectors are re-normalized, so dot products are cosine similarities in the reduced space.
+    """
+
+    def __init__(self, kind, dim, mean=None, components=None, content_hash=None):
+        self.kind = kind
+        self.dim = int(dim)
+        self.mean = mean
+        self.components = components
+        self.content_hash = content_hash  # entity_content_hash of the matrix it was built from
+
+    @classmethod
+    def fit(cls, matrix, dim: int, kind: str = "prefix", sample_size: int = 20_000, seed: int = 0):
+        if kind == "prefix":
+            return cls("prefix", dim)
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(matrix[rng.choice(matrix.shape[0], size=min(sample_size, matrix.shape[0]), replace=False)], dtype=np.float32)
+        mean = sample.mean(axis=0)
+        _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        return cls("pca", dim, mean=mean.astype(np.float32), components=np.ascontiguousarray(vt[:dim], dtype=np.float32))
+
+    def project(self, vectors, chunk_size: int = 8192):
+        vectors = np.atleast_2d(vectors)
+        out = np.empty((vectors.shape[0], self.dim), dtype=np.float32)
+        for start in range(0, vectors.shape[0], chunk_size):
+            block = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+            if self.kind == "prefix":
+                block = block[:, :self.dim]
+            else:
+                block = (block - self.mean) @ self.components.T
+            out[start:start + chunk_size] = normalize_rows(block)
+        return out
+
+    def save(self, path):
+        params = {"kind": self.kind, "dim": self.dim, "content_hash": self.content_hash or ""}
+        if self.kind == "pca":
+            params.update(mean=self.mean, components=self.components)
+        np.savez(path, **params)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        kind = str(data["kind"])
+        return cls(
+            kind, int(data["dim"]), mean=data["mean"] if kind == "pca" else None, components=data["components"] if kind == "pca" else None,
+            content_hash=str(data["content_hash"]) or None if "content_hash" in data else None,
+        )
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index: spherical k-means coarse centroids plus one posting list per centroid.
+
+    Posting lists are stored CSR-style (`list_offsets`, `list_rows`) so the whole index is three arrays
+    that can be saved next to the `*_embedding.npy` files and loaded at startup.
+    """
+
+    def __init__(self, centroids, list_offsets, list_rows, n_rows, nprobe: int = 8, content_hash=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_rows = np.asarray(list_rows, dtype=np.int64)
+        self.n_rows = int(n_rows)
+        self.nprobe = nprobe
+        self.content_hash = content_hash  # entity_content_hash of the matrix it was built from
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, matrix, nlist: int = None, n_iter: int = 20, sample_size: int = 50_000, seed: int = 0, chunk_size: int = 8192):
+        """Train coarse centroids with spherical k-means on a sample of `matrix` (rows must be L2-normalized)."""
+        rng = np.random.default_rng(seed)
+        n_rows = matrix.shape[0]
+        nlist = nlist or max(1, min(4096, int(4 * np.sqrt(n_rows))))
+
+        sample = matrix[rng.choice(n_rows, size=min(sample_size, n_rows), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], size=min(nlist, sample.shape[0]), replace=False)].copy()
+
+        for _ in range(n_iter):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=centroids.shape[0])
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty clusters from random sample points
+                sums[empty] = sample[rng.choice(sample.shape[0], size=int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+
+        assignment = np.concatenate([
+            np.argmax(matrix[start:start + chunk_size] @ centroids.T, axis=1)
+            for start in range(0, n_rows, chunk_size)
+        ])
+        list_rows = np.argsort(assignment, kind="stable")
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=centroids.shape[0]))])
+        return cls(centroids, list_offsets, list_rows, n_rows)
+
+    def save(self, path):
+        np.savez(
+            path, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows, n_rows=self.n_rows,
+            content_hash=self.content_hash or "",
+        )
+
+    @classmethod
+    def load(cls, path, nprobe: int = 8):
+        data = np.load(path)
+        content_hash = str(data["content_hash"]) or None if "content_hash" in data else None
+        return cls(data["centroids"], data["list_offsets"], data["list_rows"], int(data["n_rows"]), nprobe=nprobe, content_hash=content_hash)
+
+    def candidates(self, query):
+        """Rows of every posting list among the `nprobe` centroids closest to a normalized query."""
+        nprobe = min(self.nprobe, self.nlist)
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probes])
+
+    def search_many(self, index, queries, top_k: int = 5):
+        """Approximate top-k: `index` scores only the probed posting lists. Missing slots are padded with -1 / -inf."""
+        indices = np.full((queries.shape[0], top_k), -1, dtype=np.int64)
+        scores = np.full((queries.shape[0], top_k), -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            rows = self.candidates(query)
+            if rows.size == 0:
+                continue
+            local_idx, local_scores = top_k_rows(index.score_rows(query[None, :], rows), top_k)
+            found = local_idx.shape[1]
+            indices[i, :found] = rows[local_idx[0]]
+            scores[i, :found] = local_scores[0]
+        return indices, scores
+
+
+class EntityIndex:
+    """
+    Vector index over the stnx / chp / customer entity tables.
+
+    The index is built once at load time and holds:
+        - matrix:   scoring matrix (n_entities x dim) with L2-normalized rows, so cosine similarity is a dot product.
+                    Either an in-memory float32 matrix, or a read-only memory-mapped float16 / int8 matrix
+                    (int8 rows carry a per-row scale in `scales`) whose pages the OS shares between processes.
+        - full_rows: optional float32 originals (ShardedRows over the memory-mapped `*_embedding.npy` files)
+                    used to rescore the top candidates of a quantized first pass. When brands were collapsed,
+                    `source_rows` maps each index row to its row in those files.
+        - reduced:  optional (ReducedProjection, reduced matrix) pair; when attached, a low-dimensional scan
+                    shortlists candidates that are then reranked with full-dimension cosine.
+        - names, types, source_tables, metadata: columnar numpy arrays aligned with the matrix rows.
+        - partitions: rows grouped by (source_table, type), so a filtered query scans only its partitions.
+        - lexical:  optional LexicalIndex over the names, consulted before any embedding call.
+    """
+
+    def __init__(self, matrix, names, types, metadata, source_tables=None, scales=None, full_rows=None, source_rows=None, normalized=False,
+                 content_hash=None):
+        self.matrix = matrix if normalized else normalize_rows(matrix)
+        self.scales = scales
+        self.full_rows = full_rows
+        self.source_rows = source_rows
+        self.names = np.asarray(names, dtype=object)
+        self.types = np.asarray(types, dtype=object)
+        self.metadata = np.empty(len(metadata), dtype=object)
+        self.metadata[:] = list(metadata)
+        self.source_tables = np.asarray(source_tables if source_tables is not None else [None] * len(self.names), dtype=object)
+        self.ivf = None
+        self.reduced = None
+        self.first_pass_mode = VECTOR_FIRST_PASS
+        self.lexical = None
+        self._content_hash = content_hash
+        # Brand_Name rows kept uncollapsed because their vectors differ (see collapse_brands); searches then
+        # fetch extra candidates and keep the best-scoring row per brand
+        self.brand_repeats = int(pd.Series(self.names[self.types == "Brand_Name"]).duplicated().sum())
+        self.partitions = self.build_partitions()
+        self.partition_stats = {}
+        self.stats_lock = threading.Lock()
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    @property
+    def content_hash(self):
+        """entity_content_hash of the indexed rows (computed on first use)."""
+        if self._content_hash is None:
+            self._content_hash = entity_content_hash(self.names, self.types, self.metadata)
+        return self._content_hash
+
+    @property
+    def quantized(self):
+        return self.matrix.dtype != np.float32
+
+    @classmethod
+    def from_frame(cls, entities: pd.DataFrame, embeddings: np.ndarray, **kwargs):
+        """Build the index from the combined entity meta table and its aligned embedding matrix."""
+        return cls(
+            matrix=embeddings,
+            names=entities["name"].to_numpy(),
+            types=entities["type"].to_numpy(),
+            metadata=entities["metadata"].to_list(),
+            source_tables=entities["source_table"].to_numpy() if "source_table" in entities else None,
+            **kwargs,
+        )
+
+    def build_partitions(self):
+        """
+        Group row indices by (source_table, type).
+        Partitions whose rows are contiguous (the usual case, since each entity file is concatenated whole)
+        are stored as slices, so scanning them reads the matrix without a gather copy.
+        """
+        keys = pd.MultiIndex.from_arrays([self.source_tables, self.types])
+        partitions = {}
+        for key, rows in pd.Series(np.arange(len(self.names))).groupby(keys, sort=False, dropna=False).indices.items():
+            rows = np.asarray(rows, dtype=np.int64)
+            if rows.size and rows[-1] - rows[0] + 1 == rows.size:
+                partitions[key] = slice(int(rows[0]), int(rows[-1]) + 1)
+            else:
+                partitions[key] = rows
+        return partitions
+
+    def partition_values(self):
+        """The entity types and source tables present in the partitions, for filter validation and tool descriptions."""
+        types = sorted({str(t) for _, t in self.partitions if t is not None and t == t})
+        sources = sorted({str(s) for s, _ in self.partitions if s is not None and s == s})
+        return types, sources
+
+    def validate_filters(self, entity_types=None, source_tables=None):
+        """
+        Map the type / source_table filters onto the values stored in the partitions (case-insensitively).
+        Unknown values are dropped with a warning; when a given filter then selects no partition at all, the
+        search falls back to unfiltered instead of silently returning no matches. Returns the cleaned (types, sources).
+        """
+        if not entity_types and not source_tables:
+            return None, None
+        known_types, known_sources = self.partition_values()
+
+        def resolve(values, known, field):
+            if not values:
+                return None
+            lookup = {k.casefold(): k for k in known}
+            resolved = [lookup[str(v).strip().casefold()] for v in values if str(v).strip().casefold() in lookup]
+            unknown = [v for v in values if str(v).strip().casefold() not in lookup]
+            if unknown:
+                print(f"[WARNING] Unknown {field} filter values {unknown}; known values: {known}")
+            return resolved or None
+
+        types = resolve(entity_types, known_types, "entity_types")
+        sources = resolve(source_tables, known_sources, "source_tables")
+        if (types or sources) and not self.select_partitions(types, sources):
+            print(f"[WARNING] Filter types={types} sources={sources} matches no partition; searching all entities")
+            return None, None
+        return types, sources
+
+    def select_partitions(self, entity_types=None, source_tables=None):
+        """Partition keys matching the optional type / source_table filters (None means no filter on that field)."""
+        return [
+            key for key in self.partitions
+            if (not entity_types or key[1] in entity_types) and (not source_tables or key[0] in source_tables)
+        ]
+
+    def partition_mask(self, entity_types=None, source_tables=None):
+        """Boolean row mask of the partitions matching the filters, or None when there is no (valid) filter."""
+        entity_types, source_tables = self.validate_filters(entity_types, source_tables)
+        if not entity_types and not source_tables:
+            return None
+        mask = np.zeros(len(self), dtype=bool)
+        for key in self.select_partitions(entity_types, source_tables):
+            mask[self.partitions[key]] = True
+        return mask
+
+    def partition_sizes(self):
+        return {f"{source}/{entity_type}": partition_size(rows) for (source, entity_type), rows in self.partitions.items()}
+
+    def partition_report(self):
+        """Partition sizes plus the number of filtered scans and their average latency per partition."""
+        report = {}
+        with self.stats_lock:
+            stats = dict(self.partition_stats)
+        for key, size in self.partition_sizes().items():
+            calls, seconds = stats.get(key, (0, 0.0))
+            report[key] = {"rows": size, "scans": calls, "avg_ms": round(1000 * seconds / calls, 2) if calls else None}
+        return report
+
+    def search_partitions(self, queries, keys, top_k):
+        """Exact scan restricted to the partitions in `keys`; results are merged across partitions."""
+        all_indices, all_scores = [], []
+        for key in keys:
+            t0 = time.time()
+            rows = self.partitions[key]
+            rows_array = np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows
+            local_idx, local_scores = top_k_rows(self.score_rows(queries, rows), top_k)
+            all_indices.append(rows_array[local_idx])
+            all_scores.append(local_scores)
+
+            label = f"{key[0]}/{key[1]}"
+            elapsed = time.time() - t0
+            with self.stats_lock:  # shared by concurrent sessions
+                calls, seconds = self.partition_stats.get(label, (0, 0.0))
+                self.partition_stats[label] = (calls + 1, seconds + elapsed)
+
+        if not all_indices:
+            empty = (queries.shape[0], 0)
+            return np.empty(empty, dtype=np.int64), np.empty(empty, dtype=np.float32)
+
+        indices, scores = np.hstack(all_indices), np.hstack(all_scores)
+        merged_idx, merged_scores = top_k_rows(scores, top_k)
+        return np.take_along_axis(indices, merged_idx, axis=1), merged_scores
+
+    def score_rows(self, queries, rows=None):
+        """
+        Cosine scores of normalized `queries` against `rows` of the index (an index array, a slice, or all rows when None).
+        Quantized matrices are dequantized chunk by chunk so memory stays bounded.
+        """
+        if not self.quantized:
+            matrix = self.matrix if rows is None else self.matrix[rows]
+            return queries @ matrix.T
+
+        if isinstance(rows, slice):
+            offset, n_rows, rows = rows.start, rows.stop - rows.start, None
+        else:
+            offset, n_rows = 0, len(self) if rows is None else len(rows)
+        sims = np.empty((queries.shape[0], n_rows), dtype=np.float32)
+        for start in range(0, n_rows, SCORE_CHUNK_ROWS):
+            chunk = slice(start, min(start + SCORE_CHUNK_ROWS, n_rows))
+            chunk_rows = slice(offset + chunk.start, offset + chunk.stop) if rows is None else rows[chunk]
+            block = queries @ np.asarray(self.matrix[chunk_rows], dtype=np.float32).T
+            if self.scales is not None:
+                block *= self.scales[chunk_rows]
+            sims[:, chunk] = block
+        return sims
+
+    def rerank(self, queries, indices, top_k):
+        """Re-rank first-pass candidates with full-dimension cosine, using the float32 originals when available."""
+        scores = np.full(indices.shape, -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            valid = indices[i] >= 0
+            if not valid.any():
+                continue
+            rows = indices[i][valid]
+            if self.full_rows is not None:
+                source_rows = rows if self.source_rows is None else self.source_rows[rows]
+                scores[i][valid] = normalize_rows(self.full_rows.take(source_rows)) @ query
+            else:
+                scores[i][valid] = self.score_rows(query[None, :], rows)[0]
+        order = np.argsort(-scores, axis=1)[:, :top_k]
+        return np.take_along_axis(indices, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+    def search(self, query_emb, top_k: int = 5):
+        """
+        Return the `top_k` most similar rows to `query_emb`.
+
+        Returns:
+            (indices, scores): row indices into the index and their cosine similarity, sorted by score descending.
+        """
+        indices, scores = self.search_many(np.atleast_2d(query_emb), top_k=top_k)
+        return indices[0], scores[0]
+
+    def first_pass(self, exact: bool = False) -> str:
+        """The first pass a search takes: "reduced", "ivf" or "exact" (see VECTOR_FIRST_PASS)."""
+        if exact or self.first_pass_mode == "exact":
+            return "exact"
+        if self.first_pass_mode == "reduced" and self.reduced is not None:
+            return "reduced"
+        if self.first_pass_mode == "ivf" and self.ivf is not None:
+            return "ivf"
+        return "reduced" if self.reduced is not None else "ivf" if self.ivf is not None else "exact"
+
+    def search_many(self, query_embs, top_k: int = 5, exact: bool = None, entity_types=None, source_tables=None):
+        """
+        Score a batch of queries against the index.
+
+        When `entity_types` / `source_tables` are given, only the matching partitions are scanned (exactly);
+        filters that match no partition are ignored (see validate_filters).
+
+        First pass (see first_pass / VECTOR_FIRST_PASS), unless `exact` is set (or VECTOR_SEARCH_EXACT=true):
+            - reduced-dimension scan, shortlisting VECTOR_SEARCH_SHORTLIST x top_k (default 10x), or
+            - IVF index, or
+            - every row scored with one matrix-matrix product (exact).
+        Shortlists from the reduced scan, and the 4x top_k candidates of a quantized matrix, are reranked
+        with full-dimension float32 cosine (disable quantized rescoring with VECTOR_SEARCH_RESCORE=false).
+
+        Returns:
+            (indices, scores): arrays of shape (n_queries, top_k), each row sorted by score descending.
+        """
+        queries = normalize_rows(np.atleast_2d(query_embs))
+        if exact is None:
+            exact = os.getenv("VECTOR_SEARCH_EXACT", "false").lower() == "true"
+
+        rescore = self.quantized and self.full_rows is not None and os.getenv("VECTOR_SEARCH_RESCORE", "true").lower() == "true"
+        first_pass_k = top_k * 4 if rescore else top_k
+
+        first_pass = self.first_pass(exact)
+        entity_types, source_tables = self.validate_filters(entity_types, source_tables)
+        if entity_types or source_tables:
+            keys = self.select_partitions(entity_types, source_tables)
+            indices, scores = self.search_partitions(queries, keys, first_pass_k)
+        elif first_pass == "ivf":
+            indices, scores = self.ivf.search_many(self, queries, top_k=min(first_pass_k, len(self)))
+        elif first_pass == "reduced":
+            projection, reduced_matrix = self.reduced
+            shortlist_k = top_k * int(os.getenv("VECTOR_SEARCH_SHORTLIST", "10"))
+            indices, _ = top_k_rows(projection.project(queries) @ reduced_matrix.T, shortlist_k)
+            return self.rerank(queries, indices, top_k)
+        else:
+            indices, scores = top_k_rows(self.score_rows(queries), first_pass_k)
+
+        if rescore:
+            return self.rerank(queries, indices, top_k)
+        return indices, scores
+
+    def attach_ivf(self, path, nprobe: int = None):
+        """Attach a prebuilt IVF index if `path` exists and was built for these entities (same shape and content hash)."""
+        if not os.path.exists(path):
+            return False
+        ivf = IVFIndex.load(path, nprobe=nprobe or int(os.getenv("VECTOR_SEARCH_NPROBE", "8")))
+        if ivf.n_rows != len(self) or ivf.centroids.shape[1] != self.dim:
+            print(f"[WARNING] Ignoring stale IVF index {path} ({ivf.n_rows} rows, index has {len(self)})")
+            return False
+        if ivf.content_hash != self.content_hash:
+            print(f"[WARNING] Ignoring stale IVF index {path} (built for entities {ivf.content_hash}, index has {self.content_hash})")
+            return False
+        self.ivf = ivf
+        return True
+
+    def attach_reduced(self, matrix_path, projection_path):
+        """Attach a prebuilt reduced-dimension matrix (memory-mapped) and its projection, if both exist and match."""
+        if not (os.path.exists(matrix_path) and os.path.exists(projection_path)):
+            return False
+        reduced_matrix = np.load(matrix_path, mmap_mode="r")
+        if reduced_matrix.shape[0] != len(self):
+            print(f"[WARNING] Ignoring stale reduced matrix {matrix_path} ({reduced_matrix.shape[0]} rows, index has {len(self)})")
+            return False
+        projection = ReducedProjection.load(projection_path)
+        if projection.content_hash != self.content_hash:
+            print(f"[WARNING] Ignoring stale reduced matrix {matrix_path} (built for entities {projection.content_hash}, index has {self.content_hash})")
+            return False
+        self.reduced = (projection, reduced_matrix)
+        return True
+
+    def recall_at_k(self, queries, top_k: int = 5):
+        """
+        Measure the configured approximate path (IVF or reduced-dimension shortlist) against exact search:
+        mean fraction of the exact top-k it also returns, plus the average per-query latency of both paths.
+        """
+        queries = normalize_rows(np.atleast_2d(queries))
+
+        t0 = time.time()
+        exact_idx, _ = self.search_many(queries, top_k=top_k, exact=True)
+        t1 = time.time()
+        ann_idx, _ = self.search_many(queries, top_k=top_k, exact=False)
+        t2 = time.time()
+
+        hits = [len(set(e) & set(a)) / len(e) for e, a in zip(exact_idx, ann_idx) if len(e)]
+        return {
+            "recall": float(np.mean(hits)) if hits else 0.0,
+            "exact_ms_per_query": 1000 * (t1 - t0) / len(queries),
+            "ann_ms_per_query": 1000 * (t2 - t1) / len(queries),
+        }
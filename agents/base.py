@@ -18,6 +18,9 @@ class BaseAgent:
         self.num_exec = None
         self.exec_error = None
         self.rating = None
+        self.cache_hit = None
+        self.exec_saved_seconds = None
+        self.cache_hit_rate = None
 
     def set_question(self, question: str):
         self.question = question
@@ -49,6 +52,11 @@ class BaseAgent:
     def set_rating(self, rating : int):
         self.rating = rating
 
+    def set_exec_cache(self, cache_hit: bool, exec_saved_seconds: float, cache_hit_rate: float = None):
+        self.cache_hit = cache_hit
+        self.exec_saved_seconds = exec_saved_seconds
+        self.cache_hit_rate = cache_hit_rate
+
 
     def get_duration(self) -> float:
         return round((self.end_time - self.start_time), 3) if self.start_time and self.end_time else 0.0
@@ -67,7 +75,10 @@ class BaseAgent:
             "duration": self.get_duration(),
             "question": self.question,
             "answer": self.answer,
-            "rating" : self.rating
+            "rating" : self.rating,
+            "cache_hit" : self.cache_hit,
+            "exec_saved_seconds" : self.exec_saved_seconds,
+            "cache_hit_rate" : self.cache_hit_rate
         }
 
         st.session_state["Logs"] = pd.concat([st.session_state["Logs"], pd.DataFrame([new_row])], ignore_index=True)
@@ -0,0 +1,184 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .lexical import normalize_hebrew
+
+# Bounds of the SQLite tier: rows beyond EMBEDDING_CACHE_MAX_ROWS (oldest first) and rows older than
+# EMBEDDING_CACHE_MAX_AGE_DAYS are pruned on open and after every PRUNE_EVERY_WRITES stored rows
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "200000"))
+EMBEDDING_CACHE_MAX_AGE_DAYS = float(os.getenv("EMBEDDING_CACHE_MAX_AGE_DAYS", "90"))
+PRUNE_EVERY_WRITES = 1000
+
+
+def normalize_cache_key(name: str) -> str:
+    """Normalize an entity name for cache lookups, the same way names are matched lexically (see normalize_hebrew)."""
+    return normalize_hebrew(name)
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings, keyed by (embedding model, normalized name).
+
+    - Tier 1: in-process LRU (OrderedDict) bounded by `max_items`.
+    - Tier 2: SQLite file on local disk. It survives restarts and is shared by every worker
+      process on the instance (WAL mode allows concurrent readers with one writer).
+
+    The SQLite tier is bounded by `max_rows` and `max_age_days` (see prune).
+    Hit/miss counters are available through `stats()`.
+    """
+
+    def __init__(self, db_path: str = None, max_items: int = 4096, max_rows: int = EMBEDDING_CACHE_MAX_ROWS,
+                 max_age_days: float = EMBEDDING_CACHE_MAX_AGE_DAYS):
+        self.db_path = db_path or os.getenv(
+            "EMBEDDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "diplochat_embedding_cache.sqlite")
+        )
+        self.max_items = max_items
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+        self._writes_since_prune = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._conn = self._connect()
+
+    def _connect(self):
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model  TEXT NOT NULL,
+                    name   TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    created REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (model, name)
+                )
+                """
+            )
+            # Caches created before the size bound have no timestamp column; their rows count as oldest
+            if "created" not in {row[1] for row in conn.execute("PRAGMA table_info(embeddings)")}:
+                conn.execute("ALTER TABLE embeddings ADD COLUMN created REAL NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_created ON embeddings (created)")
+            conn.commit()
+            self.prune(conn)
+            return conn
+        except sqlite3.Error as e:
+            print(f"[WARNING] Embedding disk cache disabled ({self.db_path}): {e}")
+            return None
+
+    def prune(self, conn=None) -> int:
+        """Delete rows older than `max_age_days`, then the oldest rows beyond `max_rows`; returns the rows removed."""
+        conn = conn or self._conn
+        if conn is None:
+            return 0
+        try:
+            removed = conn.execute(
+                "DELETE FROM embeddings WHERE created < ?", (time.time() - self.max_age_days * 86400,)
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,),
+            ).rowcount
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"[WARNING] Embedding disk cache prune failed: {e}")
+            return 0
+        if removed:
+            print(f"[INFO] Pruned {removed} embedding disk cache rows")
+        return removed
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, names, model: str) -> dict:
+        """Return {name: vector} for every name found in either tier."""
+        found = {}
+        disk_lookup = {}
+
+        with self._lock:
+            for name in names:
+                key = (model, normalize_cache_key(name))
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[name] = self._memory[key]
+                    self._counters["memory_hits"] += 1
+                else:
+                    disk_lookup.setdefault(key[1], []).append(name)
+
+            if disk_lookup and self._conn is not None:
+                keys = list(disk_lookup)
+                placeholders = ",".join("?" * len(keys))
+                try:
+                    rows = self._conn.execute(
+                        f"SELECT name, vector FROM embeddings WHERE model = ? AND name IN ({placeholders})",
+                        [model, *keys],
+                    ).fetchall()
+                except sqlite3.Error as e:
+                    print(f"[WARNING] Embedding disk cache read failed: {e}")
+                    rows = []
+
+                for key_name, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    self._remember((model, key_name), vector)
+                    for name in disk_lookup.pop(key_name):
+                        found[name] = vector
+                        self._counters["disk_hits"] += 1
+
+            self._counters["misses"] += sum(len(v) for v in disk_lookup.values())
+
+        return found
+
+    def put_many(self, items: dict, model: str):
+        """Store {name: vector} in both tiers."""
+        rows = []
+        with self._lock:
+            for name, vector in items.items():
+                key = (model, normalize_cache_key(name))
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((model, key[1], vector.tobytes(), time.time()))
+
+            if rows and self._conn is not None:
+                try:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (model, name, vector, created) VALUES (?, ?, ?, ?)", rows
+                    )
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    print(f"[WARNING] Embedding disk cache write failed: {e}")
+                self._writes_since_prune += len(rows)
+                if self._writes_since_prune >= PRUNE_EVERY_WRITES:
+                    self._writes_since_prune = 0
+                    self.prune()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current in-memory size."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_items"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
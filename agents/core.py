@@ -1,77 +1,112 @@
-from collections import defaultdict
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 from typing import List
 
 import time
 
-def search_entities_in_vdb_core(names, embedding_model, combined_entities):
+import os
+
+from .cache import get_embedding_cache
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+LEXICAL_WEIGHT = float(os.getenv("ENTITY_SEARCH_LEXICAL_WEIGHT", "0.3"))
+HYBRID_SCORING = os.getenv("ENTITY_SEARCH_HYBRID", "true").lower() == "true"
+
+def search_entities_in_vdb_core(names, embedding_model, combined_entities, embedding_cache=None, entity_types=None, source_tables=None):
     t0 = time.time()
+    embedding_cache = embedding_cache or get_embedding_cache()
 
     results = []
     top_k = 5
     similarity_threshold = 0.7
 
-    def brand_group_factory():
-        return {
-            "type": None,
-            "score": 0,
-            "metadata": {
-                "categories": [],
-                "source_table": None,
-                "column": None
-            },
-        }
-
-    for name in names:
-        query_emb = np.array(
-            embedding_model.embeddings.create(input=[name], model="text-embedding-3-large").data[0].embedding
-        )
-
-        all_embeddings = np.vstack(combined_entities["embedding"])
-        sims = cosine_similarity([query_emb], all_embeddings)[0]
-
-        top_indices = np.argsort(sims)[::-1]
-        filtered_matches = [idx for idx in top_indices[:top_k * 2] if sims[idx] >= similarity_threshold][:top_k]
-
-        grouped_brands = defaultdict(brand_group_factory)
-        plain_matches = []
-
-        for idx in filtered_matches:
-            row = combined_entities.iloc[idx]
-            matched_name = row["name"]
-            score = round(sims[idx], 4)
-            row_meta = row["metadata"]
-
-            if row["type"] == "Brand_Name":
-                g = grouped_brands[matched_name]
-                g["type"] = row["type"]
-                g["score"] = max(g["score"], score)
-                cat = row_meta.get("Category_Name")
-                if cat and cat not in g["metadata"]["categories"]:
-                    g["metadata"]["categories"].append(cat)
-                g["metadata"]["source_table"] = row_meta.get("source_table")
-                g["metadata"]["column"] = row_meta.get("column")
-            else:
-                plain_matches.append({
-                    "matched_name": matched_name,
-                    "type": row["type"],
-                    "score": score,
-                    "metadata": row_meta,
-                })
-
-        merged_brand_matches = [
+    def embed_names(names):
+        cached = embedding_cache.get_many(names, EMBEDDING_MODEL)
+        missing = list(dict.fromkeys(name for name in names if name not in cached))
+
+        if missing:
+            # One request for all uncached names; the API returns one embedding per input, tagged with its position
+            response = embedding_model.embeddings.create(input=missing, model=EMBEDDING_MODEL)
+            ordered = sorted(response.data, key=lambda d: d.index)
+            fresh = {name: np.array(d.embedding, dtype=np.float32) for name, d in zip(missing, ordered)}
+            embedding_cache.put_many(fresh, EMBEDDING_MODEL)
+            cached.update(fresh)
+
+        return np.vstack([cached[name] for name in names])
+
+    def build_matches(rows, scores):
+        # Brand_Name rows are collapsed per brand when the index is built; a brand whose repeats have distinct
+        # vectors keeps several rows, of which only the best-scoring one is reported
+        rows, scores = np.asarray(rows, dtype=np.int64), np.asarray(scores, dtype=np.float32)
+        order = np.argsort(-scores, kind="stable")
+        rows, scores = rows[order], scores[order]
+        keep = scores >= similarity_threshold
+        if combined_entities.brand_repeats:
+            seen_brands = set()
+            for i, row in enumerate(rows):
+                if combined_entities.types[row] == "Brand_Name":
+                    keep[i] &= combined_entities.names[row] not in seen_brands
+                    seen_brands.add(combined_entities.names[row])
+        rows, scores = rows[keep][:top_k], scores[keep][:top_k]
+        return [
             {
-                "matched_name": m_name,
-                "type": data["type"],
-                "score": data["score"],
-                "metadata": data["metadata"],
+                "matched_name": matched_name,
+                "type": entity_type,
+                "score": round(float(score), 4),
+                "metadata": row_meta,
             }
-            for m_name, data in grouped_brands.items()
+            for matched_name, entity_type, score, row_meta in zip(
+                combined_entities.names[rows], combined_entities.types[rows], scores, combined_entities.metadata[rows]
+            )
         ]
 
-        matches = merged_brand_matches + plain_matches
-        matches.sort(key=lambda m: m["score"], reverse=True)
+    if not names:
+        return results
+
+    # Lexical pre-match: exact normalized name hits never reach the embedding API. Near matches (one differing
+    # pack size or flavour letter in a long item name) are not trusted alone; they go through hybrid scoring below
+    # Unknown filter values (e.g. a misspelled type from the LLM) are dropped, never turned into an empty search
+    entity_types, source_tables = combined_entities.validate_filters(entity_types, source_tables)
+    lexical_hits = {}
+    if combined_entities.lexical is not None:
+        allowed = combined_entities.partition_mask(entity_types, source_tables)
+        lexical_hits = {name: combined_entities.lexical.lookup(name, allowed=allowed) for name in names}
+    confident = {name for name, hits in lexical_hits.items() if hits and hits[0][1] == 1.0}
+    vector_names = list(dict.fromkeys(name for name in names if name not in confident))
+
+    vector_matches = {}
+    if vector_names:
+        query_embs = embed_names(vector_names)
+        all_indices, all_scores = combined_entities.search_many(
+            query_embs, top_k=top_k * 2 if combined_entities.brand_repeats else top_k,
+            entity_types=entity_types, source_tables=source_tables,
+        )
+        for name, query_emb, top_indices, top_scores in zip(vector_names, query_embs, all_indices, all_scores):
+            valid = top_indices >= 0
+            rows, scores = top_indices[valid], top_scores[valid]
+
+            hits = lexical_hits.get(name)
+            if HYBRID_SCORING and hits:
+                # Hybrid: rows with a lexical signal score (1 - w) * cosine + w * lexical similarity
+                lexical_rows = np.array([row for row, _ in hits], dtype=np.int64)
+                lexical_scores = np.array([sim for _, sim in hits], dtype=np.float32)
+                extra = lexical_rows[~np.isin(lexical_rows, rows)]
+                if extra.size:
+                    query = query_emb / (np.linalg.norm(query_emb) or 1.0)
+                    rows = np.concatenate([rows, extra])
+                    scores = np.concatenate([scores, combined_entities.score_rows(query[None, :], extra)[0]])
+                position = {row: i for i, row in enumerate(rows)}
+                for row, sim in zip(lexical_rows, lexical_scores):
+                    i = position[row]
+                    scores[i] = (1 - LEXICAL_WEIGHT) * scores[i] + LEXICAL_WEIGHT * sim
+
+            vector_matches[name] = build_matches(rows, scores)
+
+    for name in names:
+        if name in confident:
+            hits = lexical_hits[name]
+            matches = build_matches([row for row, _ in hits], [sim for _, sim in hits])
+        else:
+            matches = vector_matches[name]
 
         # brand_matches = [entity for entity in matches if entity["type"] == "Brand_Name"]
         # item_matches = [entity for entity in matches if entity["type"] == "Item_Name"]
@@ -90,6 +125,8 @@ def search_entities_in_vdb_core(names, embedding_model, combined_entities):
         results.append({"original": name, "matches": matches})
 
     t1 = time.time()
-    print(f"🕒 Tool took {t1 - t0:.2f} seconds")
+    print(f"🕒 Tool took {t1 - t0:.2f} seconds | lexical hits: {len(confident)}/{len(names)} | embedding cache: {embedding_cache.stats()}")
+    if entity_types or source_tables:
+        print(f"🧩 Partition filter types={entity_types} sources={source_tables} | {combined_entities.partition_report()}")
 
     return results
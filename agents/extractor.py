@@ -92,6 +92,9 @@ class ExtractorAgent(BaseAgent):
 
         Tool Behavior:
         - Accepts a list of Hebrew names
+        - Optionally accepts `entity_types` / `source_tables` filters. Use them only when every name in the call is clearly
+          of that kind (e.g. `entity_types: ["CHAIN"]` when the user asks only about retail chains); otherwise omit them.
+          Types: Item_Name, Brand_Name, CHAIN, customer. Sources: stnx_items (items and brands), chp (chains), customer_df (customers).
         - Returns up to 5 best matches for each name including type, score, and metadata
 
         Your output MUST be
@@ -15,6 +15,9 @@ import os
 
 load_dotenv()
 
+# Catalog aggregation level -> the period one fact-table row covers, as worded in the prompt
+AGGREGATION_GRAINS = {"monthly": "month", "weekly": "week"}
+
 
 class AnswerStructure(BaseModel):
     """Python code and a short explanation"""
@@ -83,19 +86,22 @@ class GeneratorAgent(BaseAgent):
 
          ### Step 1: Understand Your DataFrames
 
+            The fact tables (`stnx_sales`, `chp`, `inv_df`) are aggregated per {grain}: each row summarizes one {grain}, and its date (`Day` / `DATE`) stands for that whole {grain}, not a single day.
+            Answer time-based questions at {grain} resolution (e.g. "per {grain}", "in the last N {grain}s"); never claim daily precision.
+
             1. stnx_sales:
 
                 - **Description**:  
-                    - The `stnx_sales` dataset contains actual daily sales transactions.  
-                    - Each row represents the total sales for a specific product (identified by its barcode) on a specific day, within a given retail format (e.g., discount stores, private markets, national chains).  
+                    - The `stnx_sales` dataset contains actual retail sales, aggregated per {grain}.  
+                    - Each row represents the total sales for a specific product (identified by its barcode) in one {grain}, within a given retail format (e.g., discount stores, private markets, national chains).  
 
                     - **Columns**:  
-                        - `Day`: The calendar date on which the product was sold.  
+                        - `Day`: The {grain} in which the product was sold (the date stands for the whole {grain}).  
                         - `Barcode`: A unique identifier for the sold product.  
                         - `Format_Name`: The retail format in which it was sold.  
-                        - `Sales_NIS`: The total revenue (in shekels) generated from sales of the product on that specific day.  
-                        - `Sales_Units`: The total number of product units sold on that specific day.  
-                        - `Price_Per_Unit`: The average price per unit for that product on that specific day, calculated as Sales_NIS divided by Sales_Units.  
+                        - `Sales_NIS`: The total revenue (in shekels) generated from sales of the product in that {grain}.  
+                        - `Sales_Units`: The total number of product units sold in that {grain}.  
+                        - `Price_Per_Unit`: The average price per unit for that product in that {grain}, calculated as Sales_NIS divided by Sales_Units.  
                                             This is an aggregated metric reflecting the observed average selling price, which may vary due to promotions or price changes.
 
                 - **Notes**:  
@@ -117,18 +123,18 @@ class GeneratorAgent(BaseAgent):
 
             3. chp:
                 - **Description**:  
-                    - The `chp` dataset provides comprehensive, market-wide pricing data, capturing daily price observations from various supermarket chains across Israel.  
+                    - The `chp` dataset provides comprehensive, market-wide pricing data, capturing price observations from various supermarket chains across Israel, aggregated per {grain}.  
                     - Unlike the STORNEXT datasets, which focus on sales volumes, `chp` emphasizes **pricing and promotional activities** at the store and chain levels.  
-                    - Each row represents the average price of a specific product (identified by its barcode) within a particular chain on a given date.
+                    - Each row represents the average price of a specific product (identified by its barcode) within a particular chain and promotion over one {grain}.
 
                     - **Columns**:  
-                        - `DATE`: The date of the price observation.  
+                        - `DATE`: The {grain} in which the prices were observed (the date stands for the whole {grain}).  
                         - `BARCODE`: A unique identifier for the product, linking it to descriptions in `stnx_items`.  
                         - `CHAIN`: The name of the supermarket chain where the price was recorded.  
                         - `AVG_PRICE`: The average base price of the product across all reporting stores within the chain.  
                         - `AVG_SELLOUT_PRICE`: The average promotional price, if available. If null, it indicates no promotion.  
                         - `SELLOUT_DESCRIPTION`: A Hebrew description of any active promotion, providing context for `AVG_SELLOUT_PRICE`.  
-                        - `NUMBER_OF_STORES`: The number of stores within the chain that reported carrying the product on that date.
+                        - `NUMBER_OF_STORES`: The number of stores within the chain that reported carrying the product in that {grain}.
 
                 - **Notes**:  
                     - This dataset covers a wide range of products from various suppliers, not limited to Diplomat.  
@@ -146,6 +152,10 @@ class GeneratorAgent(BaseAgent):
                         - `DATE`: The Gregorian calendar date.    
                         - 'HEBREW_DATE': The corresponding Hebrew calendar date, represented as a string.
                         - 'HOLIDAY':  The name of the Jewish holiday on that date, if applicable. If no holiday occurs on the date, this field will be null.
+                        - 'IS_HOLIDAY': True when 'HOLIDAY' is not null.
+                        - 'IS_HOLIDAY_EVE': True on the day before a holiday starts (Erev Chag).
+                        - 'DAYS_TO_HOLIDAY': Days until the next holiday (0 on the holiday itself).
+                        - 'NEXT_HOLIDAY': The name of the next holiday (the current one on a holiday).
 
                 - **Notes**: 
                     - This data was generated via a Python process using a dedicated package for Hebrew calendar and holidays.
@@ -156,11 +166,11 @@ class GeneratorAgent(BaseAgent):
 
                 - **Description**:
                     - The 'inv_df' dataset contains invoice-level sales data for Diplomat Distributors.
-                    - Each row represents a sell-in transaction from Diplomat to a specific customer on a given date, including product, business unit, industry, and financial details.
+                    - Each row represents a sell-in transaction from Diplomat to a specific customer, aggregated per {grain}, including product, business unit, industry, and financial details.
                     - This dataset is critical for understanding internal shipments and B2B sales performance.
         
                     - **Columns**:
-                        - `DATE`: The date of the invoice.
+                        - `DATE`: The {grain} of the invoices (the date stands for the whole {grain}).
                         - `SALES_ORGANIZATION_CODE`: The internal business unit code at Diplomat. Values include: '1000' - Israel, '5000' - Georgia, '8000' - South Africa, 'NZ00' - New Zealand.
                         - `MATERIAL_CODE`: The internal identifier of the product (material) sold.
                         - `INDUSTRY_CODE`:  The industry classification of the customer by Diplomat.
@@ -242,6 +252,37 @@ class GeneratorAgent(BaseAgent):
                     - This dataset is used to enrich the inv_df invoice data by joining on the INDUSTRY_CODE field.
                     - It enables grouping, filtering, and analyzing sales by market segment or distribution channel.
 
+            9. 'stnx_sales_items':
+
+                - **Description**:
+                    - A ready-made join of `stnx_sales` with `stnx_items` on `Barcode` (left join: every sales row is kept, once).
+                    - Each row is a `stnx_sales` row with the product metadata of its barcode next to it.
+
+                    - **Columns**:
+                        - All the `stnx_sales` columns: `Day`, `Barcode`, `Format_Name`, `Sales_NIS`, `Sales_Units`, `Price_Per_Unit`.
+                        - The `stnx_items` columns: `Item_Name`, `Category_Name`, `Sub_Category_Name`, `Brand_Name`, `Sub_Brand_Name`, `Supplier_Name`.
+
+                - **Notes**:
+                    - Use it instead of merging `stnx_sales` with `stnx_items` yourself; filter and group it directly (e.g. by `Category_Name` or `Supplier_Name`).
+                    - The metadata columns are categorical: use `.astype(str)` before `.str` operations, and pass `observed=True` to `groupby`.
+                    - Barcodes without metadata have null metadata columns.
+
+            10. 'inv_enriched':
+
+                - **Description**:
+                    - A ready-made join of `inv_df` with `material_df` (`MATERIAL_CODE` = `MATERIAL_NUMBER`), `customer_df` (`CUSTOMER_CODE`) and `industry_df` (`INDUSTRY_CODE`) (left joins: every invoice row is kept, once).
+
+                    - **Columns**:
+                        - All the `inv_df` columns.
+                        - The `material_df` columns except `MATERIAL_NUMBER` (e.g. `MATERIAL_HE`, `BRAND_HEB`, `CATEGORY_HEB`, `SUPPLIER_HEB`, `BARCODE_EA`).
+                        - The `customer_df` columns except `CUSTOMER_CODE` (e.g. `CUSTOMER`, `CITY`).
+                        - `INDUSTRY` from `industry_df`.
+
+                - **Notes**:
+                    - Use it instead of merging `inv_df` with `material_df`, `customer_df` or `industry_df` yourself.
+                    - The text columns are categorical: use `.astype(str)` before `.str` operations, and pass `observed=True` to `groupby`.
+                    - The same Sell-In rules as `inv_df` apply (date range, SALES_ORGANIZATION_CODE filter).
+
                 
         
         
@@ -253,7 +294,7 @@ class GeneratorAgent(BaseAgent):
         - STORNEXT datasets (`stnx_sales`, `stnx_items`) represent **Sell-Out** data — consumer-level sales aggregated at the retail format level.  
         STORNEXT does not provide store- or chain-level granularity, but rather summarizes sales by formats (e.g., private market, discount format, national chains).  
         The data includes sales volumes, revenues, and average observed prices, and it may include products not distributed by Diplomat.
-        If you need any information about the product name, category, brand, always join stnx_sales with stnx_items using the 'Barcode' column before any aggregation.
+        If you need any information about the product name, category, brand, use `stnx_sales_items` (stnx_sales already joined with stnx_items on 'Barcode') before any aggregation.
 
 
         - CHP dataset (`chp`) is also an **external Sell-Out** source, but it provides **store- and chain-level pricing and promotion data**.  
@@ -407,12 +448,16 @@ class GeneratorAgent(BaseAgent):
 
         - Always use dataset metadata (e.g., `source_table`, `barcodes`, `categories`) from the extracted entities if provided.
         - Do not assume a barcode is valid across multiple datasets unless explicitly mapped via `material_df`.
+        - Low-cardinality text columns (e.g. `CHAIN`, `Format_Name`, `SELLOUT_DESCRIPTION`, `SALES_ORGANIZATION_CODE`) are pandas categoricals; identifier columns such as `Barcode` / `BARCODE` are integers when numeric, categoricals otherwise:
+            - Always pass `observed=True` to `groupby(...)` and `pivot_table(...)`.
+            - Comparisons, `.isin(...)`, `.str` methods and merges work as usual; use `.astype(str)` before concatenating them with other strings.
+        - The provided DataFrames are shared and may be read-only: never modify them in place (no `inplace=True`, no `.loc[...] = ...` on them). Build derived frames, or call `.copy()` first.
                                                 
 
-        """ , input_variables=["current_day"]
+        """ , input_variables=["current_day", "grain"]
         )
 
-    def response(self, context, user_question: str, max_retries: int = 5, delay: float = 1.0) -> dict:        
+    def response(self, context, user_question: str, max_retries: int = 5, delay: float = 1.0, aggregation: str = "monthly") -> dict:        
         prompt_template = ChatPromptTemplate.from_messages([
             self.system_prompt,
             MessagesPlaceholder(variable_name="history"),
@@ -439,7 +484,7 @@ class GeneratorAgent(BaseAgent):
             print(attempt)
             try:
                 self.increment_calls()
-                response = pipeline_with_history.invoke({"current_day": datetime.today().strftime("%Y-%m-%d"),"context": context,"user_question": user_question},
+                response = pipeline_with_history.invoke({"current_day": datetime.today().strftime("%Y-%m-%d"),"grain": AGGREGATION_GRAINS[aggregation],"context": context,"user_question": user_question},
                 config={"session_id": 'GeneratorHistory'})
                 self.stop_timer()
                 self.set_answer(response.python_code)
@@ -459,7 +504,7 @@ class GeneratorAgent(BaseAgent):
         self.stop_timer()
         raise RuntimeError(f"Failed after {max_retries} retries due to rate limit. Last error: {last_error}")
 
-    def retry_with_error(self, user_question: str, previous_code: str, error_message: str) -> AnswerStructure:
+    def retry_with_error(self, user_question: str, previous_code: str, error_message: str, aggregation: str = "monthly") -> AnswerStructure:
         max_retries = 5
         
         prompt_template = ChatPromptTemplate.from_messages([
@@ -483,6 +528,7 @@ class GeneratorAgent(BaseAgent):
                 self.increment_calls()
                 response = full_chain.invoke({
                     "current_day": datetime.today().strftime("%Y-%m-%d"),
+                    "grain": AGGREGATION_GRAINS[aggregation],
                     "user_question": user_question,
                     "previous_code" : previous_code,
                     "error_message" : error_message
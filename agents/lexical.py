@@ -0,0 +1,113 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+FINAL_LETTERS = str.maketrans({"ך": "כ", "ם": "מ", "ן": "נ", "ף": "פ", "ץ": "צ"})
+NIQQUD_PATTERN = re.compile(r"[\u0591-\u05bd\u05bf-\u05c7]")
+GERESH_PATTERN = re.compile(r"[\"'`׳״]")
+PUNCTUATION_PATTERN = re.compile(r"[\-–־_.,/\\()\[\]{}:;!?&+]+")
+
+
+def normalize_hebrew(text: str) -> str:
+    """
+    Normalize a Hebrew entity name for lexical matching:
+    strip niqqud / cantillation, map final letters to their regular form, drop geresh / gershayim
+    and punctuation, casefold Latin characters and collapse whitespace.
+    """
+    text = unicodedata.normalize("NFKD", str(text))
+    text = NIQQUD_PATTERN.sub("", text)
+    text = unicodedata.normalize("NFC", text).translate(FINAL_LETTERS)
+    text = GERESH_PATTERN.sub("", text)
+    text = PUNCTUATION_PATTERN.sub(" ", text).casefold()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def char_ngrams(text: str, n: int = 3):
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance (two-row dynamic programming)."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+class LexicalIndex:
+    """
+    In-memory lexical index over the entity names of an EntityIndex.
+
+    - exact:  normalized name -> rows, for exact matches after normalization.
+    - ngrams: character trigram inverted index (gram -> rows) that shortlists near matches,
+              which are then verified with edit distance.
+
+    Similarity is 1 - edit_distance / max(len), so 1.0 means identical after normalization.
+    """
+
+    def __init__(self, names, n: int = 3):
+        self.n = n
+        self.normalized = np.array([normalize_hebrew(name) for name in names], dtype=object)
+        self.gram_counts = np.zeros(len(self.normalized), dtype=np.int32)
+
+        exact = defaultdict(list)
+        postings = defaultdict(list)
+        for row, name in enumerate(self.normalized):
+            exact[name].append(row)
+            grams = char_ngrams(name, n)
+            self.gram_counts[row] = len(grams)
+            for gram in grams:
+                postings[gram].append(row)
+
+        self.exact = {name: np.array(rows, dtype=np.int64) for name, rows in exact.items()}
+        self.postings = {gram: np.array(rows, dtype=np.int64) for gram, rows in postings.items()}
+
+    def lookup(self, name: str, allowed=None, limit: int = 10, shortlist: int = 50, min_similarity: float = 0.6):
+        """
+        Return up to `limit` (row, similarity) pairs for `name`, best first.
+
+        Args:
+            allowed: optional boolean mask over rows (e.g. a partition filter); other rows are ignored.
+        """
+        query = normalize_hebrew(name)
+        if not query:
+            return []
+
+        exact_rows = self.exact.get(query)
+        if exact_rows is not None:
+            rows = exact_rows if allowed is None else exact_rows[allowed[exact_rows]]
+            if rows.size:
+                return [(int(row), 1.0) for row in rows[:limit]]
+
+        grams = char_ngrams(query, self.n)
+        hit_lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not hit_lists:
+            return []
+
+        rows, shared = np.unique(np.concatenate(hit_lists), return_counts=True)
+        if allowed is not None:
+            keep = allowed[rows]
+            rows, shared = rows[keep], shared[keep]
+        if rows.size == 0:
+            return []
+
+        # Dice coefficient on trigram sets to shortlist, edit distance to verify
+        dice = 2 * shared / (len(grams) + self.gram_counts[rows])
+        top = rows[np.argsort(-dice)[:shortlist]]
+
+        scored = []
+        for row in top:
+            candidate = self.normalized[row]
+            similarity = 1 - edit_distance(query, candidate) / max(len(query), len(candidate))
+            if similarity >= min_similarity:
+                scored.append((int(row), round(similarity, 4)))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
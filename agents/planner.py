@@ -166,6 +166,22 @@ class PlannerAgent(BaseAgent):
                     - Join on INDUSTRY_CODE in inv_df.
                     - Enables segmentation of customers by market sector or channel.            
 
+            8. stnx_sales_items – Sell-Out with product metadata (pre-joined)
+                Description:
+                    - stnx_sales already joined with stnx_items on Barcode; one row per stnx_sales row.
+                Columns:
+                    (Day, Barcode, Format_Name, Sales_NIS, Sales_Units, Price_Per_Unit, Item_Name, Category_Name, Sub_Category_Name, Brand_Name, Sub_Brand_Name, Supplier_Name)
+                Notes:
+                    - Use it for any sell-out question that filters or groups by product, category, brand or supplier (market share, competitors).
+
+            9. inv_enriched – Sell-In with material, customer and industry details (pre-joined)
+                Description:
+                    - inv_df already joined with material_df (MATERIAL_CODE = MATERIAL_NUMBER), customer_df (CUSTOMER_CODE) and industry_df (INDUSTRY_CODE); one row per inv_df row.
+                Columns:
+                    (the inv_df columns, plus the material_df, customer_df and industry_df columns such as BARCODE_EA, CUSTOMER, INDUSTRY)
+                Notes:
+                    - Use it for any sell-in question that filters or groups by product, brand, customer or industry.
+
 
         # User Question :
             {user_question}
@@ -203,12 +219,13 @@ class PlannerAgent(BaseAgent):
 
                 - Use `stnx_sales` to analyze market-level **sell-out trends by retail format**, such as:
                     - total revenue by category, units sold by brand, market share, etc.
-                    - Always join with `stnx_items` via `Barcode` before aggregating by product attributes.
+                    - Use `stnx_sales_items` (already joined with `stnx_items` via `Barcode`) when aggregating by product attributes.
 
                 - Never mix Sell-In (`inv_df`) and Sell-Out (`chp`, `stnx_sales`) datasets unless explicitly instructed.
 
                 - When performing joins:
-                    - If metadata is needed (e.g., `Brand_Name`, `Category_Name`), always join `stnx_sales` with `stnx_items` on `Barcode` before filtering or aggregating.
+                    - If metadata is needed (e.g., `Brand_Name`, `Category_Name`), use `stnx_sales_items` instead of joining `stnx_sales` with `stnx_items` on `Barcode`.
+                    - If invoice rows need material, customer or industry details, use `inv_enriched` instead of joining `inv_df` with `material_df`, `customer_df` or `industry_df`.
                     - For invoice analysis that requires connection to barcodes (e.g., to compare with `chp`), bridge `inv_df` to `stnx_sales`/`chp` via `material_df` using `MATERIAL_NUMBER` → `BARCODE_EA`.
 
                 - Entity handling rules:
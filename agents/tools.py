@@ -1,22 +1,33 @@
 
-from langchain.tools import Tool
+from langchain.tools import StructuredTool
 from .core import search_entities_in_vdb_core
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 class SearchEntitiesInput(BaseModel):
     names: List[str]
+    entity_types: Optional[List[str]] = Field(default=None, description="Optional: only search these entity types, one of 'Item_Name', 'Brand_Name', 'CHAIN', 'customer', e.g. ['CHAIN'] or ['Brand_Name', 'Item_Name']")
+    source_tables: Optional[List[str]] = Field(default=None, description="Optional: only search entities resolved from these tables, one of 'stnx_items', 'chp', 'customer_df', e.g. ['chp']")
 
 def make_search_entities_tool(embedding_model, combined_entities):
-    return Tool(
+    types, sources = combined_entities.partition_values()
+    return StructuredTool.from_function(
         name="search_entities_in_vdb",
-        func=lambda input: search_entities_in_vdb_core(input, embedding_model, combined_entities),
+        func=lambda names, entity_types=None, source_tables=None: search_entities_in_vdb_core(
+            names, embedding_model, combined_entities, entity_types=entity_types, source_tables=source_tables
+        ),
         args_schema=SearchEntitiesInput,
-        description="""
+        description=f"""
             Accepts a list of entity names in Hebrew only.
             Do NOT pass English or foreign names.
             The system assumes all names have been translated to Hebrew beforehand.
             
+            Optionally restrict the search with `entity_types` (e.g. only chains) or `source_tables`
+            (e.g. only stnx items) when the question makes the entity kind unambiguous.
+            Valid entity_types: {types}
+            Valid source_tables: {sources}
+            Unknown values are ignored.
+
             Returns:
             For each input name, returns up to 5 best matching entities by cosine similarity.
         """
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import random
+import argparse
+import concurrent.futures
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from Dataloader import DataLoader, ShardedRows, entity_row_hash, load_entity_source
+from agents.core import EMBEDDING_MODEL
+
+load_dotenv()
+
+# How each entity source is derived from the dimension parquets.
+# Every spec row turns the unique (name, *metadata) combinations of one column into entities of one type.
+# Types and metadata keys follow the existing meta files, so a first incremental build over them re-embeds nothing.
+ENTITY_SPECS = {
+    "stnx_entities": {
+        "table": "DW_DIM_STORENEXT_BY_INDUSTRIES_ITEMS",
+        "source_table": "stnx_items",
+        "entities": [
+            {"type": "Item_Name", "name": "Item_Name", "metadata": ["Barcode", "Brand_Name", "Category_Name", "Supplier_Name", "Parallel"]},
+            {"type": "Brand_Name", "name": "Brand_Name", "metadata": ["Category_Name"]},
+        ],
+    },
+    "chp_entities": {
+        "table": "AGGR_MONTHLY_DW_CHP",
+        "source_table": "chp",
+        "entities": [
+            {"type": "CHAIN", "name": "CHAIN", "metadata": []},
+        ],
+    },
+    "customer_entities": {
+        "table": "DW_DIM_CUSTOMERS",
+        "source_table": "customer_df",
+        "entities": [
+            {"type": "customer", "name": "CUSTOMER", "metadata": ["CUSTOMER_CODE"]},
+        ],
+    },
+}
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+
+class EntityEmbeddingBuilder:
+    """
+    Incremental build of the `*_entities` meta/embedding files from the dimension parquets.
+
+    Entities are diffed against the current build by content hash. Only names that have no embedding yet
+    are sent to `embedding_client` (any object exposing the OpenAI `embeddings.create(input=[...], model=...)` API),
+    in concurrent batches with exponential backoff on rate limits. The result is appended as a new
+    meta/embedding shard, and `{source}_manifest.json` lists the shards plus the superseded content hashes.
+    """
+
+    def __init__(self, parquet_dir, embedding_client, model=EMBEDDING_MODEL, batch_size=512, max_workers=8, max_retries=8):
+        self.parquet_dir = parquet_dir
+        self.embedding_client = embedding_client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+
+    def extract_entities(self, source: str) -> pd.DataFrame:
+        """Derive the entity rows of `source` from its dimension parquet."""
+        spec = ENTITY_SPECS[source]
+        path = os.path.join(self.parquet_dir, f"{spec['table']}.parquet")
+        available = set(pq.ParquetFile(path).schema.names)
+        wanted = {col for entity in spec["entities"] for col in [entity["name"], *entity["metadata"]] if col in available}
+        table = pd.read_parquet(path, columns=sorted(wanted))
+
+        frames = []
+        for entity in spec["entities"]:
+            meta_cols = [col for col in entity["metadata"] if col in table.columns]
+            rows = table[[entity["name"], *meta_cols]].dropna(subset=[entity["name"]]).drop_duplicates()
+            metadata = rows[meta_cols].astype(object).where(rows[meta_cols].notna(), None).to_dict("records") if meta_cols else [{}] * len(rows)
+            frames.append(pd.DataFrame({
+                "name": rows[entity["name"]].astype(str).str.strip().to_numpy(),
+                "type": entity["type"],
+                "source_table": spec["source_table"],
+                # source_table / column are tagged onto the metadata at load time (prepare_entities), not stored
+                "metadata": metadata,
+            }))
+
+        entities = pd.concat(frames, ignore_index=True)
+        entities["content_hash"] = [entity_row_hash(n, t, m) for n, t, m in zip(entities["name"], entities["type"], entities["metadata"])]
+        return entities.drop_duplicates(subset=["content_hash"]).reset_index(drop=True)
+
+    def embed_batch(self, names):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                response = self.embedding_client.embeddings.create(input=list(names), model=self.model)
+                ordered = sorted(response.data, key=lambda d: d.index)
+                return np.array([d.embedding for d in ordered], dtype=np.float32)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                delay = min(60.0, 2 ** attempt) * (0.5 + random.random())
+                print(f"[WARNING] Rate limited (attempt {attempt}/{self.max_retries}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed_names(self, names):
+        """Embed `names` in concurrent batches; returns {name: vector}."""
+        batches = [names[i:i + self.batch_size] for i in range(0, len(names), self.batch_size)]
+        vectors = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.embed_batch, batch): batch for batch in batches}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                batch = futures[future]
+                vectors.update(zip(batch, future.result()))
+                print(f"[INFO] Embedded batch {done}/{len(batches)} ({len(batch)} names)")
+        return vectors
+
+    def build_source(self, source: str) -> dict:
+        """Diff, embed and append one entity source. Returns a summary of what changed."""
+        t0 = time.time()
+        manifest_path = os.path.join(self.parquet_dir, f"{source}_manifest.json")
+        legacy_meta = os.path.join(self.parquet_dir, f"{source}_meta.parquet")
+
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        elif os.path.exists(legacy_meta):
+            legacy_rows = len(pd.read_parquet(legacy_meta, columns=["name"]))
+            manifest = {"shards": [{"meta": f"{source}_meta.parquet", "embedding": f"{source}_embedding.npy", "rows": legacy_rows}], "superseded": []}
+        else:
+            manifest = {"shards": [], "superseded": []}
+
+        entities = self.extract_entities(source)
+        new_hashes = set(entities["content_hash"])
+
+        existing_hashes = set()
+        row_of_name = {}
+        if manifest["shards"]:
+            current, arrays, rows = load_entity_source(self.parquet_dir, source, manifest=manifest, with_hashes=True)
+            existing_hashes = set(current["content_hash"])
+            row_of_name = dict(zip(current["name"].astype(str), rows))
+
+        added = entities[~entities["content_hash"].isin(existing_hashes)].reset_index(drop=True)
+        superseded = existing_hashes - new_hashes
+        # Entities removed by an earlier build and back now: their rows are still in the shards, so they are
+        # restored by dropping their hash from "superseded" instead of being embedded and appended again
+        old_superseded = set(manifest.get("superseded", []))
+        restored = set(added["content_hash"]) & old_superseded
+        added = added[~added["content_hash"].isin(restored)].reset_index(drop=True)
+
+        # Changed rows whose name is already embedded reuse the stored vector; only unseen names hit the API
+        reusable = sorted(set(added["name"]) & set(row_of_name))
+        existing_vectors = dict(zip(reusable, ShardedRows(arrays).take([row_of_name[n] for n in reusable]))) if reusable else {}
+
+        summary = {"source": source, "entities": len(entities), "added": len(added), "restored": len(restored), "superseded": len(superseded), "embedded": 0}
+        if added.empty and not superseded and not restored:
+            print(f"[INFO] {source}: up to date ({len(entities):,} entities)")
+            return summary
+
+        to_embed = sorted(set(added["name"]) - set(existing_vectors))
+        fresh = self.embed_names(to_embed) if to_embed else {}
+        summary["embedded"] = len(fresh)
+
+        if not added.empty:
+            vectors = np.vstack([fresh[n] if n in fresh else existing_vectors[n] for n in added["name"]])
+            shard_id = len(manifest["shards"])
+            meta_file = f"{source}_meta.{shard_id:05d}.parquet"
+            embedding_file = f"{source}_embedding.{shard_id:05d}.npy"
+            added.to_parquet(os.path.join(self.parquet_dir, meta_file), index=False)
+            np.save(os.path.join(self.parquet_dir, embedding_file), vectors)
+            manifest["shards"].append({"meta": meta_file, "embedding": embedding_file, "rows": len(added), "created": datetime.now().isoformat()})
+
+        manifest["superseded"] = sorted((old_superseded | superseded) - new_hashes)
+        manifest["embedding_model"] = self.model
+        manifest["updated"] = datetime.now().isoformat()
+        self.write_manifest(manifest_path, manifest)
+
+        summary["seconds"] = round(time.time() - t0, 2)
+        print(f"[SUCCESS] {source}: {summary}")
+        return summary
+
+    @staticmethod
+    def write_manifest(path, manifest):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def build(self, sources=None):
+        return [self.build_source(source) for source in (sources or ENTITY_SPECS)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally embed new or changed entities from the dimension parquets.")
+    parser.add_argument("--parquet-dir", default=DataLoader().parquet_dir)
+    parser.add_argument("--sources", nargs="*", choices=sorted(ENTITY_SPECS), default=None)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--rebuild-index", action="store_true", help="Rebuild the IVF index afterwards (quantized / reduced files also need a rebuild)")
+    args = parser.parse_args()
+
+    from openai import AzureOpenAI
+    client = AzureOpenAI(azure_endpoint=os.getenv("AZURE_ENDPOINT"), api_key=os.getenv("OPENAI_API_KEY"), api_version="2024-08-01-preview")
+
+    builder = EntityEmbeddingBuilder(args.parquet_dir, client, batch_size=args.batch_size, max_workers=args.max_workers)
+    summaries = builder.build(args.sources)
+
+    if args.rebuild_index and any(s["added"] or s["restored"] or s["superseded"] for s in summaries):
+        from build_vector_index import build_vector_index
+        build_vector_index(args.parquet_dir)
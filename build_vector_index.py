@@ -0,0 +1,92 @@
+import os
+import json
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from Dataloader import DataLoader, load_entity_index
+from VectorIndex import (
+    IVFIndex, ReducedProjection, IVF_INDEX_FILE, QUANTIZED_MANIFEST_FILE, QUANTIZED_MATRIX_FILES, QUANTIZED_SCALE_FILE,
+    REDUCED_MATRIX_FILE, REDUCED_PROJECTION_FILE, quantize_int8,
+)
+
+
+def write_quantized_matrix(index, parquet_dir, kind):
+    """Write the normalized entity matrix as float16, or as int8 codes plus per-row float32 scales."""
+    if kind == "int8":
+        codes, scales = quantize_int8(index.matrix)
+        np.save(os.path.join(parquet_dir, QUANTIZED_MATRIX_FILES["int8"]), codes)
+        np.save(os.path.join(parquet_dir, QUANTIZED_SCALE_FILE), scales)
+        size = codes.nbytes + scales.nbytes
+    else:
+        matrix = index.matrix.astype(np.float16)
+        np.save(os.path.join(parquet_dir, QUANTIZED_MATRIX_FILES["float16"]), matrix)
+        size = matrix.nbytes
+
+    # Record which entities the matrix encodes, so a later load can tell it is stale
+    manifest_path = os.path.join(parquet_dir, QUANTIZED_MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    manifest[kind] = {"content_hash": index.content_hash, "rows": len(index), "created": datetime.now().isoformat()}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"[SUCCESS] {kind} matrix saved ({size / 2**20:,.1f} MB vs {index.matrix.nbytes / 2**20:,.1f} MB float32)")
+
+
+def write_reduced_matrix(index, parquet_dir, dim, method):
+    """Write the reduced-dimension (prefix or PCA) first-pass matrix and its projection parameters."""
+    projection = ReducedProjection.fit(index.matrix, dim, kind=method)
+    projection.content_hash = index.content_hash
+    reduced = projection.project(index.matrix)
+    np.save(os.path.join(parquet_dir, REDUCED_MATRIX_FILE), reduced)
+    projection.save(os.path.join(parquet_dir, REDUCED_PROJECTION_FILE))
+    print(f"[SUCCESS] {method} reduced matrix saved ({dim} of {index.dim} dims, {reduced.nbytes / 2**20:,.1f} MB)")
+
+
+def build_vector_index(parquet_dir, nlist=None, nprobe=8, n_eval=500, seed=0, quantize=None, reduce_dim=None, reduce_method="prefix"):
+    """Train the IVF index for the entity vectors in `parquet_dir`, save it next to them and report recall@5."""
+    index = load_entity_index(parquet_dir, storage="float32")
+    print(f"[INFO] Loaded {len(index):,} entities ({index.dim} dims)")
+
+    if quantize:
+        write_quantized_matrix(index, parquet_dir, quantize)
+    if reduce_dim:
+        write_reduced_matrix(index, parquet_dir, reduce_dim, reduce_method)
+
+    ivf = IVFIndex.build(index.matrix, nlist=nlist, seed=seed)
+    ivf.nprobe = nprobe
+    ivf.content_hash = index.content_hash
+    output_path = os.path.join(parquet_dir, IVF_INDEX_FILE)
+    ivf.save(output_path)
+    print(f"[SUCCESS] IVF index saved to {output_path} ({ivf.nlist} lists)")
+
+    # Evaluate against brute force with perturbed entity vectors as stand-in queries
+    index.ivf = ivf
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index), size=min(n_eval, len(index)), replace=False)
+    queries = index.matrix[rows] + rng.normal(scale=0.01, size=(len(rows), index.dim)).astype(np.float32)
+    report = index.recall_at_k(queries, top_k=5)
+    print(
+        f"[EVAL] recall@5={report['recall']:.3f} | exact {report['exact_ms_per_query']:.2f} ms/query"
+        f" | ivf {report['ann_ms_per_query']:.2f} ms/query (nprobe={nprobe})"
+    )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the IVF ANN index for the entity vector database.")
+    parser.add_argument("--parquet-dir", default=DataLoader().parquet_dir)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--n-eval", type=int, default=500)
+    parser.add_argument("--quantize", choices=sorted(QUANTIZED_MATRIX_FILES), default=None)
+    parser.add_argument("--reduce-dim", type=int, default=None, help="Also write a reduced first-pass matrix with this many dims (e.g. 256)")
+    parser.add_argument("--reduce-method", choices=["prefix", "pca"], default="prefix")
+    args = parser.parse_args()
+    build_vector_index(
+        args.parquet_dir, nlist=args.nlist, nprobe=args.nprobe, n_eval=args.n_eval,
+        quantize=args.quantize, reduce_dim=args.reduce_dim, reduce_method=args.reduce_method,
+    )
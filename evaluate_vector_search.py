@@ -0,0 +1,113 @@
+import os
+import re
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from Dataloader import DataLoader, attach_offline_indexes, load_entity_index
+from agents.cache import get_embedding_cache
+from agents.core import EMBEDDING_MODEL
+
+load_dotenv()
+
+
+def load_names_from_file(path):
+    """One name per line (txt), or a `name` column (csv / parquet)."""
+    if path.endswith(".csv"):
+        return pd.read_csv(path)["name"].dropna().astype(str).tolist()
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)["name"].dropna().astype(str).tolist()
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def load_names_from_logs(limit):
+    """Collect the names the ExtractorAgent extracted in past questions, from the `logs` SQL table."""
+    from MainFunctions import get_sql_engine
+
+    query = f"SELECT TOP {int(limit)} answer FROM logs WHERE agent = 'ExtractorAgent' AND answer IS NOT NULL ORDER BY timestamp DESC"
+    answers = pd.read_sql(query, con=get_sql_engine())["answer"]
+
+    names = []
+    for answer in answers:
+        match = re.search(r"\{.*\}", str(answer), re.DOTALL)
+        if not match:
+            continue
+        try:
+            names.extend(json.loads(match.group(0)).get("ExtractedNames", []))
+        except json.JSONDecodeError:
+            continue
+    return names
+
+
+def embed_names(names, batch_size=256):
+    """Embed names through the shared embedding cache, sending only misses to the API in large batches."""
+    from openai import AzureOpenAI
+
+    cache = get_embedding_cache()
+    cached = cache.get_many(names, EMBEDDING_MODEL)
+    missing = list(dict.fromkeys(name for name in names if name not in cached))
+
+    if missing:
+        client = AzureOpenAI(azure_endpoint=os.getenv("AZURE_ENDPOINT"), api_key=os.getenv("OPENAI_API_KEY"), api_version="2024-08-01-preview")
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            response = client.embeddings.create(input=batch, model=EMBEDDING_MODEL)
+            fresh = {name: np.array(d.embedding, dtype=np.float32) for name, d in zip(batch, sorted(response.data, key=lambda d: d.index))}
+            cache.put_many(fresh, EMBEDDING_MODEL)
+            cached.update(fresh)
+
+    return np.vstack([cached[name] for name in names])
+
+
+def evaluate_vector_search(parquet_dir, names, mode=None, top_k=5):
+    """
+    Report top-k agreement and latency of a first pass against exact full-dimension search. The indexes are
+    attached as in production, and `mode` ("reduced" / "ivf") overrides VECTOR_FIRST_PASS; by default the
+    configured first pass is measured.
+    """
+    index = attach_offline_indexes(load_entity_index(parquet_dir), parquet_dir)
+    if mode is not None:
+        index.first_pass_mode = mode
+    first_pass = index.first_pass()
+    if first_pass == "exact" or (mode is not None and first_pass != mode):
+        raise FileNotFoundError(f"No {mode or 'reduced / ivf'} index found in {parquet_dir}; run build_vector_index.py first.")
+
+    queries = embed_names(names)
+    report = index.recall_at_k(queries, top_k=top_k)
+
+    exact_idx, _ = index.search_many(queries, top_k=1, exact=True)
+    approx_idx, _ = index.search_many(queries, top_k=1, exact=False)
+    report["top1_agreement"] = float(np.mean(exact_idx[:, 0] == approx_idx[:, 0]))
+    report["n_queries"] = len(names)
+    report["first_pass"] = first_pass
+
+    if first_pass == "reduced":
+        projection, reduced_matrix = index.reduced
+        report["first_pass_dims"] = f"{projection.dim}/{index.dim}"
+        report["first_pass_mb"] = reduced_matrix.nbytes / 2**20
+        report["full_matrix_mb"] = index.matrix.nbytes / 2**20
+
+    for key, value in report.items():
+        print(f"[EVAL] {key:<20} {value:.4f}" if isinstance(value, float) else f"[EVAL] {key:<20} {value}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the reduced / IVF first pass with exact entity search on historical query names.")
+    parser.add_argument("--parquet-dir", default=DataLoader().parquet_dir)
+    parser.add_argument("--names-file", default=None, help="txt (one name per line), csv or parquet with a `name` column")
+    parser.add_argument("--from-logs", type=int, default=None, help="Sample the N most recent ExtractorAgent log rows instead")
+    parser.add_argument("--sample", type=int, default=500)
+    parser.add_argument("--mode", choices=["reduced", "ivf"], default=None, help="First pass to measure (default: the configured VECTOR_FIRST_PASS)")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    names = load_names_from_file(args.names_file) if args.names_file else load_names_from_logs(args.from_logs or 1000)
+    names = list(dict.fromkeys(names))
+    if len(names) > args.sample:
+        names = list(np.random.default_rng(0).choice(names, size=args.sample, replace=False))
+
+    evaluate_vector_search(args.parquet_dir, names, mode=args.mode, top_k=args.top_k)
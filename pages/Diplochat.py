@@ -33,7 +33,7 @@ if 'page' not in st.session_state:
     st.session_state['page'] = None
 
 if "Logs" not in st.session_state:
-    st.session_state["Logs"] = pd.DataFrame(columns=["user","timestamp","agent","attempts","calls","error","num_exec","exec_error","retry","duration","question","answer","rating"])
+    st.session_state["Logs"] = pd.DataFrame(columns=["user","timestamp","agent","attempts","calls","error","num_exec","exec_error","retry","duration","question","answer","rating","cache_hit","exec_saved_seconds","cache_hit_rate"])
 
 if 'Last_log' not in st.session_state:
     st.session_state['Last_log'] = {}
@@ -114,6 +114,8 @@ if st.session_state['page'] == "Home Page":
         if not st.session_state["Logs"].empty:
             write_logs_to_sql(st.session_state["Logs"])
             
+        create_aggregation_option()
+
         if prompt := st.chat_input("How can i assist you?"):
 
             conversation_history.add_user_message(prompt)
@@ -126,6 +128,18 @@ if st.session_state['page'] == "Home Page":
                 st_lottie(thinking_animation, height=150, key="loading")
 
 
+            # New questions pick up a refreshed data version (or a new shared data plane generation); a running question keeps the one it started with
+            refresher = start_data_refresher(st.session_state['Dataloader'].parquet_dir)
+            data_version = refresher.current if refresher else None
+            if data_version is not None and st.session_state.get('DataVersion') != data_version.id:
+                st.session_state['Dataframes'] = data_version.dataframes
+                st.session_state['Agents']['ExtractorAgent'] = ExtractorAgent(vector_database = data_version.vector_database)
+                st.session_state['DataVersion'] = data_version.id
+            elif data_version is None and data_plane_changed(st.session_state['Dataframes'], st.session_state['Dataloader'].parquet_dir):
+                dataframes, vector_database = reopen_data_plane(st.session_state['Dataloader'].parquet_dir)
+                st.session_state['Dataframes'] = dataframes
+                st.session_state['Agents']['ExtractorAgent'] = ExtractorAgent(vector_database = vector_database)
+
             extracor_agent = st.session_state['Agents']['ExtractorAgent']
             planner_agent =  st.session_state['Agents']['PlannerAgent']
             generator_agent = st.session_state['Agents']['GeneratorAgent']
@@ -133,9 +147,9 @@ if st.session_state['page'] == "Home Page":
 
             entities = extracor_agent.response(prompt)
             plan = planner_agent.response(prompt, json.dumps(entities, ensure_ascii=False))
-            answer = generator_agent.response(plan , prompt)
-
             local_scope = get_local_scope()
+            aggregation = st.session_state['last_scope_mode']
+            answer = generator_agent.response(plan , prompt, aggregation = aggregation)
 
             max_retries = 15
             retries = 0
@@ -143,8 +157,9 @@ if st.session_state['page'] == "Home Page":
 
             while not success and retries < max_retries:
                 try:
-                    exec(answer.python_code, {}, local_scope)
-                    agent_result = local_scope.get("result", "⚠️ לא נמצאה תשובה.")
+                    agent_result = run_generated_code(answer.python_code, local_scope)
+                    exec_stats = st.session_state['LastExecStats']
+                    generator_agent.set_exec_cache(exec_stats['cache_hit'], exec_stats['exec_saved_seconds'], exec_stats['cache_hit_rate'])
                     if is_admin:
                         st.code(entities)
                         st.code(plan)
@@ -179,7 +194,7 @@ if st.session_state['page'] == "Home Page":
                     generator_agent.set_exec_error(e)
                     generator_agent.set_log("GeneratorAgent", st.session_state["user"]["mail"] , was_retry = True)
 
-                    answer = generator_agent.retry_with_error(user_question = prompt, previous_code = answer.python_code, error_message = error_message)
+                    answer = generator_agent.retry_with_error(user_question = prompt, previous_code = answer.python_code, error_message = error_message, aggregation = aggregation)
 
             if success:
                 generator_agent.set_log("GeneratorAgent", st.session_state["user"]["mail"])
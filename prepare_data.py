@@ -0,0 +1,57 @@
+import os
+import json
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from Dataloader import DataLoader, JOINED_VIEW_TABLES, SNAPSHOT_ENTITY_TABLE, build_table_registry, prepare_entities
+from PreparedSnapshot import SNAPSHOT_FILE, SNAPSHOT_MATRIX_FILE, input_fingerprint, snapshot_inputs, write_bundle
+from VectorIndex import normalize_rows
+
+
+def prepare_data(parquet_dir, include_entities=True, output_dir=None, extra_manifest=None):
+    """
+    Run every load-time preparation step once and write the result as a prepared snapshot:
+    the tables (dtype plan, date coercion, primary-key dedup, Hebrew calendar) into one Arrow IPC bundle,
+    and the cleaned, brand-collapsed entity table plus its normalized embedding matrix.
+    The snapshot is written to `output_dir` (default: `parquet_dir`).
+    """
+    output_dir = output_dir or parquet_dir
+    t0 = time.time()
+    inputs = snapshot_inputs(parquet_dir)
+    fingerprint = input_fingerprint(parquet_dir, inputs)
+
+    registry = build_table_registry(parquet_dir, fetch=False)
+    # Joined views are not bundled: they are cheap to rebuild and would duplicate their fact table on disk
+    names = [name for name in registry if name not in JOINED_VIEW_TABLES]
+    registry.prefetch(names)
+    tables = {name: registry[name] for name in names if registry[name] is not None}
+
+    if include_entities:
+        entities, full_rows, source_rows = prepare_entities(parquet_dir)
+        matrix = normalize_rows(full_rows.take(source_rows))
+        tmp_path = os.path.join(output_dir, f"{SNAPSHOT_MATRIX_FILE}.tmp.npy")
+        np.save(tmp_path, matrix)
+        os.replace(tmp_path, os.path.join(output_dir, SNAPSHOT_MATRIX_FILE))
+
+        entities = entities[[col for col in ("name", "type", "source_table", "metadata") if col in entities]].copy()
+        entities["metadata"] = [json.dumps(meta, ensure_ascii=False, default=str) for meta in entities["metadata"]]
+        tables[SNAPSHOT_ENTITY_TABLE] = entities
+        print(f"[INFO] Prepared {len(entities):,} entities ({matrix.nbytes / 2**20:,.1f} MB matrix)")
+
+    manifest = {"fingerprint": fingerprint, "inputs": inputs, "created": datetime.now().isoformat(), **(extra_manifest or {})}
+    path = os.path.join(output_dir, SNAPSHOT_FILE)
+    write_bundle(path, tables, manifest)
+    print(f"[SUCCESS] Prepared snapshot {fingerprint[:12]} written to {path} "
+          f"({os.path.getsize(path) / 2**20:,.1f} MB, {len(tables)} tables) in {time.time() - t0:.1f}s")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the prepared data snapshot that the app memory-maps at startup.")
+    parser.add_argument("--parquet-dir", default=DataLoader().parquet_dir)
+    parser.add_argument("--skip-entities", action="store_true", help="Only bundle the tables")
+    args = parser.parse_args()
+    prepare_data(args.parquet_dir, include_entities=not args.skip_entities)
@@ -1,63 +1,153 @@
 import os
+import json
+import time
+import hashlib
 import tempfile
 import concurrent.futures
+from azure.core.exceptions import ResourceNotFoundError
 from azure.storage.blob import BlobServiceClient
+from DataCatalog import CATALOG_FILE, DATA_AGGREGATIONS, DataCatalog, load_catalog, validate_data_dir
 
 BLOB_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 CONTAINER_NAME = "data"
 
-BLOB_FILE_NAMES = [
-    "AGGR_MONTHLY_DW_CHP.parquet",
-    "AGGR_MONTHLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES.parquet",
-    "AGGR_MONTHLY_DW_INVOICES.parquet",
-    "AGGR_WEEKLY_DW_CHP.parquet",
-    "AGGR_WEEKLY_DW_FACT_STORENEXT_BY_INDUSTRIES_SALES.parquet",
-    "AGGR_WEEKLY_DW_INVOICES.parquet",
-    "DW_DIM_STORENEXT_BY_INDUSTRIES_ITEMS.parquet",
-    "DW_DIM_CUSTOMERS.parquet",
-    "DW_DIM_INDUSTRIES.parquet",
-    "DW_DIM_MATERIAL.parquet",
-    
-    # הקבצים המפוצלים:
-    "stnx_entities_meta.parquet",
-    "stnx_entities_embedding.npy",
-    "chp_entities_meta.parquet",
-    "chp_entities_embedding.npy",
-    "customer_entities_meta.parquet",
-    "customer_entities_embedding.npy"
-]
+# Files to download come from the data catalog (catalog.json in the container, or the built-in one)
+BLOB_FILE_NAMES = DataCatalog.default().files()
 
 blob_service_client = BlobServiceClient.from_connection_string(BLOB_CONNECTION_STRING)
 container_client = blob_service_client.get_container_client(CONTAINER_NAME)
 TEMP_DIR = tempfile.gettempdir()
 
-def download_blob(blob_name):
+CHUNK_SIZE = 8 * 1024 * 1024
+# Blobs above this size are fetched with several ranged requests in parallel
+PARALLEL_THRESHOLD = 64 * 1024 * 1024
+MAX_CONCURRENCY = int(os.getenv("BLOB_DOWNLOAD_CONCURRENCY", "4"))
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+def read_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def download_to_path(blob_client, download_path, properties=None):
+    """
+    Stream a blob to `download_path` without holding it in memory.
+
+    The data goes to `{path}.part` in ranged chunks (in parallel for large blobs), is checked against the
+    blob's size and Content-MD5 (when the blob has one) and is renamed into place atomically.
+    A `.part` left by an interrupted run is resumed when the blob's ETag has not changed; the ETag of the
+    finished file is recorded in `{path}.etag.json` for download_blob's content check.
+    Returns the number of bytes transferred.
+    """
+    properties = properties or blob_client.get_blob_properties()
+    part_path = f"{download_path}.part"
+    state_path = f"{download_path}.part.json"
+
+    offset = 0
+    if os.path.exists(part_path) and read_state(state_path).get("etag") == properties.etag:
+        offset = os.path.getsize(part_path)
+        if offset > properties.size:
+            offset = 0
+    if offset == 0:
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({"etag": properties.etag}, f)
+
+    remaining = properties.size - offset
+    with open(part_path, "r+b" if offset else "wb") as f:
+        f.seek(offset)
+        if remaining > 0:
+            concurrency = MAX_CONCURRENCY if remaining > PARALLEL_THRESHOLD else 1
+            downloader = blob_client.download_blob(offset=offset, length=remaining, max_concurrency=concurrency)
+            downloader.readinto(f)
+        f.truncate()
+
+    size = os.path.getsize(part_path)
+    if size != properties.size:
+        raise IOError(f"size mismatch ({size} bytes, blob has {properties.size}); the partial file is kept for resume")
+    expected_md5 = properties.content_settings.content_md5 if properties.content_settings else None
+    if expected_md5 and file_md5(part_path) != bytes(expected_md5):
+        os.remove(part_path)
+        raise IOError("MD5 mismatch, the partial file was discarded")
+
+    os.replace(part_path, download_path)
+    os.remove(state_path)
+    with open(f"{download_path}.etag.json", "w", encoding="utf-8") as f:
+        json.dump({"etag": properties.etag}, f)
+    return remaining
+
+def matches_blob(download_path, properties):
+    """
+    True when the local file holds the blob's content: its Content-MD5 when the blob has one, otherwise
+    the ETag recorded when the file was downloaded (see download_to_path).
+    """
+    if not os.path.exists(download_path) or os.path.getsize(download_path) != properties.size:
+        return False
+    expected_md5 = properties.content_settings.content_md5 if properties.content_settings else None
+    if expected_md5:
+        return file_md5(download_path) == bytes(expected_md5)
+    return read_state(f"{download_path}.etag.json").get("etag") == properties.etag
+
+def download_blob(blob_name, verify_content=False, optional=False):
+    """
+    Download `blob_name` into TEMP_DIR unless it is already there. A local file of the blob's size is trusted,
+    or with `verify_content` only when it matches the blob's MD5 / ETag. A missing `optional` blob is reported
+    as info and any stale local copy is removed. Returns the local path, or None on failure.
+    """
     download_path = os.path.join(TEMP_DIR, blob_name)
-    if os.path.exists(download_path) and os.path.getsize(download_path) > 0:
-        print(f"[INFO] כבר קיים מקומית: {blob_name}")
-        return download_path
     try:
-        print(f"[INFO] מוריד {blob_name}...")
         blob_client = container_client.get_blob_client(blob_name)
-        with open(download_path, "wb") as f:
-            f.write(blob_client.download_blob().readall())
+        properties = blob_client.get_blob_properties()
+        local_ok = matches_blob(download_path, properties) if verify_content else (
+            os.path.exists(download_path) and os.path.getsize(download_path) == properties.size
+        )
+        if local_ok:
+            print(f"[INFO] כבר קיים מקומית: {blob_name}")
+            return download_path
+
+        print(f"[INFO] מוריד {blob_name}...")
+        t0 = time.time()
+        transferred = download_to_path(blob_client, download_path, properties)
+        seconds = max(time.time() - t0, 1e-6)
         size_kb = os.path.getsize(download_path) / 1024
-        print(f"[SUCCESS] {blob_name} נשמר ({size_kb:.1f} KB)")
+        print(f"[SUCCESS] {blob_name} נשמר ({size_kb:.1f} KB, {transferred / 2**20 / seconds:.1f} MB/s"
+              f"{', resumed' if transferred < properties.size else ''})")
         return download_path
+    except ResourceNotFoundError as e:
+        if optional:
+            print(f"[INFO] {blob_name} is not in the container, skipping")
+            if os.path.exists(download_path):
+                os.remove(download_path)
+            return None
+        print(f"[ERROR] כשל בהורדה של {blob_name}: {e}")
+        return None
     except Exception as e:
         print(f"[ERROR] כשל בהורדה של {blob_name}: {e}")
         return None
 
 def preload_all_blobs():
     print("[START] מתחיל להוריד את קבצי ה־Parquet הדרושים...")
+    # The catalog is fetched first and re-checked by content (MD5 / ETag) on every start, so the file list
+    # matches the data being served; without one in the container the built-in catalog is used
+    download_blob(CATALOG_FILE, verify_content=True, optional=True)
+    catalog = load_catalog(TEMP_DIR)
+    file_names = catalog.files(DATA_AGGREGATIONS)
     with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
-        results = list(executor.map(download_blob, BLOB_FILE_NAMES))
+        results = list(executor.map(download_blob, file_names))
     
-    failed = [f for f, path in zip(BLOB_FILE_NAMES, results) if path is None or not os.path.exists(path) or os.path.getsize(path) == 0]
+    failed = [f for f, path in zip(file_names, results) if path is None or not os.path.exists(path) or os.path.getsize(path) == 0]
     if failed:
         print(f"❌ הקבצים הבאים לא ירדו כראוי: {failed}")
     else:
         print("[DONE] ✅ כל הקבצים ירדו בהצלחה.")
+    validate_data_dir(TEMP_DIR, catalog)
     return results
 
 if __name__ == "__main__":
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+
+from build_embeddings import EntityEmbeddingBuilder
+from Dataloader import load_entity_source
+
+
+class StubEmbeddings:
+    """Local stand-in for the OpenAI embeddings API: one deterministic vector per name, and a call log."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def create(self, input, model):
+        self.embedded.extend(input)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=np.full(4, len(name), dtype=np.float32)) for i, name in enumerate(input)
+        ])
+
+
+def write_items(parquet_dir, names):
+    pd.DataFrame({
+        "Item_Name": names,
+        "Barcode": [f"72900{i}" for i in range(len(names))],
+        "Brand_Name": "brand",
+        "Category_Name": "category",
+        "Supplier_Name": "supplier",
+        "Parallel": "0",
+    }).to_parquet(parquet_dir / "DW_DIM_STORENEXT_BY_INDUSTRIES_ITEMS.parquet")
+
+
+def test_removed_entity_comes_back_after_re_add(tmp_path):
+    embeddings = StubEmbeddings()
+    builder = EntityEmbeddingBuilder(str(tmp_path), SimpleNamespace(embeddings=embeddings), max_workers=1)
+
+    write_items(tmp_path, ["alpha", "beta"])
+    builder.build_source("stnx_entities")
+    write_items(tmp_path, ["alpha"])
+    assert builder.build_source("stnx_entities")["superseded"] == 1
+    write_items(tmp_path, ["alpha", "beta"])
+    summary = builder.build_source("stnx_entities")
+
+    meta, _, _ = load_entity_source(str(tmp_path), "stnx_entities", with_hashes=True)
+    items = meta[meta["type"] == "Item_Name"]
+    assert sorted(items["name"]) == ["alpha", "beta"]
+    assert not meta["content_hash"].duplicated().any()
+    assert summary["restored"] == 1 and summary["embedded"] == 0
+    assert sorted(embeddings.embedded) == ["alpha", "beta", "brand"]
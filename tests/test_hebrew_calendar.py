@@ -0,0 +1,18 @@
+import pandas as pd
+
+from HebrewCalendar import add_holiday_features
+
+
+def calendar_of(holidays):
+    return add_holiday_features(pd.DataFrame({
+        "DATE": pd.date_range("2024-03-21", periods=len(holidays)),
+        "HOLIDAY": holidays,
+    }))
+
+
+def test_holiday_followed_by_another_festival_is_not_an_eve():
+    calendar = calendar_of([None, "פורים", "שושן פורים", None])
+
+    assert calendar["IS_HOLIDAY_EVE"].tolist() == [True, False, False, False]
+    assert calendar["IS_HOLIDAY"].tolist() == [False, True, True, False]
+    assert calendar["DAYS_TO_HOLIDAY"].tolist()[:3] == [1, 0, 0]
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+
+from build_vector_index import write_quantized_matrix, write_reduced_matrix
+from Dataloader import ENTITY_SOURCES, attach_offline_indexes, load_entity_index
+from VectorIndex import IVF_INDEX_FILE, IVFIndex
+
+
+def write_entities(parquet_dir, names, vectors):
+    """Write `names` / `vectors` as the stnx entity source, and one row to each other source."""
+    for source in ENTITY_SOURCES:
+        if source == "stnx_entities":
+            source_names, source_vectors = names, vectors
+        else:
+            source_names, source_vectors = [source], np.ones((1, vectors.shape[1]), dtype=np.float32)
+        pd.DataFrame({
+            "name": source_names,
+            "type": "Item_Name",
+            "metadata": [{"Barcode": str(i)} for i in range(len(source_names))],
+        }).to_parquet(parquet_dir / f"{source}_meta.parquet")
+        np.save(parquet_dir / f"{source}_embedding.npy", np.asarray(source_vectors, dtype=np.float32))
+
+
+def build_and_edit_middle_row(parquet_dir, n_rows=400, dim=8):
+    """Write the entities, return their float32 index, then replace the name and vector of a middle row."""
+    rng = np.random.default_rng(0)
+    names = [f"item {i}" for i in range(n_rows)]
+    vectors = rng.random((n_rows, dim)).astype(np.float32)
+    write_entities(parquet_dir, names, vectors)
+    index = load_entity_index(str(parquet_dir), storage="float32", snapshot=(None, None))
+
+    names[n_rows // 2] = "replaced item"
+    vectors[n_rows // 2] = rng.random(dim)
+    write_entities(parquet_dir, names, vectors)
+    return index
+
+
+def test_quantized_matrix_is_rejected_after_middle_row_edit(tmp_path):
+    index = build_and_edit_middle_row(tmp_path)
+    write_quantized_matrix(index, str(tmp_path), "int8")
+
+    reloaded = load_entity_index(str(tmp_path), storage="auto", snapshot=(None, None))
+
+    assert len(reloaded) == len(index)
+    assert reloaded.content_hash != index.content_hash
+    assert not reloaded.quantized
+
+
+def test_ivf_and_reduced_indexes_are_rejected_after_middle_row_edit(tmp_path):
+    index = build_and_edit_middle_row(tmp_path)
+    ivf = IVFIndex.build(index.matrix, nlist=4)
+    ivf.content_hash = index.content_hash
+    ivf.save(str(tmp_path / IVF_INDEX_FILE))
+    write_reduced_matrix(index, str(tmp_path), 4, "pca")
+
+    assert attach_offline_indexes(index, str(tmp_path)).first_pass() == "reduced"
+
+    reloaded = attach_offline_indexes(load_entity_index(str(tmp_path), storage="float32", snapshot=(None, None)), str(tmp_path))
+
+    assert reloaded.ivf is None
+    assert reloaded.reduced is None
+    assert reloaded.first_pass() == "exact"